@@ -8,7 +8,7 @@ from wzdat.make_config import make_config, invalidate_config
 from wzdat.util import ChangeDir, get_var_dir, get_tmp_dir, get_hdf_dir,\
     get_cache_dir, get_conv_dir, get_client_sdatetime, parse_sdatetime,\
     convert_server_time_to_client, cache_files, find_files_and_save,\
-    get_run_info, get_notebook_dir
+    get_run_info, get_notebook_dir, load_files_cache
 from wzdat import rundb
 from wzdat.manifest import Manifest
 
@@ -118,6 +118,89 @@ def test_common_cache(fxlogs, fxdb):
     assert len(os.listdir(d)) > 0
 
 
+def test_common_scan(fxlogs):
+    from wzdat.scan import scan_files, load_listings
+    log, exlog = fxlogs[0], fxlogs[1]
+    cfg = make_config()
+    data_dir = cfg['data_dir']
+    found = scan_files(data_dir, {'log': log.file_filter,
+                                  'exlog': exlog.file_filter}, 4)
+    for ftype, ffilter in (('log', log.file_filter),
+                           ('exlog', exlog.file_filter)):
+        root_list, filecnt = found[ftype]
+        wcnt = 0
+        for root, dirs, filenames in os.walk(data_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('_')]
+            rfiles = sorted(ffilter(root, filenames))
+            wcnt += len(rfiles)
+            assert [os.path.abspath(root), rfiles] in root_list
+        assert filecnt == wcnt > 0
+
+    # changed directory is listed again
+    listings = load_listings()
+    adir = os.path.abspath(os.path.join(data_dir, 'kr/node-1/log'))
+    assert adir in listings
+    newfile = os.path.join(adir, 'game_2014-03-07.log')
+    open(newfile, 'w').close()
+    try:
+        os.utime(adir, (0, 0))
+        root_list, filecnt = scan_files(data_dir, {'log': log.file_filter},
+                                        1)['log']
+        assert filecnt == found['log'][1] + 1
+    finally:
+        os.remove(newfile)
+
+
+def test_common_catalog(fxlogs, fxdb, monkeypatch):
+    from wzdat.catalog import apply_file_events, load_adapter, _adapters
+    from wzdat.event import FILE_MOVE_TO, FILE_DELETE
+    cfg = make_config()
+    cache_files()
+    _, filecnt = load_files_cache('log')
+    assert filecnt == 450
+
+    newfile = os.path.join(cfg['data_dir'], 'kr/node-1/log',
+                           'game_2014-03-06.log')
+    with open(newfile, 'w') as f:
+        f.write('2014-03-06 00:00 [INFO] - Move\n')
+    try:
+        apply_file_events([(FILE_MOVE_TO, newfile)])
+        root_list, filecnt = load_files_cache('log')
+        assert filecnt == 451
+        _root = [r for r in root_list if r[0] == os.path.dirname(newfile)][0]
+        assert 'game_2014-03-06.log' in _root[1]
+        assert load_files_cache('dump')[1] == 27
+        finfo = dict((fi[0], fi[1:]) for fi in rundb.get_finder_info())
+        assert 'D2014_03_06' in finfo['log'][0]
+    finally:
+        os.remove(newfile)
+
+    apply_file_events([(FILE_DELETE, newfile)])
+    _, filecnt = load_files_cache('log')
+    assert filecnt == 450
+
+    # adapter is loaded again only when modified
+    import imp
+    loads = []
+    load_source = imp.load_source
+    monkeypatch.setattr(imp, 'load_source',
+                        lambda *args: loads.append(args) or
+                        load_source(*args))
+    mod = load_adapter('log')
+    del loads[:]
+    assert load_adapter('log') is mod
+    assert len(loads) == 0
+    mpath = _adapters['log'][0][0]
+    mtime = os.path.getmtime(mpath)
+    os.utime(mpath, (mtime, mtime + 1))
+    try:
+        load_adapter('log')
+        load_adapter('log')
+        assert len(loads) == 1
+    finally:
+        os.utime(mpath, (mtime, mtime))
+
+
 def test_common_rundb():
     assert rundb.iter_run_info() is not None
 
@@ -142,3 +225,94 @@ def test_common_manifest():
     manifest = Manifest(True, path)
     df = manifest.depends.hdf.select('index>1')
     assert len(df) == 1
+
+
+def test_common_line_count(fxlogs):
+    from wzdat import util
+    log = fxlogs[0]
+    files = log.files[log.kind.auth][:30]
+    paths = [_file.abspath for _file in files]
+    expected = []
+    for path in paths:
+        with open(path) as f:
+            expected.append(len(f.readlines()))
+    assert util.get_line_counts(paths, 4) == expected
+    assert util.get_line_count(paths[0]) == expected[0]
+    assert os.path.isfile(util._get_line_counts_path())
+
+    # memoized counts are used, and counted again when file changes
+    util._line_counts = None
+    assert util.get_line_counts(paths[:2]) == expected[:2]
+    path = os.path.join(get_tmp_dir(), 'line_count_test.txt')
+    with open(path, 'w') as f:
+        f.write('1\n2\n')
+    try:
+        assert util.get_line_count(path) == 2
+        with open(path, 'a') as f:
+            f.write('3\n4\n5')
+        assert util.get_line_count(path) == 4
+    finally:
+        os.remove(path)
+
+    # single count is saved later in batch, temp file is not memoized
+    util._line_counts = None
+    mtime = os.path.getmtime(util._get_line_counts_path())
+    os.utime(paths[2], None)
+    assert util.get_line_count(paths[2]) == expected[2]
+    assert os.path.getmtime(util._get_line_counts_path()) == mtime
+    assert paths[2] in util._line_counts_dirty
+    assert util.get_line_counts(paths[:1]) == expected[:1]
+    assert len(util._line_counts_dirty) == 0
+    assert util._read_line_counts()[paths[2]][2] == expected[2]
+    tfile = log.files[0][:3]
+    assert tfile.lcount == 3
+    assert tfile.abspath not in util._get_line_counts()
+
+    # counts of removed files are kept until pruned by rescan
+    gone = os.path.join(get_tmp_dir(), 'line_count_gone.txt')
+    util._line_counts_dirty[gone] = (1, 1, 1)
+    util.save_line_counts()
+    assert gone in util._read_line_counts()
+    util.prune_line_counts()
+    assert gone not in util._read_line_counts()
+    assert paths[0] in util._read_line_counts()
+
+
+def test_common_convert():
+    import shutil
+    from wzdat.convert import convert_files, load_stamps
+    from wzdat.util import get_convfile_path
+    cfg = make_config()
+    sdir = os.path.join(cfg['data_dir'], '_convtest')
+    if not os.path.isdir(sdir):
+        os.makedirs(sdir)
+    paths = [os.path.join(sdir, 'log%d.log' % i) for i in range(3)]
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(u'\ufeff2014-03-01 00:00 [INFO] - \uc774\ub3d9\n'.
+                    encode('utf-16-le'))
+    try:
+        assert convert_files('utf-16-le', paths, 2) == paths
+        convpath = get_convfile_path(paths[0])
+        with open(convpath) as f:
+            assert f.read().decode('utf-8-sig') ==\
+                u'2014-03-01 00:00 [INFO] - \uc774\ub3d9\n'
+        assert convpath in load_stamps()
+        assert convert_files('utf-16-le', paths) == []
+
+        # appended file is converted again
+        with open(paths[1], 'ab') as f:
+            f.write(u'2014-03-01 01:00 [INFO] - Move\n'.encode('utf-16-le'))
+        assert convert_files('utf-16-le', paths) == [paths[1]]
+        with open(get_convfile_path(paths[1])) as f:
+            assert len(f.readlines()) == 2
+
+        # big endian without BOM, as iconv
+        with open(paths[2], 'wb') as f:
+            f.write(u'\uc774\ub3d9\n'.encode('utf-16-be'))
+        assert convert_files('utf-16', paths) == [paths[2]]
+        with open(get_convfile_path(paths[2])) as f:
+            assert f.read().decode('utf-8') == u'\uc774\ub3d9\n'
+    finally:
+        shutil.rmtree(sdir)
+        shutil.rmtree(os.path.dirname(get_convfile_path(paths[0])))
@@ -1,7 +1,9 @@
+import time
+
 import pytest
 
 from wzdat.rundb import flush_unhandled_events, register_event,\
-    unhandled_events
+    unhandled_events, subscribe_events, publish_event, pop_unhandled_events
 from wzdat import event as evt
 
 
@@ -17,3 +19,63 @@ def test_event(db):
 
     events = unhandled_events()
     assert len(events) == 2
+
+    # written file is queued once until handled
+    register_event(evt.FILE_CLOSE_WRITE, '/test/path', coalesce=True)
+    register_event(evt.FILE_CLOSE_WRITE, '/test/path', coalesce=True)
+    register_event(evt.FILE_CLOSE_WRITE, '/test/path2', coalesce=True)
+    assert len(unhandled_events()) == 4
+    assert len(pop_unhandled_events()) == 4
+    register_event(evt.FILE_CLOSE_WRITE, '/test/path', coalesce=True)
+    assert len(unhandled_events()) == 1
+
+
+def test_event_notify(db):
+    from wzdat.jobs import _wait_events
+    pubsub = subscribe_events()
+    try:
+        # consume subscribe reply
+        assert _wait_events(pubsub, 0.1) == set()
+        start = time.time()
+        register_event(evt.FILE_CLOSE_WRITE, '/test/path')
+        publish_event(evt.NOTEBOOK_CHANGE)
+        etypes = _wait_events(pubsub, 10)
+        assert time.time() - start < 5
+        assert etypes == set([evt.FILE_CLOSE_WRITE, evt.NOTEBOOK_CHANGE])
+        # notebook change is not queued
+        assert len(unhandled_events()) == 1
+    finally:
+        pubsub.close()
+
+
+def test_event_daemon(db, monkeypatch):
+    from wzdat import jobs
+    runs = []
+    stamps = {'a.ipynb': 1}
+    monkeypatch.setattr(jobs, 'check_cache', lambda: runs.append('cache'))
+    monkeypatch.setattr(jobs, 'register_cron_notebooks',
+                        lambda prev: runs.append('cron'))
+    monkeypatch.setattr(jobs, 'update_notebooks',
+                        lambda: runs.append('update'))
+    monkeypatch.setattr(jobs, '_notebook_stamps', lambda: dict(stamps))
+
+    daemon = jobs._Daemon(60, 60)
+    assert daemon.run(set()) == 60
+    assert runs == ['cache', 'cron', 'update']
+    # file event doesn't update notebooks within interval
+    del runs[:]
+    assert 0 < daemon.run(set([evt.FILE_CLOSE_WRITE])) <= 60
+    assert runs == ['cache']
+    # own notebook writes are ignored
+    del runs[:]
+    daemon.run(set([evt.NOTEBOOK_CHANGE]))
+    assert runs == ['cache']
+    del runs[:]
+    stamps['a.ipynb'] = 2
+    daemon.run(set([evt.NOTEBOOK_CHANGE]))
+    assert runs == ['cache', 'cron']
+    # pending update runs after interval
+    del runs[:]
+    daemon.last_update -= 60
+    assert daemon.run(set()) == 60
+    assert runs == ['cache', 'cron', 'update']
@@ -63,6 +63,67 @@ def test_notebook_run():
     assert path in runnbs
 
 
+def test_notebook_kernel_pool():
+    from nbformat import read
+    from wzdat.const import IPYNB_VER
+    from wzdat.ipynb_runner import run_code
+    from wzdat.kernel_pool import KernelPool, KERNEL_MEM_LIMIT
+    path = os.path.join(get_notebook_dir(), 'test-notebook.ipynb')
+    with open(path) as f:
+        nb = read(f, IPYNB_VER)
+    pool = KernelPool(1)
+    try:
+        pool.warm()
+        assert len(pool._idle[()]) == 1
+        r = pool.acquire(nb, path)
+        kernel = r._kernel
+        assert len(pool._idle[()]) == 0
+        run_code(r, "foo_ = 1\nimport os, sys, matplotlib\nos.chdir('/')\n"
+                 "sys.path.append('/foo_')\n"
+                 "matplotlib.rcParams['lines.linewidth'] = 7")
+        pool.release(r)
+        assert r.km is None
+        assert pool._idle[()] == [kernel]
+
+        # reset kernel is handed out again
+        r = pool.acquire(nb, path)
+        assert r._kernel is kernel and kernel.uses == 2
+        run_code(r, "assert 'foo_' not in globals() and 'pd' in globals()")
+        run_code(r, "import os, sys, matplotlib\nassert os.getcwd() != '/'\n"
+                 "assert '/foo_' not in sys.path\n"
+                 "assert matplotlib.rcParams['lines.linewidth'] != 7")
+
+        # failed notebook's kernel is not reused
+        from wzdat.kernel_pool import discard_kernel
+        pool.release(r)
+        r = pool.acquire(nb, path)
+        assert r._kernel is kernel
+        discard_kernel(r)
+        pool.release(r)
+        assert pool._idle[()] == []
+        assert not kernel.km.is_alive()
+
+        # recycled over memory limit
+        r = pool.acquire(nb, path)
+        kernel = r._kernel
+        pool.mem_limit = 0
+        pool.release(r)
+        assert pool._idle[()] == []
+        assert not kernel.km.is_alive()
+
+        # pylab names are imported again after reset
+        pool.mem_limit = KERNEL_MEM_LIMIT
+        r = pool.acquire(nb, path, pylab=True)
+        kernel = r._kernel
+        pool.release(r)
+        r = pool.acquire(nb, path, pylab=True)
+        assert r._kernel is kernel
+        run_code(r, "assert len(linspace(0, 1, 3)) == 3\nfigure()")
+        pool.release(r)
+    finally:
+        pool.shutdown()
+
+
 def test_notebook_error():
     path = os.path.join(get_notebook_dir(), 'test-notebook-error.ipynb')
     assert os.path.isfile(path)
@@ -94,6 +155,38 @@ def test_notebook_util():
     assert path == find_hdf_notebook_path('haje01', 'test')
 
 
+def test_notebook_manifest_cache(fxsoldir):
+    from wzdat import manifest
+    from wzdat.make_config import make_config
+    from wzdat.util import cache_files
+    from wzdat.fileindex import index_files_checksum
+    from ws_mysol.myprj import log
+    nbdir = get_notebook_dir()
+    path = os.path.join(nbdir, 'test-notebook5.ipynb')
+    mpath = get_notebook_manifest_path(path)
+    m = Manifest(False, path)
+    assert manifest._parsed_cache[mpath][1][0] == m._data
+    # parsed again when changed
+    manifest._parsed_cache[mpath] = (0, 0), ({}, None)
+    assert Manifest(False, path)._data == m._data
+
+    cfg = make_config()
+    cache_files()
+    log.load_info()
+    # load_info doesn't use stale cache
+    assert index_files_checksum('log', 7) is None
+    cfg['use_cache'] = True
+    try:
+        assert index_files_checksum('log', 7) ==\
+            log.files[log.dates[-7:]].checksum()
+        m = Manifest(True, path)
+        im = Manifest(True, path, True)
+        assert im._dep_files_chksum == m._dep_files_chksum
+        assert 'files' not in im.depends
+    finally:
+        cfg['use_cache'] = False
+
+
 def test_notebook_manifest1(fxsoldir):
     nbdir = get_notebook_dir()
     path = os.path.join(nbdir, 'test-notebook3.ipynb')
@@ -229,6 +322,33 @@ def test_notebook_depresolv(fxsoldir):
         nb5.manifest.depends.hdf[1].checksum()
 
 
+def test_notebook_depresolv_fail(fxsoldir):
+    from wzdat.nbdependresolv import DependencyTree, Notebook
+
+    class _Manifest(dict):
+        _data = {}
+
+    dt = DependencyTree(get_notebook_dir())
+    nba, nbb, nbc, nbd = [Notebook('/tmp/nb%s.ipynb' % n, _Manifest()) for
+                          n in 'abcd']
+    nbb.add_depend(nba)
+    nbc.add_depend(nbb)
+    dt.notebooks = [nbc, nbb, nba, nbd]
+    ran = []
+
+    def _run_notebook(notebook):
+        ran.append(notebook)
+        return notebook, notebook is not nba, True
+
+    dt._check_resolved = lambda updaterun, notebook: True
+    dt._run_notebook = _run_notebook
+    resolved, runs = dt.resolve(True, 2)
+    # failure goes to dependents only
+    assert sorted(ran) == sorted([nba, nbd])
+    assert resolved == [nbd]
+    assert sorted(dt.failed) == sorted([nba, nbb, nbc])
+
+
 def test_notebook_dashboard(fxsoldir):
     nbdir = get_notebook_dir()
     dnbs = [nbpath for nbpath in iter_dashboard_notebook(nbdir)]
@@ -266,6 +386,33 @@ def test_notebook_nodata():
     assert 'NoDataFound' in rv
 
 
+def test_notebook_html_cache():
+    from wzdat import rundb
+    path = os.path.join(get_notebook_dir(), 'test-notebook.ipynb')
+    update_notebook_by_run(path)
+    # dashboard notebook is rendered by run
+    st = os.stat(path)
+    stamp = st.st_size, st.st_mtime
+    html = rundb.get_outputs_html(path, stamp)
+    assert html == notebook_outputs_to_html(path, False)
+    assert 0 < rundb.r.ttl(u'html:{}'.format(path)) <= rundb.HTML_CACHE_TTL
+    # served from redis
+    rundb.set_outputs_html(path, stamp, u'cached')
+    assert notebook_outputs_to_html(path) == u'cached'
+    # rendered again when changed
+    os.utime(path, (st.st_atime, st.st_mtime + 1))
+    try:
+        assert notebook_outputs_to_html(path) == html
+    finally:
+        os.utime(path, (st.st_atime, st.st_mtime))
+
+    # other notebooks are not rendered
+    path = os.path.join(get_notebook_dir(), 'test-notebook3.ipynb')
+    rundb.remove_run_info(path)
+    update_notebook_by_run(path)
+    assert not rundb.r.exists(u'html:{}'.format(path))
+
+
 def test_notebook_manifest_error():
     nbdir = get_notebook_dir()
     nbapath = os.path.join(nbdir, 'test-notebook-manifest-error.ipynb')
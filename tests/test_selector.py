@@ -1,5 +1,6 @@
 import re
 import os
+import pytest
 
 
 import wzdat
@@ -144,3 +145,595 @@ def test_selector_usecols(fxlogs):
     assert len(df.columns) == 2
     assert df.columns[0] == 'node'
     assert df.columns[1] == 'kind'
+
+
+def test_selector_file_index(fxlogs):
+    log = fxlogs[0]
+    from wzdat.fileindex import get_file_index_path
+    assert os.path.isfile(get_file_index_path('log'))
+
+    calls = []
+    get_kind = log.get_kind
+
+    def _get_kind(sfield, fileo):
+        calls.append(fileo.abspath)
+        return get_kind(sfield, fileo)
+
+    log.get_kind = _get_kind
+    try:
+        # unchanged files don't call adapter
+        log.load_info()
+        assert len(calls) == 0
+        assert len(log.files) == 450
+        assert len(log.kinds) == 3
+        assert log.files[log.kind.auth][0].kind == log.kind.auth
+        assert log.files[0].date == log.date.D2014_02_24
+
+        # modified file calls adapter
+        path = log.files[0].abspath
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 1))
+        log.load_info()
+        assert calls == [path]
+        assert len(log.files) == 450
+
+        # changed adapter source calls adapter for all files
+        from wzdat import selector
+        ahash = selector.adapter_hash
+        selector.adapter_hash = lambda mod: 'changed'
+        try:
+            del calls[:]
+            log.load_info()
+            assert len(calls) == 450
+        finally:
+            selector.adapter_hash = ahash
+        del calls[:]
+        log.load_info()
+        assert len(calls) == 450
+    finally:
+        log.get_kind = get_kind
+
+
+def test_selector_find(fxlogs):
+    log = fxlogs[0]
+    files = log.files[log.kind.game]
+    expected = []
+    for _file in files:
+        with open(_file.abspath) as f:
+            cnt = len([line for line in f if 'ERROR' in line])
+        if cnt > 0:
+            expected.append((_file, cnt))
+
+    tf = files.find('ERROR')
+    assert tf.lcount == sum([c for _, c in expected])
+    assert [(impl._file, impl.count) for impl in tf._linfos.impls] ==\
+        expected
+    with open(tf.abspath) as f:
+        lines = f.readlines()
+    assert all(['ERROR' in line for line in lines])
+
+    tf = files.find('NOT_EXIST_WORD')
+    assert tf.lcount == 0
+
+    # options changing output of a line per match are rejected
+    assert files.find('error', '-i -m 1').lcount == len(expected)
+    for options in ('-c', '-il', '--only-matching', '--context=2'):
+        with pytest.raises(AssertionError):
+            files.find('ERROR', options)
+
+
+def test_selector_find_workers(fxlogs):
+    log = fxlogs[0]
+    tf = log.files.find('ERROR')
+    ptf = log.files.find('ERROR', workers=2)
+    assert ptf.lcount == tf.lcount
+    assert [(impl._file, impl.count) for impl in ptf._linfos.impls] ==\
+        [(impl._file, impl.count) for impl in tf._linfos.impls]
+    with open(tf.abspath) as f, open(ptf.abspath) as pf:
+        assert f.read() == pf.read()
+
+
+def test_selector_to_frame_vec(fxlogs):
+    exlog = fxlogs[1]
+    files = exlog.files[:3]
+    df = files.to_frame()
+    assert len(df) > 0
+    assert list(df.columns) == ['node', 'kind', 'level', 'msg']
+
+    # same as line by line conversion
+    import shutil
+    from wzdat.util import get_frame_cache_dir
+    shutil.rmtree(get_frame_cache_dir())
+    line_regex = exlog.line_regex
+    del exlog.line_regex
+    try:
+        ldf = files.to_frame()
+    finally:
+        exlog.line_regex = line_regex
+    assert df.equals(ldf)
+    assert (df.index == ldf.index).all()
+
+
+def test_selector_to_frame_workers(fxlogs):
+    log = fxlogs[0]
+    files = log.files[log.kind.auth][:20]
+    df = files.to_frame()
+    pdf = files.to_frame(workers=2)
+    assert df.equals(pdf)
+    assert (df.index == pdf.index).all()
+
+    from wzdat.util import HDF
+    with HDF('test') as hdf:
+        path = hdf.store.filename
+    files.to_frame_hdf(path, 'test_pdf', workers=2)
+    with HDF('test') as hdf:
+        sdf = hdf.store['test_pdf']
+    assert len(sdf) == len(df)
+    assert list(sdf['node']) == list(df['node'])
+
+
+def test_selector_frame_cache(fxlogs):
+    log = fxlogs[0]
+    from wzdat.util import get_frame_cache_dir
+    _file = log.files[log.kind.game][0]
+    df = _file.to_frame()
+    assert len(os.listdir(get_frame_cache_dir())) > 0
+
+    calls = []
+    get_line_msg = log.get_line_msg
+
+    def _get_line_msg(line):
+        calls.append(line)
+        return get_line_msg(line)
+
+    log.get_line_msg = _get_line_msg
+    try:
+        # cached frame
+        assert df.equals(_file.to_frame())
+        assert len(calls) == 0
+        # different columns
+        cdf = _file.to_frame(usecols=['node', 'msg'])
+        assert len(calls) > 0
+        assert list(cdf.columns) == ['node', 'msg']
+    finally:
+        log.get_line_msg = get_line_msg
+
+
+def test_selector_find_in_temp(fxlogs):
+    log = fxlogs[0]
+    files = log.files[log.kind.game]
+    tf = files.find('ERROR')
+    ttf = tf.find('Move')
+    with open(ttf.abspath) as f:
+        lines = f.readlines()
+    assert ttf.lcount == len(lines)
+    # runs from a file are kept as counts
+    assert all([impl.count > 0 for impl in ttf._linfos.impls])
+    assert len(ttf._linfos.impls) <= len(tf._linfos.impls)
+    assert ttf.nodes == [n for n in tf.nodes if n in ttf.nodes]
+
+    from wzdat.lineinfo import LineInfoImpl_Array
+    fs = [_file for _file in files[:3] for _ in range(3)]
+    impl = LineInfoImpl_Array([v.node for v in fs], [v.kind for v in fs],
+                               [v.date for v in fs], fs)
+    assert impl.count == 9
+    assert impl.files == fs
+    assert impl.unique_files == list(files[:3])
+    assert impl[4] == (fs[4].node, fs[4].kind, fs[4].date, fs[4])
+    assert impl[3:6].unique_files == [fs[3]]
+    assert impl.take([0, 8]).files == [fs[0], fs[8]]
+    assert list(impl)[-1][3] == fs[-1]
+
+
+def test_selector_line_index(fxlogs):
+    log = fxlogs[0]
+    _file = log.files[0]
+    with open(_file.abspath) as f:
+        lines = [line.decode('utf8') for line in f]
+    assert _file[0] == lines[0]
+    assert _file[3] == lines[3]
+    assert _file[-1] == lines[-1]
+    assert [line for line in _file] == lines
+    with pytest.raises(IndexError):
+        _file[len(lines)]
+    assert _file.lcount == len(lines)
+
+    with open(_file[2:5].abspath) as f:
+        assert f.read().decode('utf8') == ''.join(lines[2:5])
+    head = _file.head(3)
+    with open(head.abspath) as f:
+        assert f.read().decode('utf8') == ''.join(lines[:3])
+    tail = _file.tail(3)
+    with open(tail.abspath) as f:
+        assert f.read().decode('utf8') == ''.join(lines[-3:])
+    assert tail.lcount == 3
+
+    # large file index is saved
+    from wzdat.util import get_tmp_dir
+    from wzdat.lineindex import LineIndex, _get_index_path
+    path = os.path.join(get_tmp_dir(), 'line_index_test.txt')
+    with open(path, 'w') as f:
+        for i in xrange(100000):
+            f.write('line %d %s\n' % (i, 'x' * (i % 20)))
+    try:
+        lindex = LineIndex(path)
+        assert lindex.count == 100000
+        assert lindex.read(99999, 100000).startswith('line 99999 ')
+        assert os.path.isfile(_get_index_path(path))
+        # rebuilt when file changes
+        with open(path, 'a') as f:
+            f.write('last line\n')
+        assert lindex.read(100000, 100001) == 'last line\n'
+        # last line without newline
+        with open(path, 'a') as f:
+            f.write('partial')
+        assert lindex.count == 100002
+        assert lindex.byte_range(100001, 100002)[1] == os.path.getsize(path)
+        assert lindex.read(100000, 100002) == 'last line\npartial'
+    finally:
+        os.remove(path)
+
+    # small file without newline
+    with open(path, 'w') as f:
+        f.write('a\nb')
+    try:
+        lindex = LineIndex(path)
+        assert lindex.count == 2
+        assert lindex.read(1, 2) == 'b'
+    finally:
+        os.remove(path)
+
+
+def test_selector_postings(fxlogs):
+    log = fxlogs[0]
+    from wzdat.selector import _group_options, _normalize_options,\
+        _test_a_file
+    from collections import defaultdict
+
+    def _scan(files, options):
+        ofield_vals = defaultdict(list)
+        _group_options(_normalize_options(options), ofield_vals)
+        return [f for f in files if _test_a_file(f, ofield_vals)]
+
+    assert 'postings' in log.files._ctx.dict
+    queries = [[log.node.kr_node_1],
+               [log.kind.auth, log.kind.game],
+               [log.node.kr_node_1, log.kind.auth, log.dates[-3:]],
+               [log.date.D2014_02_24]]
+    for options in queries:
+        assert log.files[options].files == _scan(log.files, options)
+
+    # subset keeps its order
+    from wzdat.selector import FileSelector
+    files = FileSelector(log.files._ctx, log.files.files[::-1], 'file')
+    assert files[log.kind.auth].files == _scan(files, [log.kind.auth])
+    assert len(log.files[log.node.kr_node_1][log.kind.community]) == 10
+
+
+def test_selector_date_index(fxlogs):
+    log = fxlogs[0]
+    files = log.files
+    assert [str(d) for d in files.dates] == sorted([str(d) for d in
+                                                    files.dates])
+    sel = files[log.date.D2014_02_26:log.date.D2014_03_01]
+    assert sel.dates == [log.date.D2014_02_26, log.date.D2014_02_27,
+                         log.date.D2014_02_28]
+    assert sel.files == [f for f in files if f.date in sel.dates]
+    assert log.dates[log.date.D2014_02_26:log.date.D2014_03_01] ==\
+        sel.dates
+
+    # open ranges and dates not in files
+    import datetime
+    assert files[log.date.D2014_03_04:].dates == [log.date.D2014_03_04,
+                                                  log.date.D2014_03_05]
+    assert len(files[:log.date.D2014_02_25]) == 45
+    assert files[datetime.date(2014, 3, 4):datetime.date(2015, 1, 1)].dates\
+        == [log.date.D2014_03_04, log.date.D2014_03_05]
+
+    # int bound and step are of dates
+    dates = list(files.dates)
+    sel = files[log.date.D2014_02_26:5:2]
+    assert len(sel.dates) == 2
+    assert sel.dates == dates[dates.index(log.date.D2014_02_26):5:2]
+    assert sel.files == [f for f in files if f.date in sel.dates]
+    assert log.dates[log.date.D2014_02_26:5:2] == sel.dates
+    assert files[1:log.date.D2014_02_26].dates ==\
+        dates[1:dates.index(log.date.D2014_02_26)]
+    assert files.query()[log.date.D2014_02_26:5].files.files ==\
+        files[log.date.D2014_02_26:5].files
+
+    months = files.group_dates('month')
+    assert [m[0] for m in months] == [(2014, 2), (2014, 3)]
+    assert sum([len(m[1]) for m in months]) == len(files)
+    assert months[0][1].dates[-1] == log.date.D2014_02_28
+    weeks = files.group_dates('week')
+    assert [w[0] for w in weeks] == [(2014, 9), (2014, 10)]
+
+
+def test_selector_query(fxlogs):
+    log, exlog = fxlogs[0], fxlogs[1]
+    files = log.files
+    q = files.query()[log.date.D2014_02_26:][log.kind.auth][log.node.kr]
+    q = q[:log.date.D2014_03_01]
+    assert q.files.files == files[log.date.D2014_02_26:log.date.D2014_03_01]\
+        [log.kind.auth][log.node.kr].files
+    assert len(q.files) == 9
+
+    # find word is tested while parsing
+    q = q.find('Move\|Async')
+    df = q.to_frame()
+    edf = q.execute().to_frame()
+    assert len(df) == len(edf) > 0
+    assert (df['msg'].values == edf['msg'].values).all()
+    assert (df.index.values == edf.index.values).all()
+    assert len(q.find('xyz').to_frame()) == 0
+
+    df = q.select(['level', 'msg']).where(lambda d: d['level'] == 'INFO').\
+        to_frame()
+    assert list(df.columns) == ['level', 'msg']
+    assert set(df['msg']) == set(['Move'])
+
+    q = exlog.files.query()[exlog.node.kr].find('Send')
+    df = q.to_frame()
+    edf = q.execute().to_frame()
+    assert len(df) == len(edf) > 0
+    assert (df['msg'].values == edf['msg'].values).all()
+
+
+def test_selector_iter(fxlogs):
+    import pandas as pd
+    log, exlog = fxlogs[0], fxlogs[1]
+    files = log.files[log.kind.auth][:3]
+    lines = list(files.iter_lines())
+    assert len(lines) == files.lcount
+    assert lines[0][0] is files[0]
+    assert lines[0][1] == files[0][0].rstrip('\r\n')
+
+    # chunks of exact line count multiple
+    recs = list(files.iter_records(chunk=8))
+    assert len(recs) == 9
+    assert all([len(rdf) <= 8 for _, rdf in recs])
+    assert recs[-1][0] is files[2]
+    df = pd.concat([rdf for _, rdf in recs])
+    assert df.equals(files.to_frame())
+
+    files = exlog.files[:2]
+    df = pd.concat([rdf for _, rdf in files.iter_records(chunk=100,
+                                                         usecols=['msg'])])
+    assert list(df.columns) == ['msg']
+    assert len(df) == files.lcount
+
+
+def test_selector_merge(fxlogs):
+    log = fxlogs[0]
+    files = log.files[log.kind.auth][:3]
+    merged = files.merge()
+    assert merged._abspath is None
+    assert merged.lcount == files.lcount == len(merged)
+    assert merged.size == files.size
+    lines = []
+    for _file in files:
+        lines += [_file[i] for i in range(_file.lcount)]
+    assert list(merged) == lines
+    assert merged[30] == lines[30]
+    assert merged[-1] == lines[-1]
+    assert list(merged[20:30]) == lines[20:30]
+    assert merged[20:30].files == [files[0], files[1]]
+    assert list(merged.tail(5)) == lines[-5:]
+    assert len(merged.find('Move')) == len([l for l in lines if 'Move' in l])
+    assert merged.to_frame().equals(files.to_frame())
+    assert merged._abspath is None
+
+    tfile = merged.materialize()
+    assert open(tfile.abspath).read().decode('utf8') == u''.join(lines)
+    assert tfile.lcount == merged.lcount
+
+    # empty merge
+    from wzdat.selector import FileSelector, FileValue
+    empty = FileSelector(files._ctx, [], 'file').merge()
+    assert len(empty) == 0
+    assert len(empty.to_frame()) == 0
+
+    # newline after source file not ending with it
+    from wzdat.util import get_tmp_dir
+    _file = files[0]
+    path = os.path.join(get_tmp_dir(), 'merge_test.log')
+    with open(path, 'w') as f:
+        f.write(open(_file.abspath).read().rstrip('\n'))
+    try:
+        pfile = FileValue(_file._ctx, path)
+        pfile._set_props([_file.node, _file.kind, _file.date])
+        flines = [_file[i] for i in range(_file.lcount)]
+        merged = FileSelector(_file._ctx, [pfile, _file], 'file').merge()
+        assert list(merged) == flines * 2
+        assert len(merged) == len(flines) * 2
+        assert merged[len(flines) - 1] == flines[-1].rstrip('\n')
+        assert list(merged[len(flines) - 2:len(flines) + 1]) ==\
+            flines[-2:] + flines[:1]
+        tfile = merged.materialize()
+        assert open(tfile.abspath).read().decode('utf8') ==\
+            u''.join(flines * 2)
+        assert tfile.lcount == len(merged)
+        assert merged.size == tfile.size
+    finally:
+        os.remove(path)
+
+
+def test_selector_compressed(fxlogs):
+    import gzip
+    from wzdat.util import get_tmp_dir
+    from wzdat.selector import FileValue, FileSelector
+    log = fxlogs[0]
+    _file = log.files[0]
+    with open(_file.abspath) as f:
+        data = f.read()
+    lines = [line.decode('utf8') for line in data.splitlines(True)]
+    path = os.path.join(get_tmp_dir(), 'compressed_test.log.gz')
+    # two members
+    with gzip.open(path, 'wb') as f:
+        f.write(data[:100])
+    with open(path, 'ab') as f:
+        gf = gzip.GzipFile(fileobj=f, mode='wb')
+        gf.write(data[100:])
+        gf.close()
+    try:
+        gfile = FileValue(_file._ctx, path)
+        gfile._set_props([_file.node, _file.kind, _file.date])
+        assert gfile.lcount == len(lines)
+        assert gfile[3] == lines[3]
+        assert gfile[-1] == lines[-1]
+        with open(gfile.tail(3).abspath) as f:
+            assert f.read().decode('utf8') == ''.join(lines[-3:])
+        assert gfile.to_frame().equals(_file.to_frame())
+
+        files = FileSelector(_file._ctx, [_file, gfile], 'file')
+        cnt = len([line for line in lines if 'Move' in line])
+        assert len(files.find('Move')) == cnt * 2
+        assert list(files.merge()) == lines * 2
+    finally:
+        os.remove(path)
+
+
+def test_selector_compressed_zstd(fxlogs):
+    zstd = pytest.importorskip('zstandard')
+    import io
+    import gzip
+    from wzdat.util import get_tmp_dir
+    from wzdat.compress import open_data
+    from wzdat.selector import FileValue, FileSelector, grep_files,\
+        _get_grep_cmd
+    log = fxlogs[0]
+    _file = log.files[0]
+    with open(_file.abspath) as f:
+        data = f.read()
+    lines = [line.decode('utf8') for line in data.splitlines(True)]
+    path = os.path.join(get_tmp_dir(), 'compressed_test.log.zst')
+    with open(path, 'wb') as f:
+        f.write(zstd.ZstdCompressor().compress(data))
+    # last line without newline
+    gpath = os.path.join(get_tmp_dir(), 'compressed_test2.log.gz')
+    with gzip.open(gpath, 'wb') as f:
+        f.write(data.rstrip('\n'))
+    try:
+        with open_data(path) as f:
+            assert f.read() == data
+        assert f.closed and f._source.closed
+
+        zfile = FileValue(_file._ctx, path)
+        zfile._set_props([_file.node, _file.kind, _file.date])
+        assert zfile.lcount == len(lines)
+        assert zfile[-1] == lines[-1]
+        assert zfile.to_frame().equals(_file.to_frame())
+
+        files = FileSelector(_file._ctx, [_file, zfile], 'file')
+        cnt = len([line for line in lines if 'Move' in line])
+        assert len(files.find('Move')) == cnt * 2
+
+        # compressed files are grepped by one stream
+        paths = [path, gpath, path]
+        cmd = _get_grep_cmd(_file._ctx, 'Move', None)
+        out = io.BytesIO()
+        assert grep_files(cmd, paths, out) == [cnt] * 3
+        found = [line for line in lines if 'Move' in line]
+        assert out.getvalue().decode('utf8') == u''.join(found * 3)
+        # or one by one, if grep options depend on file boundaries
+        cmd = _get_grep_cmd(_file._ctx, 'Move', '-m 1')
+        out = io.BytesIO()
+        assert grep_files(cmd, paths, out) == [1] * 3
+    finally:
+        os.remove(path)
+        os.remove(gpath)
+
+
+def test_selector_gzip_seeker():
+    import gzip
+    from wzdat import compress
+    from wzdat.util import get_tmp_dir
+    path = os.path.join(get_tmp_dir(), 'gzip_seeker_test.gz')
+    data = ''.join(['line %d %s\n' % (i, 'x' * (i % 20)) for i in
+                    xrange(20000)])
+    with gzip.open(path, 'wb') as f:
+        f.write(data)
+    old = compress.CHECKPOINT_SIZE, compress.READ_BUF_SIZE
+    compress.CHECKPOINT_SIZE, compress.READ_BUF_SIZE = 10000, 1000
+    try:
+        seeker = compress.GzipSeeker(path)
+        assert ''.join(seeker.scan()) == data
+        assert len(seeker._points) > 10
+        for start, end in [(0, 10), (12345, 23456), (len(data) - 5,
+                                                     len(data) + 5)]:
+            assert seeker.read(start, end) == data[start:end]
+    finally:
+        compress.CHECKPOINT_SIZE, compress.READ_BUF_SIZE = old
+        os.remove(path)
+
+
+def test_selector_value_intern(fxlogs):
+    import datetime
+    from wzdat.value import Value, DateValue
+    log = fxlogs[0]
+    _date = log.date.D2014_03_01
+    assert DateValue._instance(_date._field, 2014, 3, 1) is _date
+    node = log.files[0].node
+    assert Value._instance(node._supobj, node._field, node._abbr, node._part,
+                           node._repr) is node
+    assert isinstance(node._id, int) and node._id != _date._id
+    assert hash(node) == hash(node._id)
+    assert node != log.kind.auth
+    # postings are kept by the id
+    assert _date._id in log.files._ctx.postings
+    assert len(log.files[node]) > 0
+    assert node._id in log.files._ctx.postings
+    assert _date.ordinal == datetime.date(2014, 3, 1).toordinal()
+    assert hash(_date) == hash(datetime.datetime(2014, 3, 1))
+    assert _date == datetime.date(2014, 3, 1)
+
+    # hash is calculated again when state is restored
+    state = _date.__getstate__()
+    assert '_hash' not in state and '_id' not in state
+    udate = DateValue.__new__(DateValue)
+    udate.__setstate__(state)
+    assert udate == _date and hash(udate) == hash(_date)
+    assert log.files[log.files[0]].files == [log.files[0]]
+
+
+def test_selector_slot(fxlogs):
+    import cPickle
+    import numpy as np
+    from wzdat.lineinfo import LineInfo, LineInfo_SInfo, LineInfoImpl_Array
+    from wzdat.const import SAVE_INFO_EXT
+    from wzdat.selector import Slot
+    from wzdat.util import get_tmp_dir
+    log = fxlogs[0]
+    tfile = log.files[:5].find('ERROR')
+    slot = Slot(log, os.path.join(get_tmp_dir(), 'wzdat-test-slot'))
+    tfile.save(slot.path)
+    with open(slot.path + SAVE_INFO_EXT, 'rb') as f:
+        assert f.read(2) == 'PK'
+    ltfile = slot.load_tmp()
+    assert ltfile.lcount == tfile.lcount
+    assert ltfile.files == tfile.files
+
+    def _lines(linfos):
+        return [line for impl in linfos.impls for line in impl]
+
+    fs = [_file for _file in log.files[3:6] for _ in range(2)]
+    impl = LineInfoImpl_Array([v.node for v in fs], [v.kind for v in fs],
+                               [v.date for v in fs], fs)
+    linfos = LineInfo([impl] + tfile._linfos.impls)
+    linfos.save(slot.path)
+    assert _lines(LineInfo.load(slot.path, log)) == _lines(linfos)
+
+    # info of other version is rejected
+    from wzdat import lineinfo
+    arrays = lineinfo._sinfo_arrays(linfos.impls)
+    arrays['ver'] = np.array([lineinfo.SINFO_VER + 1])
+    with open(slot.path + SAVE_INFO_EXT, 'wb') as f:
+        np.savez(f, **arrays)
+    with pytest.raises(lineinfo.UnsupportedLineInfo):
+        LineInfo.load(slot.path, log)
+
+    # info pickled by older version
+    with open(slot.path + SAVE_INFO_EXT, 'wb') as f:
+        cPickle.dump(LineInfo_SInfo(linfos), f, 2)
+    assert _lines(LineInfo.load(slot.path, log)) == _lines(linfos)
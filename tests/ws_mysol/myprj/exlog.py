@@ -18,6 +18,11 @@ def get_cols(path):
     return ['datetime', 'node', 'kind', 'level', 'msg']
 
 
+# for vectorized to_frame
+line_regex = r'(?P<date>\d{8}-\d\d:\d\d) (?P<level>\S+) (?P<msg>\S+)'
+line_date_format = '%Y%m%d-%H:%M'
+
+
 def get_line_date(line):
     """Return date part of a line which conform python dateutil."""
     return line[:14]
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Incremental file catalog.
+
+Apply file events from `wzdat.event.watch_files` to the cached file lists and
+finder info of each file type, instead of rescanning whole data directory.
+
+"""
+
+import os
+import imp
+import logging
+from bisect import bisect_left
+
+from wzdat.make_config import make_config
+from wzdat.const import FORWARDER_LOG_PREFIX
+from wzdat.event import FILE_MOVE_TO, FILE_DELETE
+from wzdat.util import ChangeDir, load_files_cache, save_files_cache,\
+    cache_finder
+from wzdat.rundb import get_finder_info, update_finder_info,\
+    update_cache_info
+
+# same as the finder date count of `cache_finder`
+FINDER_DATE_CNT = 14
+
+# loaded adapter modules by file type: ((path, mtime), module)
+_adapters = {}
+
+
+class CatalogInconsistent(Exception):
+
+    """Raise when cached file list can't be updated incrementally."""
+
+    pass
+
+
+def load_adapter(ftype):
+    """Load adapter module of file type from solution directory.
+
+    Module is kept for next events, and loaded again only when its file has
+    been modified.
+
+    """
+    cfg = make_config()
+    mpath = '%s/%s/%s.py' % (cfg['sol_pkg'], cfg['prj'], ftype)
+    with ChangeDir(cfg['sol_dir']):
+        stamp = os.path.abspath(mpath), os.path.getmtime(mpath)
+        if ftype in _adapters and _adapters[ftype][0] == stamp:
+            return _adapters[ftype][1]
+        mod = imp.load_source('%s' % ftype, mpath)
+    _adapters[ftype] = stamp, mod
+    return mod
+
+
+def _is_catalog_path(data_dir, path):
+    """Return whether the path could be in file catalog."""
+    if FORWARDER_LOG_PREFIX in path:
+        return False
+    relpath = os.path.relpath(path, data_dir)
+    if relpath.startswith('..'):
+        return False
+    # directories start with '_' are skipped by `find_files_and_save`
+    elms = relpath.split('/')
+    if not os.path.isdir(path):
+        elms = elms[:-1]
+    for elm in elms:
+        if elm.startswith('_'):
+            return False
+    return True
+
+
+def _insert_files(root_list, roots, adir, filenames, ffilter):
+    """Insert matching files into root list and return their paths."""
+    if adir not in roots:
+        _root = [adir, []]
+        root_list.insert(bisect_left(root_list, _root), _root)
+        roots[adir] = _root
+    _root = roots[adir]
+    exist = set(_root[1])
+    rfiles = [fn for fn in ffilter(adir, filenames) if fn not in exist]
+    if len(rfiles) > 0:
+        _root[1] = sorted(_root[1] + rfiles)
+    return [os.path.join(adir, fn) for fn in rfiles]
+
+
+def _delete_path(root_list, roots, path):
+    """Delete a file or a directory from root list and return removed paths."""
+    removed = []
+    subroots = [root for root in roots.keys() if root == path or
+                root.startswith(path + '/')]
+    for root in subroots:
+        _root = roots.pop(root)
+        removed += [os.path.join(root, fn) for fn in _root[1]]
+        root_list.remove(_root)
+    if len(subroots) > 0:
+        return removed
+
+    adir, filename = os.path.split(path)
+    if adir in roots and filename in roots[adir][1]:
+        roots[adir][1].remove(filename)
+        removed.append(path)
+    return removed
+
+
+def _check_consistency(ftype, root_list, filecnt, touched):
+    if filecnt != sum([len(_root[1]) for _root in root_list]):
+        raise CatalogInconsistent("file count mismatch for '%s'" % ftype)
+    for adir in touched:
+        if not os.path.isdir(adir):
+            raise CatalogInconsistent("'%s' not exist" % adir)
+
+
+def _apply_type_events(ftype, ffilter, events):
+    cached = load_files_cache(ftype)
+    if cached is None:
+        raise CatalogInconsistent("no cached file list for '%s'" % ftype)
+    root_list, filecnt = cached
+    roots = dict((_root[0], _root) for _root in root_list)
+
+    added = []
+    deleted = []
+    touched = set()
+    for etype, path in events:
+        if etype == FILE_MOVE_TO:
+            if os.path.isdir(path):
+                for root, dirs, filenames in os.walk(path):
+                    dirs[:] = [d for d in dirs if not d.startswith('_')]
+                    root = os.path.abspath(root)
+                    added += _insert_files(root_list, roots, root, filenames,
+                                           ffilter)
+                    touched.add(root)
+            elif os.path.isfile(path):
+                adir, filename = os.path.split(path)
+                added += _insert_files(root_list, roots, adir, [filename],
+                                       ffilter)
+                touched.add(adir)
+        elif etype == FILE_DELETE:
+            removed = _delete_path(root_list, roots, path)
+            filecnt -= len(removed)
+            removed = set(removed)
+            deleted += [p for p in removed if p not in added]
+            added = [p for p in added if p not in removed]
+    # files added then deleted have not been counted
+    filecnt += len(added)
+    touched = [_dir for _dir in touched if _dir in roots]
+
+    _check_consistency(ftype, root_list, filecnt, touched)
+    if len(added) > 0 or len(deleted) > 0:
+        save_files_cache(ftype, (root_list, filecnt))
+    return added, deleted
+
+
+def _add_finder_values(ftype, mod, paths):
+    """Merge node/kind/date values of added files into finder info."""
+    from wzdat.selector import load_file_values
+    infos = dict((ft, (dates, kinds, nodes)) for ft, dates, kinds, nodes in
+                 get_finder_info())
+    if ftype not in infos:
+        cache_finder([ftype])
+        return
+
+    fileos = load_file_values(dict(vars(mod)), ftype, paths)
+    dates, kinds, nodes = [set([v for v in vals if len(v) > 0]) for vals in
+                           infos[ftype]]
+    for fileo in fileos:
+        kind = fileo.kind._supobj if fileo.kind._supobj is not None else\
+            fileo.kind
+        dates.add(str(fileo.date))
+        kinds.add(str(kind))
+        nodes.add(str(fileo.node))
+    dates = sorted(dates, reverse=True)[:FINDER_DATE_CNT]
+    update_finder_info([(ftype, dates, sorted(kinds), sorted(nodes))])
+
+
+def apply_file_events(events):
+    """Apply file events to cached file list and finder info of file types.
+
+    Finder info of a file type is rebuilt when its file has been deleted,
+    because the values of deleted file could still be used by other files.
+
+    Parameters
+    ----------
+    events : list
+        List of (event type, absolute path) tuple.
+
+    Raises
+    ------
+    CatalogInconsistent
+        When cached file list is missing or does not agree with events. Full
+        rescan is needed then.
+
+    """
+    logging.debug('apply_file_events')
+    cfg = make_config()
+    if 'file_types' not in cfg:
+        logging.warning('no file_types in cfg. exit')
+        return
+    data_dir = os.path.abspath(cfg['data_dir'])
+    events = [(etype, os.path.abspath(path)) for etype, path in events if
+              _is_catalog_path(data_dir, path)]
+    if len(events) == 0:
+        return
+
+    rebuilds = []
+    with ChangeDir(cfg['sol_dir']):
+        for ftype in cfg['file_types']:
+            mod = load_adapter(ftype)
+            added, deleted = _apply_type_events(ftype, mod.file_filter,
+                                                events)
+            logging.debug(u"'{}' {} added, {} deleted".format(
+                ftype, len(added), len(deleted)))
+            if len(deleted) > 0:
+                rebuilds.append(ftype)
+            elif len(added) > 0:
+                _add_finder_values(ftype, mod, added)
+    if len(rebuilds) > 0:
+        cache_finder(rebuilds)
+    update_cache_info()
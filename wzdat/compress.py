@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Reading of compressed data files.
+
+Data files ending with '.gz' or '.zst' are decompressed while streaming, so
+rotated logs can be kept compressed. Reading '.zst' files needs 'zstandard'
+package.
+
+`GzipSeeker` keeps decompressor checkpoints of a gzip file, taken every
+`CHECKPOINT_SIZE` decompressed bytes while it is read, so that reading at an
+offset resumes from the nearest checkpoint instead of the start. Checkpoints
+are kept in memory only, because decompressor state can't be saved.
+
+"""
+
+import io
+import zlib
+import logging
+from bisect import bisect_right
+
+GZIP_EXT = '.gz'
+ZSTD_EXT = '.zst'
+READ_BUF_SIZE = 1024 * 1024
+CHECKPOINT_SIZE = 16 * 1024 * 1024
+
+
+def is_compressed(path):
+    """Return whether the file is read by decompressing."""
+    return path.endswith(GZIP_EXT) or path.endswith(ZSTD_EXT)
+
+
+class _ZstdFile(io.BufferedReader):
+
+    """Buffered zstd stream reader, which closes its source file too."""
+
+    def __init__(self, reader, source):
+        io.BufferedReader.__init__(self, reader, READ_BUF_SIZE)
+        self._source = source
+
+    def close(self):
+        try:
+            io.BufferedReader.close(self)
+        finally:
+            self._source.close()
+
+
+def _open_zstd(path):
+    try:
+        import zstandard
+    except ImportError:
+        logging.error(u"'zstandard' package is needed to read {}".format(
+            path))
+        raise
+    # stream reader of zstandard for python 2 doesn't close source
+    source = open(path, 'rb')
+    try:
+        reader = zstandard.ZstdDecompressor().stream_reader(source)
+    except Exception:
+        source.close()
+        raise
+    return _ZstdFile(reader, source)
+
+
+def open_data(path):
+    """Open data file for binary reading, decompressing if needed.
+
+    Returned file supports `read`, `readline`, line iteration and `with`.
+
+    """
+    if path.endswith(GZIP_EXT):
+        import gzip
+        return gzip.open(path, 'rb')
+    elif path.endswith(ZSTD_EXT):
+        return _open_zstd(path)
+    return open(path, 'rb')
+
+
+class GzipSeeker(object):
+
+    """Random access reader of decompressed gzip file."""
+
+    def __init__(self, path):
+        self.path = path
+        # (decompressed offset, compressed offset, decompressor copy)
+        self._points = [(0, 0, None)]
+
+    def reset(self):
+        """Drop checkpoints, when the file has been changed."""
+        self._points = [(0, 0, None)]
+
+    def _iter_from(self, point):
+        """Yield decompressed offset and data from a checkpoint."""
+        uoff, coff, dobj = point
+        dobj = _new_gzip_decomp() if dobj is None else dobj.copy()
+        last = self._points[-1][0]
+        with open(self.path, 'rb') as f:
+            f.seek(coff)
+            while True:
+                buf = f.read(READ_BUF_SIZE)
+                if not buf:
+                    data = dobj.flush()
+                    if data:
+                        yield uoff, data
+                    break
+                coff += len(buf)
+                data = dobj.decompress(buf)
+                # next member of multi member gzip
+                while dobj.unused_data:
+                    unused = dobj.unused_data
+                    data += dobj.flush()
+                    dobj = _new_gzip_decomp()
+                    data += dobj.decompress(unused)
+                if data:
+                    yield uoff, data
+                    uoff += len(data)
+                if uoff >= last + CHECKPOINT_SIZE:
+                    self._points.append((uoff, coff, dobj.copy()))
+                    last = uoff
+
+    def iter_range(self, start, end):
+        """Yield decompressed data of byte range [start, end)."""
+        at = bisect_right([p[0] for p in self._points], start) - 1
+        for uoff, data in self._iter_from(self._points[at]):
+            if uoff + len(data) <= start:
+                continue
+            if uoff >= end:
+                break
+            yield data[max(start - uoff, 0):end - uoff]
+            if uoff + len(data) >= end:
+                break
+
+    def read(self, start, end):
+        """Return decompressed bytes of byte range [start, end)."""
+        return ''.join(self.iter_range(start, end))
+
+    def scan(self):
+        """Yield all decompressed data, taking checkpoints."""
+        for _, data in self._iter_from(self._points[0]):
+            yield data
+
+
+def _new_gzip_decomp():
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
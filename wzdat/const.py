@@ -9,3 +9,17 @@ FORWARDER_LOG_PREFIX = '_wdfwd'
 EVENT_DEFAULT_PRIOR = 2
 HDF_CHKSUM_FMT = '{}_chksum_'
 IPYNB_VER = 4
+GREP_BATCH_SIZE = 512
+# grep options which work the same on concatenated files
+STREAM_GREP_OPTS = ('-i', '-v', '-w', '-x', '-E', '-F', '-G', '-P', '-a',
+                    '--ignore-case', '--invert-match', '--word-regexp',
+                    '--line-regexp')
+# grep options which break a line per match output of '-H -Z'
+GREP_OUTPUT_OPTS = ('-c', '-l', '-L', '-o', '-q', '-h', '-z', '-A', '-B',
+                    '-C', '--count', '--files-with-matches',
+                    '--files-without-match', '--only-matching', '--quiet',
+                    '--silent', '--no-filename', '--null-data',
+                    '--after-context', '--before-context', '--context')
+# short grep options taking an argument
+GREP_ARG_OPTS = 'efmdDABC'
+CONV_CHUNK_SIZE = 1 << 20
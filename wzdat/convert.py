@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Conversion of UTF-16 data files.
+
+Data files of 'utf-16' encoding are read through their UTF-8 copies under the
+conv directory. Files are converted in worker processes, and the size and
+modified time of each source are kept, so that files still being appended
+are converted again at next load. `convert_event_files` converts the files
+of file events, ahead of `load_info`.
+
+"""
+
+import os
+import cPickle
+import logging
+
+from wzdat.make_config import make_config
+from wzdat.util import ChangeDir, get_index_dir, get_convfile_path,\
+    convert_data_file
+
+
+def _get_stamps_path():
+    return os.path.join(get_index_dir(), 'conv_stamps.pkl')
+
+
+def load_stamps():
+    """Return source stamps of converted files by conv file path."""
+    path = _get_stamps_path()
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            return cPickle.load(f)
+    except (EOFError, ValueError, cPickle.UnpicklingError), e:
+        logging.warning(u"ignore broken conv stamps: {}".format(e))
+        return {}
+
+
+def save_stamps(updates):
+    """Merge source stamps of newly converted files into stamp file."""
+    if len(updates) == 0:
+        return
+    # other processes could have saved meanwhile
+    stamps = load_stamps()
+    stamps.update(updates)
+    path = _get_stamps_path()
+    tmp_path = path + '.tmp%d' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        cPickle.dump(stamps, f, 2)
+    os.rename(tmp_path, path)
+
+
+def _source_stamp(srcpath):
+    st = os.stat(srcpath)
+    return st.st_size, st.st_mtime
+
+
+def need_convert(srcpath, convpath, stamps):
+    """Return whether source should be converted (again)."""
+    if not os.path.isfile(convpath):
+        return True
+    stamp = stamps.get(convpath)
+    if stamp is None:
+        # converted before stamps were kept
+        return os.path.getmtime(convpath) < os.path.getmtime(srcpath)
+    return stamp != _source_stamp(srcpath)
+
+
+def _convert_file(args):
+    """Convert a file and return source stamp of it. Run in worker process.
+    """
+    srcpath, encoding, convpath = args
+    # stamp before converting, appended later should be converted again
+    stamp = _source_stamp(srcpath)
+    convert_data_file(srcpath, encoding, convpath)
+    return convpath, stamp
+
+
+def convert_files(encoding, srcpaths, workers=None):
+    """Convert new or changed source files, and return their paths.
+
+    Parameters
+    ----------
+    encoding : string
+        Encoding of source files.
+    srcpaths : list
+        Paths to source data files.
+    workers : int
+        Number of converting processes. Default is 'conv_workers' config,
+        or cpu count.
+
+    """
+    from multiprocessing import Pool, cpu_count
+
+    stamps = load_stamps()
+    targets = []
+    for srcpath in srcpaths:
+        convpath = get_convfile_path(srcpath)
+        if os.path.isfile(srcpath) and need_convert(srcpath, convpath,
+                                                    stamps):
+            targets.append(srcpath)
+    if len(targets) == 0:
+        return targets
+    logging.debug(u"convert {} files".format(len(targets)))
+
+    if workers is None:
+        cfg = make_config()
+        workers = cfg['conv_workers'] if 'conv_workers' in cfg else\
+            cpu_count()
+    args = [(srcpath, encoding, get_convfile_path(srcpath)) for srcpath in
+            targets]
+    if workers > 1 and len(args) > 1:
+        pool = Pool(min(workers, len(args)))
+        try:
+            updates = dict(pool.imap_unordered(_convert_file, args))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        updates = dict([_convert_file(arg) for arg in args])
+    save_stamps(updates)
+    return targets
+
+
+def conv_file_types():
+    """Return (file type, encoding) list of file types to convert."""
+    from wzdat.selector import _get_file_encoding
+
+    cfg = make_config()
+    if 'file_types' not in cfg:
+        return []
+    encs = [(ftype, _get_file_encoding(ftype)) for ftype in
+            cfg['file_types']]
+    return [(ftype, enc) for ftype, enc in encs if enc.startswith('utf-16')]
+
+
+def convert_event_files(events):
+    """Convert data files of file events, for file types of 'utf-16'.
+
+    Parameters
+    ----------
+    events : list
+        List of (event type, absolute path) tuple.
+
+    """
+    from wzdat.event import FILE_MOVE_TO, FILE_CLOSE_WRITE
+    from wzdat.catalog import load_adapter, _is_catalog_path
+
+    encs = conv_file_types()
+    if len(encs) == 0:
+        return
+    cfg = make_config()
+    data_dir = os.path.abspath(cfg['data_dir'])
+
+    paths = []
+    for etype, path in events:
+        path = os.path.abspath(path)
+        if etype not in (FILE_MOVE_TO, FILE_CLOSE_WRITE) or\
+                not _is_catalog_path(data_dir, path):
+            continue
+        if os.path.isdir(path):
+            for root, dirs, filenames in os.walk(path):
+                dirs[:] = [d for d in dirs if not d.startswith('_')]
+                paths += [(root, fn) for fn in filenames]
+        elif os.path.isfile(path):
+            paths.append(os.path.split(path))
+
+    with ChangeDir(cfg['sol_dir']):
+        for ftype, enc in encs:
+            ffilter = load_adapter(ftype).file_filter
+            srcpaths = [os.path.join(adir, fn) for adir, fn in paths if
+                        len(ffilter(adir, [fn])) > 0]
+            converted = convert_files(enc, srcpaths)
+            logging.debug(u"'{}' {} files converted".format(ftype,
+                                                             len(converted)))
@@ -6,13 +6,14 @@ import zipfile
 import logging
 
 from celery import Celery
+from celery.signals import worker_process_init
 from nbformat import read
 
 from wzdat.notebook_runner import NoDataFound
 from wzdat.ipynb_runner import run_notebook_view_cell, get_view_cell_cnt,\
-    run_code, update_notebook_by_run, notebook_outputs_to_html, run_init
+    run_code, update_notebook_by_run, notebook_outputs_to_html
 from wzdat.make_config import make_config
-from wzdat.notebook_runner import NotebookRunner
+from wzdat.kernel_pool import get_pool, pooled_runner
 from wzdat.const import TMP_PREFIX, IPYNB_VER
 from wzdat.util import unique_tmp_path
 from wzdat.selector import get_urls
@@ -23,6 +24,12 @@ sol_dir = cfg['sol_dir']
 data_dir = cfg['data_dir']
 
 
+@worker_process_init.connect
+def _warm_kernels(**kwargs):
+    # kernels for view cells, ready before the first dashboard request
+    get_pool().warm(pylab=True)
+
+
 @app.task()
 def rerun_notebook(nbpath):
     print(u'rerun_notebook {}'.format(nbpath))
@@ -41,37 +48,36 @@ def rerun_notebook(nbpath):
 def run_view_cell(nbpath, formname, kwargs):
     print('run_view_cell {}'.format(formname))
     nb = read(open(nbpath), IPYNB_VER)
-    r = NotebookRunner(nb, pylab=True)
-    total = float(get_view_cell_cnt(r) + 1)
-
-    run_init(r, nbpath)
-
-    init = "from wzdat.dashboard.control import Form; %s = Form();"\
-           "form.init(%s)" % (formname, repr(kwargs))
-    print('init {}'.format(init))
-    try:
-        run_code(r, init)
-    except Exception, e:
-        print("run_view_cell - init fail {}".format(unicode(e)))
-        raise Exception(init)
-
-    run_view_cell.update_state(state='PROGRESS', meta=1 / total)
+    # runner on a warm kernel, which has run startup
+    with pooled_runner(nb, nbpath, pylab=True) as r:
+        total = float(get_view_cell_cnt(r) + 1)
 
-    rv = []
-    cnt = 0
-    for i, cell in enumerate(r.iter_cells()):
-        print('cell {}'.format(i))
+        init = "from wzdat.dashboard.control import Form; %s = Form();"\
+               "form.init(%s)" % (formname, repr(kwargs))
+        print('init {}'.format(init))
         try:
-            wasview = run_notebook_view_cell(rv, r, cell, i)
-            if wasview:
-                cnt += 1
-                run_view_cell.update_state(state='PROGRESS', meta=(cnt + 1) /
-                                           total)
-        except NoDataFound, e:
-            run_view_cell.update_state(state='PROGRESS', meta=1)
-            return [unicode(e)]
-    run_view_cell.update_state(state='PROGRESS', meta=1)
-    return rv
+            run_code(r, init)
+        except Exception, e:
+            print("run_view_cell - init fail {}".format(unicode(e)))
+            raise Exception(init)
+
+        run_view_cell.update_state(state='PROGRESS', meta=1 / total)
+
+        rv = []
+        cnt = 0
+        for i, cell in enumerate(r.iter_cells()):
+            print('cell {}'.format(i))
+            try:
+                wasview = run_notebook_view_cell(rv, r, cell, i)
+                if wasview:
+                    cnt += 1
+                    run_view_cell.update_state(state='PROGRESS',
+                                               meta=(cnt + 1) / total)
+            except NoDataFound, e:
+                run_view_cell.update_state(state='PROGRESS', meta=1)
+                return [unicode(e)]
+        run_view_cell.update_state(state='PROGRESS', meta=1)
+        return rv
 
 
 def _add_zip_flat(zf, abspath):
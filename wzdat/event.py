@@ -4,7 +4,7 @@ import logging
 from collections import defaultdict
 
 from wzdat.make_config import make_config
-from wzdat.rundb import register_event
+from wzdat.rundb import register_event, publish_event
 
 cfg = make_config()
 
@@ -14,17 +14,24 @@ RUNNER_DB_PATH = cfg['runner_db_path']
 # WzDat Built-in Events
 FILE_MOVE_TO = 'FILE_MOVE_TO'
 FILE_DELETE = 'FILE_DELETE'
+FILE_CLOSE_WRITE = 'FILE_CLOSE_WRITE'
+NOTEBOOK_CHANGE = 'NOTEBOOK_CHANGE'
 
 
-def watch_files(target_dir):
+def watch_files(target_dir, nb_dir=None):
     logging.debug('watch_files')
     import pyinotify
     excl_lst = [
         '/logdata/_var_',
     ]
 
+    from wzdat.convert import conv_file_types
+
     wm = pyinotify.WatchManager()
     mask = pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO | pyinotify.IN_DELETE
+    # written files are only needed to convert ahead
+    if len(conv_file_types()) > 0:
+        mask |= pyinotify.IN_CLOSE_WRITE
 
     class FileEventHandler(pyinotify.ProcessEvent):
         def process_IN_MOVED_TO(self, event):
@@ -33,6 +40,16 @@ def watch_files(target_dir):
         def process_IN_DELETE(self, event):
             register_event(FILE_DELETE, event.pathname)
 
+        def process_IN_CLOSE_WRITE(self, event):
+            # appending file is closed often
+            register_event(FILE_CLOSE_WRITE, event.pathname, coalesce=True)
+
+    class NotebookEventHandler(pyinotify.ProcessEvent):
+        def process_default(self, event):
+            path = event.pathname
+            if path.endswith('.ipynb') and '.ipynb_checkpoints' not in path:
+                publish_event(NOTEBOOK_CHANGE)
+
     assert os.path.isdir(target_dir)
 
     handler = FileEventHandler()
@@ -41,6 +58,10 @@ def watch_files(target_dir):
     excl = pyinotify.ExcludeFilter(excl_lst)
     wm.add_watch(target_dir, mask, rec=True, auto_add=True,
                  exclude_filter=excl)
+    # notebook changes are not queued, but wake up jobs daemon
+    if nb_dir is not None and os.path.isdir(nb_dir):
+        wm.add_watch(nb_dir, mask | pyinotify.IN_CLOSE_WRITE,
+                     proc_fun=NotebookEventHandler(), rec=True, auto_add=True)
 
     import asyncore
     asyncore.loop()
@@ -52,5 +73,6 @@ if __name__ == "__main__":
         print "Usage: event.py {directory_to_watch}"
         sys.exit(-1)
 
+    from wzdat.util import get_notebook_dir
     target_dir = sys.argv[1]
-    watch_files(target_dir)
+    watch_files(target_dir, get_notebook_dir())
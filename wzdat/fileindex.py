@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Persistent file metadata index.
+
+Keep node, kind, date values of each data file by its path, size and
+modified time. `load_info` calls adapter functions only for new or changed
+files. Index made by other adapter source is not used.
+
+"""
+
+import os
+import cPickle
+import logging
+from datetime import date
+
+from wzdat.value import Value, DateValue
+from wzdat.make_config import make_config
+from wzdat.util import get_index_dir, load_files_cache, files_checksum
+from wzdat.const import FORWARDER_LOG_PREFIX
+from wzdat.framecache import adapter_file_hash
+
+INDEX_VER = 2
+
+
+def get_file_index_path(file_type):
+    return os.path.join(get_index_dir(), '%s_file_index.pkl' % file_type)
+
+
+def _value_spec(val):
+    """Return hashable spec to rebuild value, or None if not possible."""
+    vtype = type(val)
+    if vtype is DateValue:
+        return 'date', val._field._clsname, val.year, val.month, val.day
+    elif vtype is Value:
+        sup = None
+        if val._supobj is not None:
+            sup = _value_spec(val._supobj)
+            if sup is None:
+                return None
+        part = tuple(val._part) if isinstance(val._part, list) else val._part
+        return 'value', val._field._clsname, sup, val._abbr, part, val._repr
+    # values of adapter defined class are not indexed
+    return None
+
+
+class FileIndex(object):
+
+    """File metadata index of a file type."""
+
+    def __init__(self, file_type, ahash):
+        self.file_type = file_type
+        self.ahash = ahash
+        self.path = get_file_index_path(file_type)
+        self._entries = self._load()
+        self._seen = {}
+        self._built = {}
+        self._changed = False
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as f:
+                header, entries = cPickle.load(f)
+        except (EOFError, ValueError, cPickle.UnpicklingError), e:
+            logging.warning(u"FileIndex - ignore broken index: {}".format(e))
+            return {}
+        # values could differ by other version or adapter
+        return entries if header == (INDEX_VER, self.ahash) else {}
+
+    def _build(self, fields, spec):
+        if spec in self._built:
+            return self._built[spec]
+        if spec[0] == 'date':
+            _, fname, y, m, d = spec
+            val = DateValue._instance(fields[fname], y, m, d)
+        else:
+            _, fname, sup, abbr, part, _repr = spec
+            supobj = self._build(fields, sup) if sup is not None else None
+            if isinstance(part, tuple):
+                part = list(part)
+            val = Value._instance(supobj, fields[fname], abbr, part, _repr)
+        self._built[spec] = val
+        return val
+
+    def lookup(self, abspath, fields):
+        """Return stamp and indexed values of the file.
+
+        Values are None when the file is not indexed or has been changed.
+
+        Parameters
+        ----------
+        abspath : string
+            Absolute path to the file.
+        fields : dict
+            Field objects of current context by field name.
+
+        """
+        stamp, entry = self._lookup_entry(abspath)
+        if entry is None:
+            return stamp, None
+        self._seen[abspath] = entry
+        vals = set([self._build(fields, spec) for spec in entry[1]])
+        return stamp, vals
+
+    def _lookup_entry(self, abspath):
+        try:
+            st = os.stat(abspath)
+        except OSError:
+            return None, None
+        stamp = st.st_size, st.st_mtime
+        entry = self._entries.get(abspath)
+        if entry is None or entry[0] != stamp:
+            return stamp, None
+        return stamp, entry
+
+    def lookup_date(self, abspath):
+        """Return stamp and indexed date ordinal of the file, without
+        building values. Date is None when the file is not indexed or has
+        been changed."""
+        stamp, entry = self._lookup_entry(abspath)
+        if entry is None:
+            return stamp, None
+        for spec in entry[1]:
+            if spec[0] == 'date':
+                return stamp, date(*spec[2:]).toordinal()
+        return stamp, None
+
+    def add(self, abspath, stamp, vals):
+        """Add resolved values of the file."""
+        if stamp is None:
+            return
+        specs = tuple([_value_spec(val) for val in vals])
+        if None in specs:
+            return
+        self._seen[abspath] = stamp, specs
+        self._changed = True
+
+    def save(self):
+        """Save index for the files seen in this load, if changed."""
+        if not self._changed and len(self._seen) == len(self._entries):
+            return
+        tmp_path = self.path + '.tmp%d' % os.getpid()
+        with open(tmp_path, 'wb') as f:
+            cPickle.dump(((INDEX_VER, self.ahash), self._seen), f, 2)
+        # replace at once, other processes could be loading it
+        os.rename(tmp_path, self.path)
+        self._entries = self._seen
+        self._seen = {}
+        self._changed = False
+
+
+def index_files_checksum(file_type, ndate):
+    """Return checksum of files in last dates, by found files cache and file
+    index, without loading file infos.
+
+    Returns same value as `FileSelector.checksum` of
+    `files[dates[-ndate:]]` after `load_info`, or None if the cache or index
+    can't tell it.
+
+    """
+    from wzdat.selector import _get_file_encoding
+
+    cfg = make_config()
+    use_cache = cfg['use_cache'] if 'use_cache' in cfg else True
+    use_index = cfg['use_file_index'] if 'use_file_index' in cfg else True
+    # load_info doesn't use cache, which could be stale
+    if not use_cache or not use_index:
+        return None
+    if _get_file_encoding(file_type).startswith('utf-16'):
+        return None
+    found = load_files_cache(file_type)
+    if found is None or found[1] == 0:
+        return None
+    ahash = adapter_file_hash(os.path.join(cfg['sol_dir'], cfg['sol_pkg'],
+                                           cfg['prj'], file_type + '.py'))
+    if ahash is None:
+        return None
+
+    findex = FileIndex(file_type, ahash)
+    files = []
+    for root, filenames in found[0]:
+        for filename in filenames:
+            if FORWARDER_LOG_PREFIX in filename:
+                continue
+            abspath = os.path.join(root, filename)
+            stamp, _ord = findex.lookup_date(abspath)
+            if _ord is None:
+                return None
+            files.append((abspath, stamp[0], _ord))
+    ords = sorted(set([f[2] for f in files]))
+    last = set(ords[-int(ndate):])
+    return files_checksum([(f[0], f[1]) for f in files if f[2] in last])
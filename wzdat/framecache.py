@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Parse cache of to_frame results.
+
+Keep data frame of each data file under the cache directory, keyed by the
+file path, size, modified time, adapter source and used columns. Least
+recently used frames are evicted when the cache size exceeds
+'frame_cache_size' config(MB, default 1024). Set it 0 to disable the cache.
+
+"""
+
+import os
+import hashlib
+import logging
+
+import pandas as pd
+
+from wzdat.make_config import make_config
+from wzdat.util import get_frame_cache_dir
+
+FRAME_CACHE_VER = 1
+FRAME_CACHE_EXT = '.pkl'
+DEFAULT_CACHE_SIZE = 1024
+
+_adapter_hashes = {}
+_cache_size = None
+
+
+def _get_max_size():
+    cfg = make_config()
+    size = cfg['frame_cache_size'] if 'frame_cache_size' in cfg else\
+        DEFAULT_CACHE_SIZE
+    return size * 1024 * 1024
+
+
+def adapter_hash(mod):
+    """Return hash of adapter source, which decides parsing result."""
+    path = mod.get('__file__')
+    if path is None:
+        return None
+    return adapter_file_hash(path)
+
+
+def adapter_file_hash(path):
+    """Return hash of adapter source file, or None if not found."""
+    if path.endswith('.pyc'):
+        path = path[:-1]
+    if not os.path.isabs(path) and not os.path.isfile(path):
+        # adapters are loaded relative to solution directory
+        path = os.path.join(make_config()['sol_dir'], path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    key = path, mtime
+    if key not in _adapter_hashes:
+        with open(path, 'rb') as f:
+            _adapter_hashes[key] = hashlib.md5(f.read()).hexdigest()
+    return _adapter_hashes[key]
+
+
+def frame_cache_key(fileo, usecols):
+    """Return cache key of file's data frame, or None if not cacheable."""
+    if _get_max_size() <= 0:
+        return None
+    ahash = adapter_hash(fileo._ctx.mod)
+    if ahash is None:
+        return None
+    try:
+        st = os.stat(fileo.abspath)
+    except OSError:
+        return None
+    usecols = tuple(usecols) if usecols is not None else None
+    key = (FRAME_CACHE_VER, fileo.abspath, st.st_size, st.st_mtime, ahash,
+           usecols)
+    return hashlib.md5(repr(key)).hexdigest()
+
+
+def _get_cache_path(key):
+    return os.path.join(get_frame_cache_dir(), key + FRAME_CACHE_EXT)
+
+
+def load_frame(key):
+    """Return cached data frame, or None if not cached."""
+    path = _get_cache_path(key)
+    if not os.path.isfile(path):
+        return None
+    try:
+        df = pd.read_pickle(path)
+    except Exception, e:
+        logging.warning(u"load_frame - ignore broken cache: {}".format(e))
+        return None
+    # mark as recently used
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return df
+
+
+def save_frame(key, df):
+    """Save data frame into cache, and evict old ones if necessary."""
+    global _cache_size
+    path = _get_cache_path(key)
+    tmp_path = path + '.tmp%d' % os.getpid()
+    df.to_pickle(tmp_path)
+    size = os.path.getsize(tmp_path)
+    os.rename(tmp_path, path)
+
+    if _cache_size is None:
+        _cache_size = _get_dir_size()
+    else:
+        _cache_size += size
+    max_size = _get_max_size()
+    if _cache_size > max_size:
+        _cache_size = _evict(max_size)
+
+
+def _iter_cache_files():
+    cdir = get_frame_cache_dir()
+    for fname in os.listdir(cdir):
+        if not fname.endswith(FRAME_CACHE_EXT):
+            continue
+        path = os.path.join(cdir, fname)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        yield path, st
+
+
+def _get_dir_size():
+    return sum([st.st_size for _, st in _iter_cache_files()])
+
+
+def _evict(max_size):
+    """Remove least recently used frames until 3/4 of max size is left."""
+    files = sorted(_iter_cache_files(), key=lambda f: f[1].st_mtime)
+    size = sum([st.st_size for _, st in files])
+    for path, st in files:
+        if size <= max_size * 3 / 4:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        size -= st.st_size
+    return size
@@ -10,7 +10,7 @@ import codecs
 from markdown import markdown
 
 from wzdat.util import div, remove_ansicolor, ipython_start_script_path,\
-    ansi_escape
+    ansi_escape, is_dashboard_notebook
 from wzdat import rundb
 from wzdat.const import IPYNB_VER
 from wzdat.notebook_runner import NoDataFound
@@ -21,7 +21,8 @@ CRON_PTRN =\
 IGNORE_DIRS = ('.ipynb_checkpoints', '.git')
 
 from nbformat import read, NotebookNode, write, reads
-from wzdat.notebook_runner import NotebookRunner, NotebookError
+from wzdat.notebook_runner import NotebookError
+from wzdat.kernel_pool import pooled_runner, discard_kernel
 
 
 def run_code(runner, code):
@@ -110,42 +111,48 @@ def update_notebook_by_run(path):
     rundb.reset_run(path)
     logging.debug(u'update_notebook_by_run {}'.format(path))
 
-    # init runner
     with codecs.open(path, 'r', 'utf8') as fp:
         nb = read(fp, IPYNB_VER)
-    r = NotebookRunner(nb)
-    r.clear_outputs()
-
-    # run config & startup
-    run_init(r, path)
-
-    # run cells
-    cellcnt = r.cellcnt
-    rundb.start_run(path, cellcnt)
-    err = None
-    memory_used = []
-    try:
-        r.run_notebook(memory_used, lambda cur: _progress_cell(path, cur))
-        run_code(r, "if 'manifest_' in globals() and manifest_ is not None: "
-                 "manifest_._check_output_hdf()")
-    except NotebookError, e:
-        logging.debug("except NotebookError")
-        err = unicode(e)
-    except NoDataFound, e:
-        logging.debug(unicode(e))
-        with codecs.open(path, 'w', 'utf8') as fp:
-            write(r.nb, fp, IPYNB_VER)
-    else:
-        with codecs.open(path, 'w', 'utf8') as fp:
-            write(r.nb, fp, IPYNB_VER)
-    finally:
-        logging.debug("update_notebook_by_run finally")
-        max_mem = max(memory_used)
-        elapsed = rundb.finish_run(path, err)
-        run_code(r, u"if 'manifest_' in globals() and manifest_ is not None: "
-                 u"manifest_._write_result({}, {}, '''{}''')".
-                 format(elapsed, max_mem, err))
-        return err
+    # runner on a warm kernel, which has run config & startup
+    with pooled_runner(nb, path) as r:
+        r.clear_outputs()
+
+        # run cells
+        cellcnt = r.cellcnt
+        rundb.start_run(path, cellcnt)
+        err = None
+        done = False
+        memory_used = []
+        try:
+            r.run_notebook(memory_used, lambda cur: _progress_cell(path,
+                                                                   cur))
+            run_code(r, "if 'manifest_' in globals() and manifest_ is not "
+                     "None: manifest_._check_output_hdf()")
+        except NotebookError, e:
+            logging.debug("except NotebookError")
+            err = unicode(e)
+        except NoDataFound, e:
+            logging.debug(unicode(e))
+            with codecs.open(path, 'w', 'utf8') as fp:
+                write(r.nb, fp, IPYNB_VER)
+            _prefill_outputs_html(path)
+            done = True
+        else:
+            with codecs.open(path, 'w', 'utf8') as fp:
+                write(r.nb, fp, IPYNB_VER)
+            _prefill_outputs_html(path)
+            done = True
+        finally:
+            logging.debug("update_notebook_by_run finally")
+            if not done:
+                # failed notebook could leave kernel in a bad state
+                discard_kernel(r)
+            max_mem = max(memory_used)
+            elapsed = rundb.finish_run(path, err)
+            run_code(r, u"if 'manifest_' in globals() and manifest_ is not "
+                     u"None: manifest_._write_result({}, {}, '''{}''')".
+                     format(elapsed, max_mem, err))
+            return err
 
 
 def run_notebook_view_cell(rv, r, cell, idx):
@@ -212,7 +219,32 @@ def _parse_notebook_name(paths, scheds, groups, fnames, path, pjob, static):
             fnames.append(fname)
 
 
-def notebook_outputs_to_html(path):
+def notebook_outputs_to_html(path, use_cache=True):
+    """Return dashboard html of notebook outputs.
+
+    Rendered html is cached in redis by notebook file size and modified
+    time.
+
+    """
+    if not use_cache:
+        return _notebook_outputs_to_html(path)
+    # stat before read, not to cache old html for new stamp
+    st = os.stat(path.encode('utf8'))
+    stamp = st.st_size, st.st_mtime
+    html = rundb.get_outputs_html(path, stamp)
+    if html is None:
+        html = _notebook_outputs_to_html(path)
+        rundb.set_outputs_html(path, stamp, html)
+    return html
+
+
+def _prefill_outputs_html(path):
+    """Render dashboard html ahead, after run of dashboard notebook."""
+    if is_dashboard_notebook(path):
+        notebook_outputs_to_html(path)
+
+
+def _notebook_outputs_to_html(path):
     logging.debug('notebook_outputs_to_html {}'.format(path.encode('utf-8')))
     rv = []
     with codecs.open(path, 'r', 'utf8') as f:
@@ -1,30 +1,49 @@
 import os
+import time
 import logging
 
 import argh
 
-from wzdat.rundb import flush_unhandled_events, unhandled_events, iter_run_info
+from wzdat.rundb import pop_unhandled_events, parse_event, iter_run_info,\
+    subscribe_events
 from wzdat.const import FORWARDER_LOG_PREFIX
 from wzdat.make_config import make_config
-from wzdat.ipynb_runner import update_notebook_by_run, NoDataFound
+from wzdat.ipynb_runner import update_notebook_by_run, NoDataFound,\
+    IGNORE_DIRS
 from wzdat.util import gen_dummydata as _gen_dummydata, cache_files,\
-    cache_finder, get_notebook_dir
+    cache_finder, get_notebook_dir, register_cron_notebooks
 from wzdat.nbdependresolv import update_all_notebooks
+from wzdat.catalog import apply_file_events, CatalogInconsistent
+from wzdat.convert import convert_event_files
+from wzdat.event import NOTEBOOK_CHANGE
 
 cfg = make_config()
 
+DAEMON_PERIOD = 60
+# minimum seconds between notebook updates
+UPDATE_INTERVAL = 60
+# wait this long for following events, to handle a burst of them at once
+EVENT_SETTLE = 0.5
+
 
 def _remove_forwarder_file(es):
-    return [e for e in es if FORWARDER_LOG_PREFIX not in e[3]]
+    return [e for e in es if FORWARDER_LOG_PREFIX not in e[2]]
 
 
 def check_cache():
-    # TODO: remove when file-wise caching done
-    es = _remove_forwarder_file(unhandled_events())
+    '''Apply file events to cache, rescan all files only when needed.'''
+    es = [parse_event(e) for e in pop_unhandled_events()]
+    es = _remove_forwarder_file(es)
     if len(es) > 0:
         logging.info(u"update cache for: {}".format(es))
-        cache_all()
-        flush_unhandled_events()
+        events = [(e[1], e[2]) for e in es]
+        # convert ahead, not to block next load_info
+        convert_event_files(events)
+        try:
+            apply_file_events(events)
+        except CatalogInconsistent, e:
+            logging.warning(u"rescan all files - {}".format(e))
+            cache_all()
 
 
 def update_notebooks():
@@ -43,11 +62,109 @@ def cache_all():
 
 
 def register_cron():
-    from wzdat.util import register_cron_notebooks
     logging.debug("register_cron")
     paths, scheds = register_cron_notebooks()
 
 
+def _wait_events(pubsub, timeout):
+    '''Return set of event types notified within timeout. Return as soon as
+    notified events settle.'''
+    etypes = set()
+    deadline = time.time() + timeout
+    wait = timeout
+    while wait > 0:
+        msg = pubsub.get_message(timeout=wait)
+        if msg is not None and msg['type'] == 'message':
+            etypes.add(msg['data'])
+            deadline = min(deadline, time.time() + EVENT_SETTLE)
+        wait = deadline - time.time()
+    return etypes
+
+
+def _notebook_stamps():
+    '''Return modified times of notebooks and manifests by path.'''
+    rv = {}
+    for root, dirs, files in os.walk(get_notebook_dir().encode('utf8')):
+        dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
+        for fname in files:
+            if not fname.endswith('.ipynb'):
+                continue
+            path = os.path.join(root, fname)
+            try:
+                rv[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+    return rv
+
+
+class _Daemon(object):
+
+    """Jobs of daemon to run on each wake up.
+
+    Cache is checked on every wake up, but notebooks are updated at most
+    once per `interval`, so that notebooks depending on growing logs don't
+    run back to back.
+
+    """
+
+    def __init__(self, period, interval):
+        self.period = period
+        self.interval = interval
+        self.crons = None
+        self.last_update = 0
+        self.pending = False
+        # notebook stamps after own update, to ignore changes made by it
+        self.own_stamps = None
+
+    def run(self, etypes):
+        '''Run jobs for notified event types, or all jobs if none, and
+        return seconds to wait for next events.'''
+        logging.debug(u"daemon wakes up by {}".format(list(etypes)))
+        periodic = len(etypes) == 0
+        if NOTEBOOK_CHANGE in etypes and\
+                _notebook_stamps() == self.own_stamps:
+            etypes = etypes - set([NOTEBOOK_CHANGE])
+        try:
+            check_cache()
+            if periodic or NOTEBOOK_CHANGE in etypes:
+                self.crons = register_cron_notebooks(self.crons)
+        except Exception:
+            logging.exception("daemon jobs fail")
+        self.pending = self.pending or periodic or len(etypes) > 0
+        if self.pending and time.time() - self.last_update >= self.interval:
+            self.pending = False
+            self.last_update = time.time()
+            try:
+                update_notebooks()
+            except Exception:
+                logging.exception("daemon update_notebooks fail")
+            self.own_stamps = _notebook_stamps()
+        if self.pending:
+            return max(0, min(self.period, self.last_update + self.interval -
+                              time.time()))
+        return self.period
+
+
+@argh.arg('-p', '--period', type=int, help="seconds between periodic runs "
+          "without events. if skipped, cfg['daemon_period'] or 60.")
+def daemon(**kwargs):
+    '''Check cache and register crons on events, and update notebooks at
+    most once per cfg['notebook_update_interval'] seconds, in one resident
+    process.'''
+    period = kwargs['period']
+    if period is None:
+        period = cfg['daemon_period'] if 'daemon_period' in cfg else\
+            DAEMON_PERIOD
+    interval = cfg['notebook_update_interval'] if 'notebook_update_interval'\
+        in cfg else UPDATE_INTERVAL
+    pubsub = subscribe_events()
+    jobs = _Daemon(period, interval)
+    etypes = set()
+    while True:
+        wait = jobs.run(etypes)
+        etypes = _wait_events(pubsub, wait)
+
+
 @argh.arg('path', help="notebook path")
 def run_notebook(path):
     assert path[0] == '/', "Need absolute path"
@@ -85,4 +202,4 @@ def run_info():
 if __name__ == "__main__":
     argh.dispatch_commands([cache_all, register_cron, run_notebook,
                             gen_dummydata, register_event, check_cache,
-                            update_notebooks, run_info])
+                            update_notebooks, run_info, daemon])
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Pool of warm kernels for notebook runners.
+
+Starting a kernel and running ipython startup script, which imports pandas,
+matplotlib and seaborn, takes seconds. Kernels of the pool are started and
+have run the startup script before they are handed out, so that running the
+script again for a notebook only builds its manifest.
+
+Returned kernels are reset to the state right after their start: user
+namespace, working directory, `sys.path` and matplotlib rcParams. Kernels
+are recycled after `KERNEL_MAX_USES` uses, when their memory exceeds
+'kernel_mem_limit' config, or when a notebook failed on them. A pool is kept
+per process, and pool size is 'kernel_pool_size' config. Size 0 disables
+pool.
+
+"""
+
+import os
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+import psutil
+
+from wzdat.make_config import make_config
+from wzdat.notebook_runner import NotebookRunner, kernel_args, start_kernel,\
+    shutdown_kernel
+from wzdat.util import sizeof_fmt
+
+KERNEL_POOL_SIZE = 2
+KERNEL_MEM_LIMIT = 2 * 1024 * 1024 * 1024
+KERNEL_MAX_USES = 100
+# notebook path for warming, which has no manifest
+WARMUP_NBPATH = u'__warmup__.ipynb'
+# kept in shell object, which survives reset
+SNAPSHOT_CODE = """import os, sys
+get_ipython()._wzdat_state = (os.getcwd(), list(sys.path), dict(
+    sys.modules['matplotlib'].rcParams) if 'matplotlib' in sys.modules else
+    None)
+del os, sys"""
+RESET_CODE = "get_ipython().reset(new_session=False)\n"
+# reset clears names imported by '--pylab'
+PYLAB_CODE = "get_ipython().enable_pylab('inline', import_all=True)\n"
+RESTORE_CODE = """import os, sys
+_cwd, _path, _rc = get_ipython()._wzdat_state
+os.chdir(_cwd)
+sys.path[:] = _path
+if 'matplotlib' in sys.modules:
+    if _rc is None:
+        sys.modules['matplotlib'].rc_file_defaults()
+    else:
+        sys.modules['matplotlib'].rcParams.update(_rc)
+del os, sys, _cwd, _path, _rc"""
+
+
+class _Kernel(object):
+    def __init__(self, args):
+        self.args = args
+        self.km, self.kc = start_kernel(list(args))
+        self.uses = 0
+        self.failed = False
+        _run_code(self, SNAPSHOT_CODE)
+
+    @property
+    def memory(self):
+        """Return resident memory of kernel process in bytes."""
+        return psutil.Process(self.km.kernel.pid).memory_info().rss
+
+    def shutdown(self):
+        try:
+            shutdown_kernel((self.km, self.kc))
+        except Exception, e:
+            logging.warning(u"kernel shutdown fail: {}".format(e))
+
+
+class KernelPool(object):
+
+    """Warm kernels by kernel arguments."""
+
+    def __init__(self, size=None, mem_limit=None):
+        cfg = make_config()
+        if size is None:
+            size = cfg['kernel_pool_size'] if 'kernel_pool_size' in cfg else\
+                KERNEL_POOL_SIZE
+        if mem_limit is None:
+            mem_limit = cfg['kernel_mem_limit'] if 'kernel_mem_limit' in cfg\
+                else KERNEL_MEM_LIMIT
+        self.size = size
+        self.mem_limit = mem_limit
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _warm_kernel(self, args):
+        """Start a kernel and run startup script on it."""
+        from wzdat.ipynb_runner import run_init
+        kernel = _Kernel(args)
+        r = NotebookRunner(None, kernel=(kernel.km, kernel.kc))
+        try:
+            run_init(r, WARMUP_NBPATH)
+        except Exception:
+            kernel.shutdown()
+            raise
+        finally:
+            r.detach()
+        return kernel
+
+    def warm(self, pylab=False, mpl_inline=False):
+        """Start kernels up to pool size."""
+        args = tuple(kernel_args(pylab, mpl_inline))
+        while True:
+            with self._lock:
+                if len(self._idle.get(args, [])) >= self.size:
+                    return
+            kernel = self._warm_kernel(args)
+            with self._lock:
+                self._idle.setdefault(args, []).append(kernel)
+
+    def _pop(self, args):
+        with self._lock:
+            kernels = self._idle.get(args, [])
+            while len(kernels) > 0:
+                kernel = kernels.pop()
+                if kernel.km.is_alive():
+                    return kernel
+                logging.debug("drop dead kernel")
+        return None
+
+    def acquire(self, nb, nbpath, pylab=False, mpl_inline=False):
+        """Return NotebookRunner on a warm kernel, which has run startup
+        script for the notebook."""
+        from wzdat.ipynb_runner import run_init
+        args = tuple(kernel_args(pylab, mpl_inline))
+        kernel = self._pop(args)
+        if kernel is None:
+            # startup script runs below anyway
+            kernel = _Kernel(args)
+        kernel.uses += 1
+        r = NotebookRunner(nb, kernel=(kernel.km, kernel.kc))
+        r._kernel = kernel
+        try:
+            run_init(r, nbpath)
+        except Exception:
+            self.release(r, False)
+            raise
+        return r
+
+    def release(self, r, reuse=True):
+        """Take kernel back from runner, to reset and reuse or recycle it."""
+        kernel = r._kernel
+        r.detach()
+        if reuse and self.size > 0 and kernel.uses < KERNEL_MAX_USES and\
+                not kernel.failed and kernel.km.is_alive():
+            try:
+                code = RESET_CODE
+                if '--pylab=inline' in kernel.args:
+                    code += PYLAB_CODE
+                _run_code(kernel, code + RESTORE_CODE)
+                mem = kernel.memory
+            except Exception, e:
+                logging.warning(u"kernel reset fail: {}".format(e))
+            else:
+                if mem <= self.mem_limit:
+                    with self._lock:
+                        kernels = self._idle.setdefault(kernel.args, [])
+                        if len(kernels) < self.size:
+                            kernels.append(kernel)
+                            return
+                else:
+                    logging.debug(u"recycle kernel of {}".format(
+                        sizeof_fmt(mem)))
+        kernel.shutdown()
+
+    def shutdown(self):
+        """Shut down all idle kernels."""
+        with self._lock:
+            kernels = [k for ks in self._idle.itervalues() for k in ks]
+            self._idle = {}
+        for kernel in kernels:
+            kernel.shutdown()
+
+
+def _run_code(kernel, code):
+    from wzdat.ipynb_runner import run_code
+    r = NotebookRunner(None, kernel=(kernel.km, kernel.kc))
+    try:
+        run_code(r, code)
+    finally:
+        r.detach()
+
+
+def discard_kernel(r):
+    """Don't reuse kernel of pooled runner, after the notebook failed."""
+    r._kernel.failed = True
+
+
+_pool = None
+_pool_pid = None
+
+
+def get_pool():
+    """Return kernel pool of this process."""
+    global _pool, _pool_pid
+    # forked process can't share kernel channels
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = KernelPool()
+        _pool_pid = os.getpid()
+    return _pool
+
+
+@contextmanager
+def pooled_runner(nb, nbpath, pylab=False, mpl_inline=False):
+    """Yield NotebookRunner on a warm kernel, and return the kernel to pool.
+
+    Kernel is not reused if running fails with exception.
+
+    """
+    pool = get_pool()
+    r = pool.acquire(nb, nbpath, pylab, mpl_inline)
+    try:
+        yield r
+    except:
+        pool.release(r, False)
+        raise
+    else:
+        pool.release(r)
+
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown()
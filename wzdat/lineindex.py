@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Line offset index of files.
+
+Keep offsets of newlines in a file as numpy uint64 array, so that a line or
+lines can be read by seeking. Index of a file larger than
+'line_index_min_size' config(bytes, default 1MB) is saved into the cache
+directory by its path, size and modified time.
+
+Offsets of compressed file are of decompressed data. Gzip file is read from
+the nearest checkpoint of `GzipSeeker`, zstd file from the start.
+
+"""
+
+import os
+import hashlib
+import logging
+
+import numpy as np
+
+from wzdat.make_config import make_config
+from wzdat.util import get_line_index_dir
+from wzdat.compress import is_compressed, open_data, GzipSeeker, GZIP_EXT
+
+READ_BUF_SIZE = 16 * 1024 * 1024
+DEFAULT_MIN_SIZE = 1024 * 1024
+
+
+def _get_min_size():
+    cfg = make_config()
+    return cfg['line_index_min_size'] if 'line_index_min_size' in cfg else\
+        DEFAULT_MIN_SIZE
+
+
+def _get_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+def _get_index_path(path):
+    name = hashlib.md5(path).hexdigest()
+    return os.path.join(get_line_index_dir(), name + '.npz')
+
+
+def _iter_bufs(f):
+    while True:
+        buf = f.read(READ_BUF_SIZE)
+        if not buf:
+            break
+        yield buf
+
+
+def _scan_bufs(bufs, pos):
+    offs = []
+    last = '\n'
+    for buf in bufs:
+        arr = np.frombuffer(buf, dtype=np.uint8)
+        offs.append(np.flatnonzero(arr == 10).astype(np.uint64) + pos)
+        pos += len(buf)
+        last = buf[-1]
+    if last != '\n':
+        # last line without newline ends at EOF
+        offs.append(np.array([pos - 1], dtype=np.uint64))
+    if len(offs) == 0:
+        return np.empty(0, dtype=np.uint64)
+    return np.concatenate(offs)
+
+
+def scan_newlines(path, start=0, seeker=None):
+    """Return offsets of newlines in a file from start offset.
+
+    Last byte offset is appended if the file does not end with newline, as
+    the end of the last line.
+
+    Compressed file is scanned from the start, taking checkpoints of seeker
+    if given.
+
+    """
+    if seeker is not None:
+        return _scan_bufs(seeker.scan(), 0)
+    if is_compressed(path):
+        with open_data(path) as f:
+            return _scan_bufs(_iter_bufs(f), 0)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return _scan_bufs(_iter_bufs(f), start)
+
+
+def _load_index(ipath, stamp):
+    if not os.path.isfile(ipath):
+        return None
+    try:
+        data = np.load(ipath)
+        if tuple(data['stamp']) == stamp:
+            return data['offsets']
+    except Exception, e:
+        logging.warning(u"_load_index - ignore broken index: {}".format(e))
+    return None
+
+
+def _save_index(ipath, stamp, offs):
+    tmp_path = ipath + '.tmp%d.npz' % os.getpid()
+    np.savez(tmp_path, stamp=np.array(stamp, dtype=np.float64),
+             offsets=offs)
+    os.rename(tmp_path, ipath)
+
+
+def get_line_offsets(path, seeker=None):
+    """Return stamp and newline offsets of the file.
+
+    Parameters
+    ----------
+    path : string
+        Real path to the file.
+    seeker : GzipSeeker
+        Seeker to take checkpoints, for gzip file.
+
+    Returns
+    -------
+    tuple
+        (size, modified time) of the file, and newline offsets array.
+        Line i is in [offsets[i - 1] + 1, offsets[i] + 1) bytes.
+
+    """
+    stamp = _get_stamp(path)
+    persist = stamp[0] >= _get_min_size()
+    if persist:
+        ipath = _get_index_path(path)
+        offs = _load_index(ipath, stamp)
+        if offs is not None:
+            return stamp, offs
+    offs = scan_newlines(path, seeker=seeker)
+    if persist:
+        _save_index(ipath, stamp, offs)
+    return stamp, offs
+
+
+class LineIndex(object):
+
+    """Line offset index of a file, refreshed when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = None
+        self._offs = None
+        self._seeker = GzipSeeker(path) if path.endswith(GZIP_EXT) else None
+
+    @property
+    def offsets(self):
+        if self._offs is None or self._stamp != _get_stamp(self.path):
+            if self._seeker is not None:
+                self._seeker.reset()
+            self._stamp, self._offs = get_line_offsets(self.path,
+                                                       self._seeker)
+        return self._offs
+
+    @property
+    def count(self):
+        return len(self.offsets)
+
+    def byte_range(self, idx1, idx2):
+        """Return byte range of lines from idx1 to idx2(exclusive)."""
+        offs = self.offsets
+        start = 0 if idx1 == 0 else int(offs[idx1 - 1]) + 1
+        end = start if idx2 <= idx1 else int(offs[idx2 - 1]) + 1
+        return start, end
+
+    def read(self, idx1, idx2):
+        """Return bytes of lines from idx1 to idx2(exclusive)."""
+        start, end = self.byte_range(idx1, idx2)
+        return ''.join(self._iter_range(start, end))
+
+    def copy(self, idx1, idx2, out):
+        """Write lines from idx1 to idx2(exclusive) into out file."""
+        start, end = self.byte_range(idx1, idx2)
+        for buf in self._iter_range(start, end):
+            out.write(buf)
+
+    def _iter_range(self, start, end):
+        if self._seeker is not None:
+            for buf in self._seeker.iter_range(start, end):
+                yield buf
+            return
+        with open_data(self.path) as f:
+            if is_compressed(self.path):
+                # no seeking, skip decompressed
+                _skip(f, start)
+            else:
+                f.seek(start)
+            remain = end - start
+            while remain > 0:
+                buf = f.read(min(remain, READ_BUF_SIZE))
+                if not buf:
+                    break
+                yield buf
+                remain -= len(buf)
+
+
+def _skip(f, size):
+    while size > 0:
+        buf = f.read(min(size, READ_BUF_SIZE))
+        if not buf:
+            break
+        size -= len(buf)
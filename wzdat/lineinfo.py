@@ -2,10 +2,25 @@ import os
 import types
 import cPickle
 
+import numpy as np
+
 from wzdat.base import IListable
 from wzdat.util import unique_list, get_slice_idx, normalize_idx
 from wzdat.const import SAVE_INFO_EXT
 
+CODE_DTYPE = np.int32
+SINFO_VER = 2
+# impl types of saved info
+SINFO_COUNT = 0
+SINFO_ARRAY = 1
+
+
+class UnsupportedLineInfo(Exception):
+
+    """Raise when saved line info is of other version."""
+
+    pass
+
 
 class LineInfo(IListable):
     def __init__(self, impl=None):
@@ -82,21 +97,27 @@ class LineInfo(IListable):
             rv += impl.files
         return rv
 
+    def _unique(self, attr):
+        rv = []
+        for impl in self.impls:
+            rv += getattr(impl, attr)
+        return unique_list(rv)
+
     @property
     def unique_nodes(self):
-        return unique_list(self.nodes)
+        return self._unique('unique_nodes')
 
     @property
     def unique_kinds(self):
-        return unique_list(self.kinds)
+        return self._unique('unique_kinds')
 
     @property
     def unique_dates(self):
-        return unique_list(self.dates)
+        return self._unique('unique_dates')
 
     @property
     def unique_files(self):
-        return unique_list(self.files)
+        return self._unique('unique_files')
 
     def __getslice__(self, idx1, idx2):
         return self._slice(slice(idx1, idx2))
@@ -134,10 +155,10 @@ class LineInfo(IListable):
         return LineInfo(impls)
 
     def save(self, tmppath):
+        """Save line infos as dictionary encoded code arrays."""
         sinfopath = tmppath + SAVE_INFO_EXT
-        with open(sinfopath, 'w') as f:
-            sinfo = LineInfo_SInfo(self)
-            cPickle.dump(sinfo, f, 2)
+        with open(sinfopath, 'wb') as f:
+            np.savez(f, **_sinfo_arrays(self.impls))
 
     def remove_saved(self, tmppath):
         sinfopath = tmppath + SAVE_INFO_EXT
@@ -147,7 +168,13 @@ class LineInfo(IListable):
     @classmethod
     def load(self, tmppath, ctx):
         sinfopath = tmppath + SAVE_INFO_EXT
-        with open(sinfopath, 'r') as f:
+        with open(sinfopath, 'rb') as f:
+            # npz is a zip file
+            if f.read(2) == 'PK':
+                f.seek(0)
+                return LineInfo(_load_sinfo_arrays(np.load(f), ctx))
+            # pickled by older version
+            f.seek(0)
             sinfo = cPickle.load(f)
             impls = []
             for impl_info in sinfo.impl_infos:
@@ -170,6 +197,123 @@ class LineInfo(IListable):
         return not self.__eq__(o)
 
 
+def _skey(val):
+    return val.encode('utf-8') if isinstance(val, unicode) else val
+
+
+def _node_key(node):
+    return _skey(node._repr)
+
+
+def _kind_key(kind):
+    part = kind._part
+    if isinstance(part, types.ListType):
+        part = '\t'.join(part)
+    return _skey(part)
+
+
+def _date_key(date):
+    return date._sdate
+
+
+def _file_key(_file):
+    return _skey(_file.path)
+
+
+_KEY_FNS = (_node_key, _kind_key, _date_key, _file_key)
+
+
+def _sinfo_arrays(impls):
+    """Return arrays to save impls, with strings of values in dictionaries.
+    """
+    dicts = [{} for _ in _KEY_FNS]
+    strs = [[] for _ in _KEY_FNS]
+
+    def _gcodes(i, uvals):
+        # global codes of unique values
+        rv = np.empty(len(uvals), dtype=CODE_DTYPE)
+        for j, val in enumerate(uvals):
+            key = _KEY_FNS[i](val)
+            if key not in dicts[i]:
+                dicts[i][key] = len(strs[i])
+                strs[i].append(key)
+            rv[j] = dicts[i][key]
+        return rv
+
+    itypes = []
+    icounts = []
+    ccodes = []
+    acodes = [[] for _ in _KEY_FNS]
+    for impl in impls:
+        if isinstance(impl, LineInfoImpl_Count):
+            itypes.append(SINFO_COUNT)
+            vals = impl.node, impl.kind, impl.date, impl._file
+            ccodes.append([_gcodes(i, [val])[0] for i, val in
+                           enumerate(vals)])
+        else:
+            itypes.append(SINFO_ARRAY)
+            for i in range(len(_KEY_FNS)):
+                gcodes = _gcodes(i, impl._uvals[i])
+                acodes[i].append(gcodes[impl._codes[i]])
+        icounts.append(impl.count)
+
+    arrays = dict(ver=np.array([SINFO_VER]),
+                  itypes=np.array(itypes, dtype=np.int8),
+                  icounts=np.array(icounts, dtype=np.int64),
+                  ccodes=np.array(ccodes, dtype=CODE_DTYPE).reshape(-1, 4))
+    for i, name in enumerate(('node', 'kind', 'date', 'file')):
+        arrays['strs_' + name] = np.array(strs[i], dtype=str)
+        arrays['acodes_' + name] = np.concatenate(acodes[i]) if\
+            len(acodes[i]) > 0 else np.empty(0, dtype=CODE_DTYPE)
+    return arrays
+
+
+def _live_values(strs, vals, key_fn):
+    """Return live values for saved strings. Missing ones are None."""
+    vmap = {}
+    for val in vals:
+        vmap[key_fn(val)] = val
+    return [vmap.get(key) for key in strs.tolist()]
+
+
+def _load_sinfo_arrays(data, ctx):
+    """Return impls from saved arrays, with values of the context."""
+    ver = int(data['ver'][0]) if 'ver' in data.files else None
+    if ver != SINFO_VER:
+        # codes could mean other things
+        raise UnsupportedLineInfo("Saved line info version {} is not {}. "
+                                  "Save it again.".format(ver, SINFO_VER))
+    lvals = [_live_values(data['strs_node'], set([f.node for f in
+                                                   ctx.files]), _node_key),
+             _live_values(data['strs_kind'], set([f.kind for f in
+                                                   ctx.files]), _kind_key),
+             _live_values(data['strs_date'], set([f.date for f in
+                                                   ctx.files]), _date_key),
+             _live_values(data['strs_file'], ctx.files, _file_key)]
+    acodes = [data['acodes_' + name] for name in ('node', 'kind', 'date',
+                                                   'file')]
+    ccodes = data['ccodes']
+    impls = []
+    ci = 0
+    at = 0
+    for itype, cnt in zip(data['itypes'], data['icounts']):
+        if itype == SINFO_COUNT:
+            vals = [lvals[i][ccodes[ci][i]] for i in range(4)]
+            impls.append(LineInfoImpl_Count(*(vals + [int(cnt)])))
+            ci += 1
+            continue
+        uvals = []
+        codes = []
+        for i in range(4):
+            ucodes, inv = np.unique(acodes[i][at:at + cnt],
+                                    return_inverse=True)
+            uvals.append([lvals[i][c] for c in ucodes])
+            codes.append(inv.astype(CODE_DTYPE))
+        impls.append(LineInfoImpl_Array.from_codes(uvals, codes))
+        at += cnt
+    return impls
+
+
 class LineInfo_SInfo(object):
     """Serialize Info"""
     def __init__(self, linfo):
@@ -321,11 +465,11 @@ class LineInfoImpl_Count(ILineInfoImpl):
 
     @property
     def unique_dates(self):
-        return (self.dates,)
+        return (self.date,)
 
     @property
     def unique_files(self):
-        return (self.files,)
+        return (self._file,)
 
     def make_sinfo(self):
         return LineInfoImpl_Count_SInfo(self)
@@ -366,22 +510,65 @@ class LineInfoImpl_Count_SInfo(ILineInfoImpl_SInfo):
         return impl_cls(node, kind, date, _file, self.count)
 
 
+def _encode(vals):
+    """Return unique values and code array of values."""
+    uvals = []
+    idxmap = {}
+    codes = np.empty(len(vals), dtype=CODE_DTYPE)
+    for i, val in enumerate(vals):
+        key = id(val)
+        if key not in idxmap:
+            idxmap[key] = len(uvals)
+            uvals.append(val)
+        codes[i] = idxmap[key]
+    return uvals, codes
+
+
+def _decode(uvals, codes):
+    arr = np.empty(len(uvals), dtype=object)
+    for i, val in enumerate(uvals):
+        arr[i] = val
+    return arr[codes].tolist()
+
+
+def _unique_codes(codes):
+    """Return unique codes in order of appearance."""
+    ucodes, idx = np.unique(codes, return_index=True)
+    return ucodes[np.argsort(idx)]
+
+
 class LineInfoImpl_Array(ILineInfoImpl):
+    """Line infos as code arrays into unique node, kind, date and file lists.
+    """
     def __init__(self, nodes, kinds, dates, files):
-        self._nodes = nodes
-        self._kinds = kinds
-        self._dates = dates
-        self._files = files
         nodecnt = len(nodes)
         kindcnt = len(kinds)
         datecnt = len(dates)
         filecnt = len(files)
         assert(nodecnt == kindcnt and kindcnt == datecnt and datecnt ==
                filecnt)
+        self._uvals = []
+        self._codes = []
+        for vals in (nodes, kinds, dates, files):
+            uvals, codes = _encode(vals)
+            self._uvals.append(uvals)
+            self._codes.append(codes)
+
+    @classmethod
+    def from_codes(cls, uvals, codes):
+        """Make impl from unique value lists and code arrays of node, kind,
+        date and file, without encoding."""
+        impl = cls.__new__(cls)
+        impl._uvals = uvals
+        impl._codes = codes
+        return impl
+
+    def __len__(self):
+        return self.count
 
     @property
     def count(self):
-        return len(self._nodes)
+        return len(self._codes[0])
 
     def __iter__(self):
         self._at = -1
@@ -391,60 +578,72 @@ class LineInfoImpl_Array(ILineInfoImpl):
         return self._slice(slice(idx1, idx2))
 
     def _slice(self, slc):
-        return LineInfoImpl_Array(self._nodes[slc], self._kinds[slc],
-                                  self._dates[slc], self._files[slc])
+        return LineInfoImpl_Array.from_codes(self._uvals,
+                                             [codes[slc] for codes in
+                                              self._codes])
+
+    def take(self, indices):
+        """Return impl of lines at given indices."""
+        return LineInfoImpl_Array.from_codes(self._uvals,
+                                             [codes[indices] for codes in
+                                              self._codes])
+
+    def _line(self, idx):
+        return tuple([uvals[codes[idx]] for uvals, codes in
+                      zip(self._uvals, self._codes)])
 
     def next(self):
         """Return next file for iteration."""
         self._at += 1
         if self.count > self._at:
-            i = self._at
-            return self._nodes[i], self._kinds[i], self._dates[i], \
-                self._files[i]
+            return self._line(self._at)
         else:
             self._at = -1
             raise StopIteration()
 
     def __getitem__(self, idx):
         if isinstance(idx, types.SliceType):
-            raise NotImplementedError("Not implemented")
+            return self._slice(idx)
         idx = normalize_idx(idx, self.count)
         if self.count > idx:
-            return self._nodes[idx], self._kinds[idx], self._dates[idx], \
-                self._files[idx]
+            return self._line(idx)
         raise IndexError
 
     @property
     def nodes(self):
-        return self._nodes
+        return _decode(self._uvals[0], self._codes[0])
 
     @property
     def kinds(self):
-        return self._kinds
+        return _decode(self._uvals[1], self._codes[1])
 
     @property
     def dates(self):
-        return self._dates
+        return _decode(self._uvals[2], self._codes[2])
 
     @property
     def files(self):
-        return self._files
+        return _decode(self._uvals[3], self._codes[3])
+
+    def _unique(self, i):
+        uvals = self._uvals[i]
+        return unique_list([uvals[c] for c in _unique_codes(self._codes[i])])
 
     @property
     def unique_nodes(self):
-        return unique_list(self.nodes)
+        return self._unique(0)
 
     @property
     def unique_kinds(self):
-        return unique_list(self.kinds)
+        return self._unique(1)
 
     @property
     def unique_dates(self):
-        return unique_list(self.files)
+        return self._unique(2)
 
     @property
     def unique_files(self):
-        return unique_list(self.files)
+        return self._unique(3)
 
     def make_sinfo(self):
         return LineInfoImpl_Array_SInfo(self)
@@ -460,48 +659,33 @@ class LineInfoImpl_Array(ILineInfoImpl):
 class LineInfoImpl_Array_SInfo(ILineInfoImpl_SInfo):
     def __init__(self, impl):
         super(LineInfoImpl_Array_SInfo, self).__init__(impl)
-        # save string representation of unique values
-        unodes = [node._repr for node in impl.unique_nodes]
-        ukinds = [kind._part for kind in impl.unique_kinds]
-        udates = [date._sdate for date in impl.unique_dates]
-        ufiles = [_file.path for _file in impl.unique_files]
-
-        nodeidx = {name: idx for idx, name in enumerate(unodes)}
-        kindidx = {name: idx for idx, name in enumerate(ukinds)}
-        dateidx = {name: idx for idx, name in enumerate(udates)}
-        fileidx = {name: idx for idx, name in enumerate(ufiles)}
-
-        self.nodes = [nodeidx[node._repr] for node in impl.nodes]
-        self.kinds = [kindidx[kind._part] for kind in impl.kinds]
-        self.dates = [dateidx[date._sdate] for date in impl.dates]
-        self.files = [fileidx[_file.path] for _file in impl.files]
-
-        self.nodemap = {idx: name for idx, name in enumerate(unodes)}
-        self.kindmap = {idx: name for idx, name in enumerate(ukinds)}
-        self.datemap = {idx: name for idx, name in enumerate(udates)}
-        self.filemap = {idx: name for idx, name in enumerate(ufiles)}
+        # save string representation of unique values and codes
+        unodes, ukinds, udates, ufiles = impl._uvals
+        self.nodemap = dict(enumerate([node._repr for node in unodes]))
+        self.kindmap = dict(enumerate([kind._part for kind in ukinds]))
+        self.datemap = dict(enumerate([date._sdate for date in udates]))
+        self.filemap = dict(enumerate([_file.path for _file in ufiles]))
+        self.nodes, self.kinds, self.dates, self.files = impl._codes
 
     def __setstate__(self, state):
         self.__dict__.update(state)
 
-    def _find_real_values(self, _map, _indexes, nvals, attr):
+    def _find_real_values(self, _map, nvals, attr):
         newmap = {}
         for nv in nvals:
             for idx in _map:
                 if getattr(nv, attr) == _map[idx]:
                     newmap[idx] = nv
-        return [newmap[idx] for idx in _indexes]
+        return [newmap[idx] for idx in xrange(len(_map))]
 
     def make_impl(self, ctx):
-        impl_cls, nvals, svals, dvals = super(LineInfoImpl_Array.SInfo,
+        impl_cls, nvals, svals, dvals = super(LineInfoImpl_Array_SInfo,
                                               self).make_impl(ctx)
         # find real value by _part
-        nodes = self._find_real_values(self.nodemap, self.nodes, nvals,
-                                       '_repr')
-        kinds = self._find_real_values(self.kindmap, self.kinds, svals,
-                                       '_part')
-        dates = self._find_real_values(self.datemap, self.dates, dvals,
-                                       '_sdate')
-        files = self._find_real_values(self.filemap, self.files,
-                                       ctx.files, 'path')
-        return impl_cls(nodes, kinds, dates, files)
+        nodes = self._find_real_values(self.nodemap, nvals, '_repr')
+        kinds = self._find_real_values(self.kindmap, svals, '_part')
+        dates = self._find_real_values(self.datemap, dvals, '_sdate')
+        files = self._find_real_values(self.filemap, ctx.files, 'path')
+        codes = [np.asarray(c, dtype=CODE_DTYPE) for c in
+                 (self.nodes, self.kinds, self.dates, self.files)]
+        return impl_cls.from_codes([nodes, kinds, dates, files], codes)
@@ -9,12 +9,14 @@ from datetime import datetime
 import copy
 import json
 import codecs
+import cPickle
 
 from nbformat import write, read
 
 from wzdat.util import Property, get_notebook_rpath, get_notebook_dir,\
     dataframe_checksum, HDF, convert_server_time_to_client, sizeof_fmt,\
-    get_notebook_manifest_path
+    get_notebook_manifest_path, get_index_dir
+from wzdat.make_config import make_config
 from wzdat.notebook_runner import NotebookRunner, NotebookError
 from wzdat.const import HDF_CHKSUM_FMT, IPYNB_VER
 
@@ -85,9 +87,52 @@ class HDFStore(object):
                 return 0
 
 
+_parsed_cache = None
+
+
+def _get_parsed_cache_path():
+    return os.path.join(get_index_dir(), 'manifest_cache.pkl')
+
+
+def _get_parsed(path, stamp):
+    """Return cached parse result of manifest, or None if changed."""
+    global _parsed_cache
+    if _parsed_cache is None:
+        _parsed_cache = {}
+        cpath = _get_parsed_cache_path()
+        if os.path.isfile(cpath):
+            try:
+                with open(cpath, 'rb') as f:
+                    _parsed_cache = cPickle.load(f)
+            except (EOFError, ValueError, cPickle.UnpicklingError), e:
+                logging.warning(u"ignore broken manifest cache: {}".format(e))
+    entry = _parsed_cache.get(path)
+    if entry is None or entry[0] != stamp:
+        return None
+    return entry[1]
+
+
+def _put_parsed(path, stamp, parsed):
+    _parsed_cache[path] = stamp, parsed
+    cpath = _get_parsed_cache_path()
+    tmp_path = cpath + '.tmp%d' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        cPickle.dump(_parsed_cache, f, 2)
+    os.rename(tmp_path, cpath)
+
+
 class Manifest(Property):
-    def __init__(self, check_depends=True, explicit_nbpath=None):
+    def __init__(self, check_depends=True, explicit_nbpath=None,
+                 index_chksum=False):
+        """Read manifest of notebook.
+
+        With `index_chksum`, checksums of depending files are made from
+        found files cache and file index if possible, without loading file
+        infos. Then `depends.files` is not available.
+
+        """
         super(Manifest, self).__init__()
+        self._index_chksum = index_chksum
 
         if explicit_nbpath is None:
             nbdir = get_notebook_dir()
@@ -284,6 +329,21 @@ class Manifest(Property):
                         format(',\n'.join(cdepends)))
 
     def _read_manifest(self):
+        # parsed data is cached by manifest file stamp
+        st = os.stat(self._path.encode('utf8'))
+        stamp = st.st_size, st.st_mtime
+        parsed = _get_parsed(self._path, stamp)
+        if parsed is None:
+            parsed = self._parse_manifest()
+            _put_parsed(self._path, stamp, parsed)
+        mdata, chksum = copy.deepcopy(parsed)
+        if chksum is not None:
+            self._read_manifest_user_chksum_cell(chksum)
+        return mdata
+
+    def _parse_manifest(self):
+        """Return user data and generated checksum data of manifest."""
+        chksum = None
         with codecs.open(self._path, 'r', 'utf8') as f:
             nbdata = json.loads(f.read())
             cells = nbdata['cells']
@@ -299,10 +359,9 @@ class Manifest(Property):
                 elif i == 1:
                     try:
                         chksum = ast.literal_eval(''.join(cell['source']))
-                        self._read_manifest_user_chksum_cell(chksum)
                     except SyntaxError:
                         pass
-        return mdata
+        return mdata, chksum
 
     def _read_manifest_user_cell(self, cell):
         if 'outputs' in cell:
@@ -336,11 +395,33 @@ class Manifest(Property):
         _dict['depends'] = prop
 
         if 'files' in data:
-            self._load_files_depends(data, _dict)
+            chksum = self._index_files_chksum(data['files']) if\
+                self._index_chksum else None
+            if chksum is None:
+                self._load_files_depends(data, _dict)
+            else:
+                self._dep_files_chksum = chksum
 
         if 'hdf' in data:
             self._load_hdf_depends(data, prop)
 
+    def _index_files_chksum(self, files):
+        """Return checksum of depending files by file index, or None."""
+        from wzdat.fileindex import index_files_checksum
+        cfg = make_config()
+        ftypes = cfg['file_types'] if 'file_types' in cfg else []
+        multi = type(files[0]) is list
+        chksums = []
+        for afiles in files if multi else [files]:
+            _, mod, dates = self._parse_depends_files(afiles)
+            if mod not in ftypes:
+                return None
+            chksum = index_files_checksum(mod, dates)
+            if chksum is None:
+                return None
+            chksums.append(chksum)
+        return chksums if multi else chksums[0]
+
     def _load_files_depends(self, data, _dict):
         ftype = type(data['files'][0])
         if ftype is not list:
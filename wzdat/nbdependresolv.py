@@ -2,12 +2,18 @@
 """Notebook dependency resolver."""
 import os
 import logging
+from Queue import Queue
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 
 from wzdat.rundb import check_notebook_error_and_changed, reset_run,\
     get_run_info
 from wzdat.util import iter_notebook_manifest, get_notebook_dir
 from wzdat.ipynb_runner import update_notebook_by_run, NoDataFound
 from wzdat.manifest import Manifest
+from wzdat.make_config import make_config
+
+RESOLVE_WORKERS = 4
 
 
 class UnresolvedHDFDependency(Exception):
@@ -85,35 +91,109 @@ class DependencyTree(object):
                 if error is None and cur > 0 and elapsed is None:
                     reset_run(path)
 
-    def resolve(self, updaterun=False):
+    def resolve(self, updaterun=False, workers=None):
+        """Run notebooks in dependency order, and return resolved and run
+        notebooks.
+
+        Notebooks whose dependencies are resolved run concurrently in
+        `workers` threads, each on its own kernel. When a notebook fails,
+        notebooks depending on it are skipped, and kept in `failed` with it.
+
+        """
+        self.failed = []
         if len(self.notebooks) == 0:
             logging.debug("no notebooks to run.")
             return
 
         self._clear_externally_stopped()
 
+        # notebooks in topological order
+        order = []
+        for nb in self.iter_noscd_notebook():
+            if nb not in order:
+                self._resolve(nb, order, [])
+
+        if workers is None:
+            cfg = make_config()
+            workers = cfg['resolve_workers'] if 'resolve_workers' in cfg\
+                else RESOLVE_WORKERS
+        waits = dict([(nb, set(nb.depends)) for nb in order])
+        dependents = defaultdict(list)
+        for nb in order:
+            for dnb in nb.depends:
+                dependents[dnb].append(nb)
+
         resolved = []
         runs = []
-        for nb in self.iter_noscd_notebook():
-            if nb not in resolved:
-                self._resolve(updaterun, nb, resolved, runs, [])
+        done = Queue()
+        ready = [nb for nb in order if len(waits[nb]) == 0]
+        running = 0
+        pool = ThreadPool(workers)
+        try:
+            while len(ready) > 0 or running > 0:
+                results = []
+                for nb in ready:
+                    # manifests are checked in this thread, loading data
+                    # modules isn't thread safe
+                    try:
+                        need_run = self._check_resolved(updaterun, nb)
+                    except Exception:
+                        logging.exception(u"resolve fail {}".format(nb.path))
+                        results.append((nb, False, False))
+                        continue
+                    if not need_run:
+                        results.append((nb, True, False))
+                        continue
+                    pool.apply_async(self._run_notebook, (nb,),
+                                     callback=done.put)
+                    running += 1
+                ready = []
+                if len(results) == 0:
+                    results.append(done.get())
+                    running -= 1
+
+                for nb, ok, ran in results:
+                    if ran:
+                        runs.append(nb)
+                    if not ok:
+                        self._skip_dependents(nb, dependents)
+                        continue
+                    resolved.append(nb)
+                    for dnb in dependents[nb]:
+                        waits[dnb].discard(nb)
+                        if len(waits[dnb]) == 0 and dnb not in self.failed:
+                            ready.append(dnb)
+        finally:
+            pool.close()
+            pool.join()
         return resolved, runs
 
-    def _resolve(self, updaterun, notebook, resolved, runs, seen):
+    def _resolve(self, notebook, order, seen):
         seen.append(notebook)
 
         # resolve dependencies
         for dnb in notebook.depends:
-            if dnb not in resolved:
+            if dnb not in order:
                 if dnb in seen:
                     raise CircularDependency()
-                self._resolve(updaterun, dnb, resolved, runs, seen)
+                self._resolve(dnb, order, seen)
 
-        self._run_resolved(updaterun, notebook, resolved, runs)
+        order.append(notebook)
 
-    def _run_resolved(self, updaterun, notebook, resolved, runs):
-        '''Run notebook after all its dependencies resolved.'''
-        logging.debug(u"_run_resolved '{}'".format(notebook.path))
+    def _skip_dependents(self, notebook, dependents):
+        """Mark failed notebook and all notebooks depending on it."""
+        if notebook in self.failed:
+            return
+        self.failed.append(notebook)
+        for dnb in dependents[notebook]:
+            logging.warning(u"skip {} for failed {}".format(dnb.path,
+                                                            notebook.path))
+            self._skip_dependents(dnb, dependents)
+
+    def _check_resolved(self, updaterun, notebook):
+        '''Return whether notebook should run, after all its dependencies
+        resolved.'''
+        logging.debug(u"_check_resolved '{}'".format(notebook.path))
         notebook.reload_manifest()
         path = notebook.path
         # Only run when dependecies changed and notebook has no error or
@@ -123,17 +203,26 @@ class DependencyTree(object):
         if updaterun:
             # run notebook when its depends changed or had fixed after error
             if notebook.manifest._need_run:  # or (error and changed):
-                try:
-                    update_notebook_by_run(path)
-                except NoDataFound, e:
-                    logging.debug(unicode(e))
-                runs.append(notebook)
+                return True
             elif error and not changed:
-                logging.debug(u"_run_resolved - skip unfixed {}".format(path))
+                logging.debug(u"_check_resolved - skip unfixed {}".format(
+                    path))
             else:
                 logging.debug(u"no need to run")
-
-        resolved.append(notebook)
+        return False
+
+    def _run_notebook(self, notebook):
+        """Run notebook and return it, whether it's ok and True. Run in
+        worker thread."""
+        err = None
+        try:
+            err = update_notebook_by_run(notebook.path)
+        except NoDataFound, e:
+            logging.debug(unicode(e))
+        except Exception:
+            logging.exception(u"run fail {}".format(notebook.path))
+            return notebook, False, True
+        return notebook, err is None, True
 
 
 class Notebook(object):
@@ -150,7 +239,7 @@ class Notebook(object):
 
     def reload_manifest(self):
         '''Reload manifest to check to run'''
-        self.manifest = Manifest(True, self.path)
+        self.manifest = Manifest(True, self.path, True)
 
     @property
     def fname(self):
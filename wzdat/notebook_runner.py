@@ -16,7 +16,6 @@ except:
 import platform
 from time import sleep
 import logging
-import os
 
 from nbformat import NotebookNode
 from nbformat.v4.convert import upgrade_outputs
@@ -41,6 +40,47 @@ class NotebookError(Exception):
     pass
 
 
+def kernel_args(pylab=False, mpl_inline=False):
+    """Return extra arguments of kernel."""
+    args = []
+
+    if pylab:
+        args.append('--pylab=inline')
+        logging.warn('--pylab is deprecated and will be removed in a '
+                     'future version')
+    elif mpl_inline:
+        args.append('--matplotlib=inline')
+        logging.warn('--matplotlib is deprecated and will be removed in a '
+                     'future version')
+    return args
+
+
+def start_kernel(args, working_dir=None):
+    """Start a kernel and return (manager, client) of it."""
+    km = KernelManager()
+    # not by chdir, which would race with other threads
+    km.start_kernel(extra_arguments=args, cwd=working_dir)
+
+    if platform.system() == 'Darwin':
+        # There is sometimes a race condition where the first
+        # execute command hits the kernel before it's ready.
+        # It appears to happen only on Darwin (Mac OS) and an
+        # easy (but clumsy) way to mitigate it is to sleep
+        # for a second.
+        sleep(1)
+
+    kc = km.client()
+    kc.start_channels()
+    kc.wait_for_ready()
+    return km, kc
+
+
+def shutdown_kernel(kernel):
+    km, kc = kernel
+    kc.stop_channels()
+    km.shutdown_kernel(now=True)
+
+
 class NotebookRunner(object):
     # The kernel communicates with mime-types while the notebook
     # uses short labels for different cell types. We'll use this to
@@ -56,50 +96,24 @@ class NotebookRunner(object):
         'image/svg+xml': 'svg',
     }
 
-    def __init__(self, nb, pylab=False, mpl_inline=False, working_dir=None):
-        self.km = KernelManager()
-
-        args = []
-
-        if pylab:
-            args.append('--pylab=inline')
-            logging.warn('--pylab is deprecated and will be removed in a '
-                         'future version')
-        elif mpl_inline:
-            args.append('--matplotlib=inline')
-            logging.warn('--matplotlib is deprecated and will be removed in a '
-                         'future version')
-
-        cwd = os.getcwd()
-
-        if working_dir:
-            os.chdir(working_dir)
-
-        self.km.start_kernel(extra_arguments=args)
-
-        os.chdir(cwd)
-
-        if platform.system() == 'Darwin':
-            # There is sometimes a race condition where the first
-            # execute command hits the kernel before it's ready.
-            # It appears to happen only on Darwin (Mac OS) and an
-            # easy (but clumsy) way to mitigate it is to sleep
-            # for a second.
-            sleep(1)
-
-        self.kc = self.km.client()
-        self.kc.start_channels()
-        try:
-            self.kc.wait_for_ready()
-        except AttributeError:
-            # IPython < 3
-            self._wait_for_ready_backport()
-
+    def __init__(self, nb, pylab=False, mpl_inline=False, working_dir=None,
+                 kernel=None):
+        if kernel is None:
+            kernel = start_kernel(kernel_args(pylab, mpl_inline), working_dir)
+        self.km, self.kc = kernel
         self.nb = nb
 
+    def detach(self):
+        """Return (manager, client) of kernel, not to be shut down with this
+        runner."""
+        kernel = self.km, self.kc
+        self.km = self.kc = None
+        return kernel
+
     def __del__(self):
-        self.kc.stop_channels()
-        self.km.shutdown_kernel(now=True)
+        if self.km is None:
+            return
+        shutdown_kernel((self.km, self.kc))
 
     def run_cell(self, cell, cidx):
         '''
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Posting lists of file ids for selecting files by option values.
+
+Each file of a context gets a file id(`_fid`), its index in `ctx.files`, at
+`load_info`. Posting list of a value is sorted file id array of the files the
+value matches, kept by the int id(`_id`) of interned value. Date postings
+are built at load, because date values match exactly. Others are built at
+their first use with the value's own `_match`, then reused by later
+selections.
+
+"""
+
+import numpy as np
+
+from wzdat.value import Value
+
+FID_DTYPE = np.int32
+
+
+def build_postings(ctx):
+    """Assign file ids and build date postings of context."""
+    dates = {}
+    for fid, fileo in enumerate(ctx.files):
+        fileo._fid = fid
+        _id = getattr(getattr(fileo, 'date', None), '_id', None)
+        if _id is not None:
+            dates.setdefault(_id, []).append(fid)
+    ctx.postings = dict([(key, np.array(fids, dtype=FID_DTYPE)) for key, fids
+                         in dates.iteritems()])
+
+
+def has_postings(ctx, files):
+    """Return whether files can be selected by postings of context."""
+    if 'postings' not in ctx.dict:
+        return False
+    cfiles = ctx.files
+    for fileo in files:
+        fid = getattr(fileo, '_fid', None)
+        if fid is None or fid >= len(cfiles) or cfiles[fid] is not fileo:
+            return False
+    return True
+
+
+def get_posting(ctx, oval):
+    """Return sorted ids of files matching the option value."""
+    _id = getattr(oval, '_id', None) if isinstance(oval, Value) else None
+    if _id is None:
+        # file value or not interned, not worth to keep
+        return np.array([fileo._fid for fileo in ctx.files if
+                         oval._match(fileo)], dtype=FID_DTYPE)
+    if _id not in ctx.postings:
+        ctx.postings[_id] = np.array([fileo._fid for fileo in ctx.files if
+                                      oval._match(fileo)], dtype=FID_DTYPE)
+    return ctx.postings[_id]
+
+
+def select_fids(ctx, ofield_vals):
+    """Return sorted ids of files which match any value of every field.
+
+    Parameters
+    ----------
+    ctx : Context
+        Context with postings.
+    ofield_vals : dict
+        Option values by field.
+
+    """
+    unions = []
+    for ovals in ofield_vals.itervalues():
+        postings = [get_posting(ctx, oval) for oval in ovals]
+        if len(postings) == 1:
+            unions.append(postings[0])
+        else:
+            unions.append(np.unique(np.concatenate(postings)))
+    if len(unions) == 0:
+        return np.arange(len(ctx.files), dtype=FID_DTYPE)
+    # intersect from the smallest
+    unions.sort(key=len)
+    fids = unions[0]
+    for union in unions[1:]:
+        if len(fids) == 0:
+            break
+        fids = np.intersect1d(fids, union, assume_unique=True)
+    return fids
+
+
+def filter_files(ctx, files, fids):
+    """Return files in given file ids, keeping the order."""
+    mask = np.zeros(len(ctx.files), dtype=bool)
+    mask[fids] = True
+    return [fileo for fileo in files if mask[fileo._fid]]
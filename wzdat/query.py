@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Lazy query plan of file selector.
+
+`FileSelector.query()` returns a `Query` which only records selections, find
+word, used columns and row predicates. Nothing is executed until its result
+is asked. Then date bounds are merged into one range searched by date index,
+option selections are intersected on posting lists from the smallest, and
+find word is tested while parsing lines of `to_frame`, without temp file of
+grep results.
+
+"""
+
+import re
+import types
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from wzdat.const import CHUNK_CNT
+from wzdat.value import ValueList, Value, is_date_bound, date_ordinal
+from wzdat.posting import has_postings, select_fids, filter_files
+
+# regex characters that can't be tested as plain word
+_REGEX_CHARS = re.compile(r'[\\.\[\]*^$]')
+
+
+def _split_words(word):
+    """Return literal words of grep pattern, or None if it's a regex."""
+    words = word.split('\\|')
+    for _word in words:
+        if len(_word) == 0 or _REGEX_CHARS.search(_word) is not None:
+            return None
+    return words
+
+
+class Query(object):
+
+    """Lazy, composable query of file selector."""
+
+    def __init__(self, files):
+        self._base = files
+        self._steps = []
+        self._start = None
+        self._stop = None
+        self._word = None
+        self._options = None
+        self._usecols = None
+        self._preds = []
+        self._files = None
+
+    def _copy(self):
+        q = Query(self._base)
+        q._steps = list(self._steps)
+        q._start = self._start
+        q._stop = self._stop
+        q._word = self._word
+        q._options = self._options
+        q._usecols = self._usecols
+        q._preds = list(self._preds)
+        return q
+
+    def __getitem__(self, idx):
+        from wzdat.selector import FileSelector, FileValue, _normalize_options,\
+            _group_options
+        q = self._copy()
+        if isinstance(idx, types.SliceType) and (is_date_bound(idx.start) or
+                                                 is_date_bound(idx.stop)):
+            assert idx.step is None, "step of date slice is not supported"
+            if isinstance(idx.start, int) or isinstance(idx.stop, int):
+                # int bound is of base dates, resolve into date range
+                ords = self._base._date_slice_ordinals(idx)
+                start, stop = (ords[0], ords[-1] + 1) if len(ords) > 0 else\
+                    (0, 0)
+            else:
+                start = date_ordinal(idx.start) if idx.start is not None\
+                    else None
+                stop = date_ordinal(idx.stop) if idx.stop is not None else\
+                    None
+            if start is not None:
+                q._start = start if q._start is None else max(q._start, start)
+            if stop is not None:
+                q._stop = stop if q._stop is None else min(q._stop, stop)
+            return q
+
+        if isinstance(idx, Value) or isinstance(idx, FileSelector) or\
+                isinstance(idx, FileValue):
+            options = [idx]
+        elif isinstance(idx, types.TupleType) or\
+                isinstance(idx, types.ListType) or isinstance(idx, ValueList):
+            options = list(idx)
+        else:
+            # positional index, run now
+            return self.files[idx]
+        ofield_vals = defaultdict(list)
+        _group_options(_normalize_options(options), ofield_vals)
+        q._steps.append(ofield_vals)
+        return q
+
+    def find(self, word, options=None):
+        """Find word among result files. Last word wins."""
+        if isinstance(word, types.ListType) or\
+                isinstance(word, types.TupleType):
+            word = '\\|'.join(word)
+        q = self._copy()
+        q._word = word
+        q._options = options
+        return q
+
+    def select(self, usecols):
+        """Set columns of result data frame."""
+        q = self._copy()
+        q._usecols = usecols
+        return q
+
+    def where(self, pred):
+        """Filter rows of result data frame.
+
+        Parameters
+        ----------
+        pred : function
+            Takes a data frame and returns boolean mask of rows to keep.
+
+        """
+        q = self._copy()
+        q._preds.append(pred)
+        return q
+
+    @property
+    def files(self):
+        """Return FileSelector of selected files, without find word."""
+        if self._files is None:
+            self._files = self._select_files()
+        return self._files
+
+    def _select_files(self):
+        from wzdat.selector import FileSelector
+        base = self._base
+        ctx = base._ctx
+        files = base.files
+        if self._start is not None or self._stop is not None:
+            files = base._date_range_files(self._start, self._stop)
+        if len(self._steps) == 0 or len(files) == 0:
+            return FileSelector(ctx, files, base._qmode)
+
+        if has_postings(ctx, files):
+            fidss = [select_fids(ctx, ofield_vals) for ofield_vals in
+                     self._steps]
+            # intersect from the smallest
+            fidss.sort(key=len)
+            fids = fidss[0]
+            for _fids in fidss[1:]:
+                if len(fids) == 0:
+                    break
+                fids = np.intersect1d(fids, _fids, assume_unique=True)
+            files = filter_files(ctx, files, fids)
+            return FileSelector(ctx, files, base._qmode)
+
+        sel = FileSelector(ctx, files, base._qmode)
+        for ofield_vals in self._steps:
+            sel = sel[[oval for ovals in ofield_vals.itervalues() for oval in
+                       ovals]]
+            if len(sel.files) == 0:
+                break
+        return sel
+
+    def execute(self):
+        """Return FileSelector of selected files, or TempFile of find result
+        if find word is given."""
+        files = self.files
+        if self._word is None:
+            return files
+        return files.find(self._word, self._options)
+
+    def _pushdown_words(self, files):
+        """Return literal words to test while parsing, or None."""
+        if self._options is not None:
+            return None
+        from wzdat.selector import _get_member
+        if _get_member(files._ctx, 'to_frame', False) is not None:
+            # adapter's own to_frame
+            return None
+        return _split_words(self._word)
+
+    def to_frame(self, chunk_cnt=CHUNK_CNT, workers=None):
+        """Convert result to Pandas DataFrame and return it.
+
+        Files are converted in `workers` processes, when it is given.
+
+        """
+        files = self.files
+        if len(files.files) == 0:
+            return pd.DataFrame()
+
+        if self._word is None:
+            df = files.to_frame(self._usecols, chunk_cnt, workers)
+        else:
+            words = self._pushdown_words(files)
+            if words is None:
+                tfile = files.find(self._word, self._options)
+                if tfile is None:
+                    return pd.DataFrame()
+                df = tfile.to_frame(self._usecols, chunk_cnt)
+            else:
+                _c = files._to_frame_prop('to_frame', True)
+                dfs = list(files._to_frame_gen(_c, self._usecols, chunk_cnt,
+                                               workers, words))
+                _c.pg.done()
+                if len(dfs) == 0:
+                    return pd.DataFrame()
+                df = pd.concat(dfs)
+        for pred in self._preds:
+            df = df[pred(df)]
+        return df
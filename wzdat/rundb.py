@@ -2,6 +2,7 @@
     Database module for IPython Notebook Runner
 """
 import os
+import ast
 import logging
 
 import redis
@@ -12,6 +13,10 @@ from wzdat.util import file_checksum, get_sdatetime,\
 from wzdat.const import EVENT_DEFAULT_PRIOR, FORWARDER_LOG_PREFIX
 
 WZDAT_REDIS_DB = 1
+# channel to notify events to jobs daemon
+EVENT_CHANNEL = 'events'
+# seconds to keep rendered html of notebook
+HTML_CACHE_TTL = 24 * 60 * 60
 
 host = os.environ['WZDAT_B2DHOST'] if 'WZDAT_B2DHOST' in os.environ else\
     'localhost'
@@ -78,11 +83,31 @@ def get_run_info(path):
 
 
 def remove_run_info(path):
+    r.delete(u'html:{}'.format(path))
     key = u'run:{}'.format(path)
     if r.exists(key):
         return r.delete(key)
 
 
+def get_outputs_html(path, stamp):
+    """Return rendered outputs html of notebook, or None if notebook file
+    stamp is changed."""
+    key = u'html:{}'.format(path)
+    _stamp, html = r.hmget(key, 'stamp', 'html')
+    if _stamp != repr(stamp):
+        return None
+    return html.decode('utf8')
+
+
+def set_outputs_html(path, stamp, html):
+    key = u'html:{}'.format(path)
+    # expires, not to keep html of removed notebooks
+    pipe = r.pipeline()
+    pipe.hmset(key, {'stamp': repr(stamp), 'html': html.encode('utf8')})
+    pipe.expire(key, HTML_CACHE_TTL)
+    pipe.execute()
+
+
 def update_cache_info():
     logging.debug('update_cache_info')
     r.set('last_cached', get_sdatetime())
@@ -128,13 +153,33 @@ def check_notebook_error_and_changed(path):
     return False, False
 
 
-def register_event(etype, info, prior=EVENT_DEFAULT_PRIOR):
+def register_event(etype, info, prior=EVENT_DEFAULT_PRIOR, coalesce=False):
+    """Queue an event for jobs daemon.
+
+    Coalesced event is not queued again while the same one is unhandled.
+
+    """
     # skip forwarder files
     if FORWARDER_LOG_PREFIX in info:
         return
+    if coalesce and not r.sadd('unhandled_keys', (etype, info)):
+        return
     logging.debug('register_event {} - {}'.format(etype, info))
     raised = get_sdatetime()
     r.rpush('unhandled', (prior, etype, info, raised))
+    publish_event(etype)
+
+
+def publish_event(etype):
+    """Notify event type to jobs daemon, without queueing it."""
+    r.publish(EVENT_CHANNEL, etype)
+
+
+def subscribe_events():
+    """Return pubsub subscribed to event channel."""
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(EVENT_CHANNEL)
+    return pubsub
 
 
 def unhandled_events():
@@ -143,4 +188,18 @@ def unhandled_events():
 
 def flush_unhandled_events():
     logging.debug('flush_unhandled_events')
-    r.delete('unhandled')
+    r.delete('unhandled', 'unhandled_keys')
+
+
+def pop_unhandled_events():
+    """Return unhandled events and remove them in one transaction."""
+    pipe = r.pipeline()
+    pipe.lrange('unhandled', 0, -1)
+    pipe.delete('unhandled', 'unhandled_keys')
+    events, _ = pipe.execute()
+    return events
+
+
+def parse_event(event):
+    """Return (prior, etype, info, raised) tuple from stored event."""
+    return ast.literal_eval(event)
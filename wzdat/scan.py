@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Shared scan of data directory.
+
+All file types are found by one walk of the data directory, instead of a
+walk per file type. Directories of each depth are listed in worker threads,
+so locale and node directories are listed in parallel.
+
+Listing of each directory is kept with its modified time. A directory whose
+modified time is not changed since last scan is not listed again, and
+entries of it are not stat-ed to tell files from directories. Modified times
+of directories are still checked, because a change under a subdirectory
+doesn't change modified time of its parent.
+
+"""
+
+import os
+import time
+import cPickle
+import logging
+
+from wzdat.make_config import make_config
+from wzdat.util import get_index_dir
+
+SCAN_WORKERS = 8
+# listings of directories changed this recently are not trusted
+MTIME_SLACK = 2
+
+
+def _get_listing_path():
+    return os.path.join(get_index_dir(), 'dir_listing.pkl')
+
+
+def load_listings():
+    """Return kept listings by absolute directory path."""
+    path = _get_listing_path()
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            return cPickle.load(f)
+    except (EOFError, ValueError, cPickle.UnpicklingError), e:
+        logging.warning(u"ignore broken dir listings: {}".format(e))
+        return {}
+
+
+def save_listings(listings):
+    path = _get_listing_path()
+    tmp_path = path + '.tmp%d' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        cPickle.dump(listings, f, 2)
+    os.rename(tmp_path, path)
+
+
+def _list_dir(adir, listings):
+    """Return (modified time, subdirectory names, file names) of directory.
+    """
+    absdir = os.path.abspath(adir)
+    mtime = os.stat(absdir).st_mtime
+    listing = listings.get(absdir)
+    if listing is not None and listing[0] == mtime:
+        return listing
+    dirs = []
+    filenames = []
+    for name in os.listdir(adir):
+        path = os.path.join(adir, name)
+        if os.path.isdir(path):
+            # like os.walk, don't follow links
+            if not os.path.islink(path):
+                dirs.append(name)
+        else:
+            filenames.append(name)
+    return mtime, dirs, filenames
+
+
+def walk_dirs(startdir, workers=None):
+    """Return list of (directory, file names) under start directory.
+
+    Directories start with '_' are skipped. Directory paths are joined with
+    `startdir`, like `os.walk`.
+
+    """
+    from multiprocessing.pool import ThreadPool
+
+    if workers is None:
+        cfg = make_config()
+        workers = cfg['scan_workers'] if 'scan_workers' in cfg else\
+            SCAN_WORKERS
+    old = load_listings()
+    listings = {}
+    rv = []
+    since = time.time() - MTIME_SLACK
+    pool = ThreadPool(workers)
+    try:
+        level = [startdir]
+        while len(level) > 0:
+            found = pool.map(lambda adir: _list_dir(adir, old), level)
+            nlevel = []
+            for adir, (mtime, dirs, filenames) in zip(level, found):
+                listings[os.path.abspath(adir)] = (mtime if mtime < since else
+                                                   None, dirs, filenames)
+                rv.append((adir, filenames))
+                nlevel += [os.path.join(adir, d) for d in dirs if not
+                           d.startswith('_')]
+            level = nlevel
+    finally:
+        pool.close()
+        pool.join()
+    save_listings(listings)
+    return rv
+
+
+def scan_files(startdir, ffilters, workers=None):
+    """Find files of file types by one walk, and return found infos.
+
+    Parameters
+    ----------
+    startdir : string
+        Directory to walk.
+    ffilters : dict
+        File filter function by file type.
+    workers : int
+        Number of listing threads. Default is 'scan_workers' config or
+        `SCAN_WORKERS`.
+
+    Returns
+    -------
+    dict
+        (root list, file count) by file type, as found by
+        `find_files_and_save`.
+
+    """
+    assert os.path.isdir(startdir)
+    walked = walk_dirs(startdir, workers)
+    rv = {}
+    for ftype, ffilter in ffilters.iteritems():
+        root_list = []
+        filecnt = 0
+        for adir, filenames in walked:
+            rfiles = []
+            if len(filenames) > 0:
+                rfiles = sorted(ffilter(adir, filenames))
+                filecnt += len(rfiles)
+            root_list.append([os.path.abspath(adir), rfiles])
+        rv[ftype] = root_list, filecnt
+    return rv
@@ -8,9 +8,11 @@ import zipfile
 import time
 import shutil
 from collections import defaultdict
-from subprocess import check_call, CalledProcessError
+from itertools import islice
+from subprocess import check_call, CalledProcessError, Popen, PIPE
 import logging
 import traceback
+from bisect import bisect_right
 
 import numpy as np
 import pandas as pd
@@ -23,14 +25,25 @@ from wzdat.base import Listable, Representable, ISearchable, ILineAttr, \
     IFramable, IPathable, IFilterable, IMergeable
 from wzdat.make_config import make_config
 from wzdat.const import TMP_PREFIX, PRINT_LMAX, NAMED_TMP_PREFIX, \
-    CHUNK_CNT, FORWARDER_LOG_PREFIX
-from wzdat.value import ValueList, FailValue, Value, check_date_slice
+    CHUNK_CNT, FORWARDER_LOG_PREFIX, GREP_BATCH_SIZE, STREAM_GREP_OPTS,\
+    GREP_OUTPUT_OPTS, GREP_ARG_OPTS
+from wzdat.value import ValueList, FailValue, Value, check_date_slice,\
+    is_date_bound, date_ordinal
 from wzdat.util import unique_tmp_path, sizeof_fmt, unique_list, \
     remove_empty_file, Property, remove_old_tmps, get_line_count, \
-    get_slice_idx, ProgressBar, nprint, Context, convert_data_file,\
-    get_convfile_path, get_tmp_dir, get_conv_dir, load_files_precalc,\
-    get_data_dir, is_step_only_idx, get_realpath
-from wzdat.lineinfo import LineInfo, LineInfoImpl_Count, LineInfoImpl_Array
+    get_line_counts, get_slice_idx, ProgressBar, nprint, Context, \
+    get_convfile_path, get_tmp_dir, get_conv_dir, \
+    load_files_precalc, get_data_dir, is_step_only_idx, get_realpath,\
+    files_checksum, ends_with_newline
+from wzdat.lineinfo import LineInfo, LineInfoImpl_Count
+from wzdat.fileindex import FileIndex
+from wzdat.convert import convert_files
+from wzdat.compress import is_compressed, open_data, READ_BUF_SIZE
+from wzdat.framecache import frame_cache_key, load_frame, save_frame,\
+    adapter_hash
+from wzdat.lineindex import LineIndex
+from wzdat.posting import build_postings, has_postings, select_fids,\
+    filter_files
 
 qmode = 'files'
 cfg = make_config()
@@ -87,11 +100,12 @@ def _get_member(ctx, fname, required=True):
 
 
 def _open_with_codec(ctx, path):
-    if open(path).readline().startswith(codecs.BOM_UTF8):
-        enc = 'utf-8-sig'
-    else:
-        enc = ctx.encoding
-    return codecs.open(path, 'r', enc, errors='ignore')
+    with open_data(path) as f:
+        bom = f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8
+    enc = 'utf-8-sig' if bom else ctx.encoding
+    if not enc:
+        return open_data(path)
+    return codecs.getreader(enc)(open_data(path), errors='ignore')
 
 
 class SingleFile(FileCommon, IPathable):
@@ -107,6 +121,7 @@ class SingleFile(FileCommon, IPathable):
         self._kinds_cache = None
         self._files_cache = None
         self._conv_file = None
+        self._lindex = None
 
     @property
     def abspath(self):
@@ -121,16 +136,24 @@ class SingleFile(FileCommon, IPathable):
         """Return relative path of temp file."""
         return self.abspath.replace(self._ctx.startdir + '/', '')
 
+    def _line_index(self):
+        if self._lindex is None:
+            self._lindex = LineIndex(get_realpath(self.abspath))
+        return self._lindex
+
     def __getitem__(self, idx):
         if isinstance(idx, types.SliceType):
             return self._slice(idx)
-        no = 0
-        with _open_with_codec(self._ctx, self.abspath) as f:
-            while True:
-                line = f.readline()
-                if no == idx:
-                    return line
-                no += 1
+        lindex = self._line_index()
+        cnt = lindex.count
+        if idx < 0:
+            idx += cnt
+        if idx < 0 or idx >= cnt:
+            raise IndexError
+        data = lindex.read(idx, idx + 1)
+        if idx == 0 and data.startswith(codecs.BOM_UTF8):
+            return data.decode('utf-8-sig', 'ignore')
+        return data.decode(self._ctx.encoding, 'ignore')
 
     def __getslice__(self, idx1, idx2):
         return self._slice(slice(idx1, idx2))
@@ -139,14 +162,15 @@ class SingleFile(FileCommon, IPathable):
         idx1, idx2 = get_slice_idx(slc, self.count)
         tmp_file, _ = unique_tmp_path(TMP_PREFIX)
         with open(tmp_file, 'w') as out:
-            cmd = ['sed', '-n', '%d,%dp' % (idx1 + 1, idx2), self.abspath]
-            check_call(cmd, stdout=out)
+            self._line_index().copy(idx1, idx2, out)
 
         # TODO: check with simple test file
         linfos = self._linfos[slice(idx1, idx2)]
         return TempFile(self._ctx, tmp_file, linfos, True)
 
     def __len__(self):
+        if self._lindex is not None:
+            return self._lindex.count
         return get_line_count(self.abspath)
 
     @property
@@ -155,6 +179,8 @@ class SingleFile(FileCommon, IPathable):
         return self._calc_lcount()
 
     def _calc_lcount(self):
+        if self._lindex is not None:
+            return self._lindex.count
         if self._lcount == -1:
             self._lcount = get_line_count(self.abspath)
         return self._lcount
@@ -181,11 +207,18 @@ class SingleFile(FileCommon, IPathable):
         """
         return _file_head_or_tail(self, False, count)
 
-    def to_frame(self, usecols=None, chunk_cnt=CHUNK_CNT, show_prog=True):
-        """Build Pandas DataFrame from file and return it."""
+    def to_frame(self, usecols=None, chunk_cnt=CHUNK_CNT, show_prog=True,
+                 words=None):
+        """Build Pandas DataFrame from file and return it.
+
+        Only lines containing any of `words` are converted, if given. Not
+        supported with adapter's own 'to_frame'.
+
+        """
         _to_frame_fn = _get_member(self._ctx, 'to_frame', False)
 
         if _to_frame_fn is not None:
+            assert words is None, "words filter needs builtin to_frame"
             try:
                 return _to_frame_fn(self.abspath, self, usecols)
             except ValueError, e:
@@ -194,15 +227,23 @@ class SingleFile(FileCommon, IPathable):
         else:
             if self._ctx.isdblog:
                 assert False, "dblog should have its own 'to_frame'"
-            return self._to_frame(usecols, chunk_cnt, show_prog)
+            return self._to_frame(usecols, chunk_cnt, show_prog, words)
 
-    def _to_frame(self, usecols, chunk_cnt, show_prog):
+    def _to_frame(self, usecols, chunk_cnt, show_prog, words=None):
+        return pd.concat(self._iter_frames(usecols, chunk_cnt, show_prog,
+                                           words))
+
+    def _iter_frames(self, usecols, chunk_cnt, show_prog, words=None):
+        """Return generator of data frames by chunk of lines."""
         _c = Property()
         _c.lineno = 0
         _c.linecnt = get_line_count(self.abspath)
         _c.show_prog = show_prog
         _c.chunk_cnt = chunk_cnt
-        return pd.concat(self._to_frame_gen(_c, usecols))
+        _c.words = _decode_words(self._ctx, words)
+        if _get_member(self._ctx, 'line_regex', False) is not None:
+            return self._to_frame_gen_vec(_c, usecols)
+        return self._to_frame_gen(_c, usecols)
 
     # TODO: refactoring
     def _to_frame_gen(self, _c, usecols):
@@ -224,6 +265,9 @@ class SingleFile(FileCommon, IPathable):
                 hasna = False
             if _c.show_prog:
                 pg.animate(_c.lineno)
+            if _c.words is not None and not _has_word(line, _c.words):
+                _c.lineno += 1
+                continue
 
             fdate = fdates[_c.lineno]
             _date, level, msg, hasna = \
@@ -244,10 +288,99 @@ class SingleFile(FileCommon, IPathable):
                 tfp = None
                 yield df
 
-        df = self._to_frame_build_data_frame(tfp, hasna, usecols)
         if _c.show_prog:
             pg.done()
-        yield df
+        # last chunk could have been yielded already
+        if tfp is not None:
+            yield self._to_frame_build_data_frame(tfp, hasna, usecols)
+
+    def _to_frame_gen_vec(self, _c, usecols):
+        """Build data frames by chunk with vectorized string operations.
+
+        Used when adapter declares `line_regex`, which has named groups
+        'date'(or 'time'), 'msg' and optional 'level'. `line_date_format` is
+        strftime format of the date (or file date and time joined by space).
+
+        """
+        regex = _get_member(self._ctx, 'line_regex')
+        dfmt = _get_member(self._ctx, 'line_date_format', False)
+        if _c.show_prog:
+            pg = ProgressBar('to_frame', _c.linecnt)
+
+        fdates = [date._sdate for date in self._linfos.dates]
+        nodes = [node for node in self._linfos.nodes]
+        kinds = [kind for kind in self._linfos.kinds]
+        strs = {}
+        _c.lineno = 0
+        yielded = False
+        with _open_with_codec(self._ctx, self.abspath) as f:
+            while True:
+                lines = list(islice(f, _c.chunk_cnt))
+                if len(lines) == 0 and yielded:
+                    break
+                sidx = slice(_c.lineno, _c.lineno + len(lines))
+                _c.lineno += len(lines)
+                if _c.show_prog:
+                    pg.animate(_c.lineno)
+
+                lines = pd.Series(lines, dtype=object)
+                cnodes, ckinds = nodes[sidx], kinds[sidx]
+                cdates = fdates[sidx]
+                if _c.words is not None:
+                    keep = np.flatnonzero([_has_word(line, _c.words) for line
+                                           in lines])
+                    lines = lines.iloc[keep].reset_index(drop=True)
+                    cnodes = [cnodes[i] for i in keep]
+                    ckinds = [ckinds[i] for i in keep]
+                    cdates = [cdates[i] for i in keep]
+                ext = lines.str.rstrip('\r\n').str.extract(regex, expand=True)
+                if 'date' in ext.columns:
+                    sdates = ext['date']
+                else:
+                    sdates = pd.Series(cdates, dtype=object) + ' ' +\
+                        ext['time']
+                dates = pd.to_datetime(sdates, format=dfmt, errors='coerce')
+                df = self._to_frame_build_data_frame_vec(
+                    ext, dates, cnodes, ckinds, strs, usecols)
+                yielded = True
+                yield df
+        if _c.show_prog:
+            pg.done()
+
+    def _to_frame_build_data_frame_vec(self, ext, dates, nodes, kinds, strs,
+                                       usecols):
+        if usecols is None:
+            usecols = ['node', 'kind', 'level', 'msg']
+        valid = dates.notnull() & ext['msg'].notnull()
+
+        def _str_col(vals):
+            for val in set(vals):
+                if val not in strs:
+                    strs[val] = str(val)
+            return [strs[val] for val in vals]
+
+        dfinfo = {}
+        dfcols = []
+        if 'node' in usecols:
+            dfinfo['node'] = _str_col(nodes)
+            dfcols.append('node')
+        if 'kind' in usecols:
+            dfinfo['kind'] = _str_col(kinds)
+            dfcols.append('kind')
+        if 'level' in ext.columns and 'level' in usecols:
+            valid &= ext['level'].notnull()
+            dfinfo['level'] = ext['level'].values
+            dfcols.append('level')
+        if 'msg' in usecols:
+            dfinfo['msg'] = ext['msg'].values
+            dfcols.append('msg')
+        df = DataFrame(dfinfo, index=pd.DatetimeIndex(dates.values),
+                       columns=dfcols)
+        df = df[valid.values]
+        df.index.name = 'dtime'
+        if 'level' in df.columns:
+            df['level'] = df['level'].astype(str)
+        return df
 
     def to_frame_hdf(self, store_path, store_key, df_cb=None, max_msg=None,
                      usecols=None, chunk_cnt=CHUNK_CNT, show_prog=True):
@@ -406,6 +539,157 @@ class TempFile(SingleFile):
         self._linfos.save(cppath)
 
 
+class MergedFile(TempFile):
+
+    """Virtual temp file of merged files.
+
+    Lines are read from the source files by their cumulative line offsets,
+    without copying them into a temp file. Only `materialize` or asking
+    `abspath` writes a real one. Newline is put after the last line of a
+    source file not ending with it.
+
+    """
+
+    def __init__(self, ctx, files, showall=False):
+        linfos = LineInfo()
+        for _file in files:
+            linfos += _file._linfos
+        # not TempFile's, which counts lines of the path
+        super(TempFile, self).__init__(ctx, linfos)
+        self._srcs = list(files)
+        self._abspath = None
+        self._offsets = None
+        self._seps = None
+        self.showall = showall
+
+    def _get_seps(self):
+        """Return whether each source file needs newline after it."""
+        if self._seps is None:
+            self._seps = [not ends_with_newline(get_realpath(_file.abspath))
+                          for _file in self._srcs]
+        return self._seps
+
+    def _get_offsets(self):
+        """Return cumulative line and byte offsets of source files."""
+        if self._offsets is None:
+            seps = self._get_seps()
+            # last line without newline is counted too
+            counts = [cnt + sep for cnt, sep in
+                      zip(_count_file_lines(self._srcs), seps)]
+            sizes = [os.path.getsize(_file.abspath) + sep for _file, sep in
+                     zip(self._srcs, seps)]
+            self._offsets = np.cumsum([0] + counts), np.cumsum([0] + sizes)
+        return self._offsets
+
+    @property
+    def abspath(self):
+        """Return path of materialized temp file."""
+        if self._abspath is None:
+            tmp_file, _ = unique_tmp_path(TMP_PREFIX)
+            self._write(tmp_file)
+            self._abspath = tmp_file
+        return self._abspath
+
+    def _write(self, path):
+        with open(path, 'wb') as out:
+            for _file, sep in zip(self._srcs, self._get_seps()):
+                with open_data(_file.abspath) as f:
+                    shutil.copyfileobj(f, out)
+                if sep:
+                    out.write('\n')
+
+    def materialize(self):
+        """Write merged lines into a temp file and return it."""
+        return TempFile(self._ctx, self.abspath, self._linfos, self.showall)
+
+    def __unicode__(self):
+        if not self.showall and self.lcount > PRINT_LMAX:
+            return '%s\nmerged files: %d\nline count: %d\nsize: %s' % \
+                   (type(self), len(self._srcs), self.lcount, self.hsize)
+        else:
+            return u''.join(self)
+
+    def __iter__(self):
+        for _file in self._srcs:
+            with _open_with_codec(self._ctx, _file.abspath) as f:
+                for line in f:
+                    if not line.endswith(u'\n'):
+                        line += u'\n'
+                    yield line
+
+    def __getitem__(self, idx):
+        if isinstance(idx, types.SliceType):
+            return self._slice(idx)
+        loffs = self._get_offsets()[0]
+        cnt = loffs[-1]
+        if idx < 0:
+            idx += cnt
+        if idx < 0 or idx >= cnt:
+            raise IndexError
+        at = np.searchsorted(loffs, idx, 'right') - 1
+        return self._srcs[at][int(idx - loffs[at])]
+
+    def _slice(self, slc):
+        idx1, idx2 = get_slice_idx(slc, self.count)
+        loffs = self._get_offsets()[0]
+        seps = self._get_seps()
+        tmp_file, _ = unique_tmp_path(TMP_PREFIX)
+        with open(tmp_file, 'w') as out:
+            at = max(np.searchsorted(loffs, idx1, 'right') - 1, 0)
+            while at < len(self._srcs) and loffs[at] < idx2:
+                lo = loffs[at]
+                start = max(idx1 - lo, 0)
+                stop = min(idx2, loffs[at + 1]) - lo
+                if start < stop:
+                    self._srcs[at]._line_index().copy(int(start), int(stop),
+                                                      out)
+                    if seps[at] and lo + stop == loffs[at + 1]:
+                        out.write('\n')
+                at += 1
+        linfos = self._linfos[slice(idx1, idx2)]
+        return TempFile(self._ctx, tmp_file, linfos, True)
+
+    def __len__(self):
+        return self._calc_lcount()
+
+    def _calc_lcount(self):
+        return int(self._get_offsets()[0][-1])
+
+    @property
+    def size(self):
+        """Return size of merged data."""
+        return int(self._get_offsets()[1][-1])
+
+    @property
+    def hsize(self):
+        """Return human readable size of merged data."""
+        return sizeof_fmt(self.size)
+
+    def find(self, word, options=None, include_header=False):
+        """Find word in source files and return result temp file."""
+        return find_in_fileo(self._ctx, self._srcs, self.hsize, word,
+                             options, False, include_header)
+
+    def to_frame(self, usecols=None, chunk_cnt=CHUNK_CNT, show_prog=True,
+                 words=None):
+        """Build Pandas DataFrame from source files and return it."""
+        dfs = [_file.to_frame(usecols, chunk_cnt, False, words) for _file in
+               self._srcs]
+        dfs = [df for df in dfs if df is not None]
+        if len(dfs) == 0:
+            return pd.DataFrame()
+        return pd.concat(dfs)
+
+    def _iter_frames(self, usecols, chunk_cnt, show_prog, words=None):
+        for _file in self._srcs:
+            for df in _file._iter_frames(usecols, chunk_cnt, False, words):
+                yield df
+
+    def save(self, cppath):
+        self._write(cppath)
+        self._linfos.save(cppath)
+
+
 def _find_in_temp(ctx, tempo, word, options, include_header):
     """Find word in a temp file and return result temp file."""
     tmp_file, _ = unique_tmp_path(TMP_PREFIX)
@@ -414,6 +698,25 @@ def _find_in_temp(ctx, tempo, word, options, include_header):
     return TempFile(ctx, tmp_file, linfos)
 
 
+def _decode_words(ctx, words):
+    """Return unicode word list to filter lines, or None."""
+    if words is None:
+        return None
+    if not isinstance(words, types.ListType) and\
+            not isinstance(words, types.TupleType):
+        words = [words]
+    enc = ctx.encoding if ctx.encoding else 'utf-8'
+    return [word.decode(enc) if isinstance(word, types.StringType) else word
+            for word in words]
+
+
+def _has_word(line, words):
+    for word in words:
+        if word in line:
+            return True
+    return False
+
+
 def _to_frame_convert_line(tfp, fdate, line, hasna, smap):
     try:
         sdate = None
@@ -516,77 +819,265 @@ class NodeField(Field):
         self.__dict__.update(state)
 
 
-def _file_head_or_tail(flike, head, count=10):
-    tmp_file, _ = unique_tmp_path(TMP_PREFIX)
-    with open(tmp_file, 'w') as out:
-        c = 'head' if head else 'tail'
-        abspath = get_realpath(flike.abspath)
-        cmd = [c, '-n', str(count), abspath]
-        check_call(cmd, stdout=out)
+def _count_file_lines(files):
+    """Return line counts of files, counting them in bulk."""
+    nfiles = [_file for _file in files if _file._lcount == -1 and
+              _file._lindex is None]
+    if len(nfiles) > 0:
+        counts = get_line_counts([_file.abspath for _file in nfiles])
+        for _file, cnt in zip(nfiles, counts):
+            _file._lcount = cnt
+    return [_file.lcount for _file in files]
+
 
-    cnt = get_line_count(tmp_file)
+def _file_head_or_tail(flike, head, count=10):
+    cnt = len(flike)
     if head:
-        linfos = flike._linfos[0:cnt]
+        slc = slice(0, min(count, cnt))
     else:
-        linfos = flike._linfos[-cnt:]
-    return TempFile(flike._ctx, tmp_file, linfos, True)
+        slc = slice(max(cnt - count, 0), cnt)
+    return flike._slice(slc)
 
 
 def find_in_fileo(ctx, _files, hsize, word, options=None, print_prog=True,
-                  include_header=False):
-    """Find word in file object and return result temp file."""
+                  include_header=False, workers=None):
+    """Find word in file object and return result temp file.
+
+    Search files in `workers` processes in parallel, when it is given.
+
+    """
     _files = remove_empty_file(_files)
     if len(_files) == 0:
         return None
 
     def _write_header(_file, result_file):
-        with open(_file.abspath, 'r') as ff:
+        with open_data(_file.abspath) as ff:
             with open(result_file, 'w') as rf:
                 header = ff.readline()
                 rf.write(header)
 
     result_file, _ = unique_tmp_path(TMP_PREFIX)
-    tmp_file, _ = unique_tmp_path(TMP_PREFIX)
     fileno = len(_files)
     ctx.pg = ProgressBar('finding in %s' % hsize, fileno)
+    if include_header:
+        _write_header(_files[0], result_file)
 
-    # for each target file
     if isinstance(word, types.ListType) or isinstance(word, types.TupleType):
         word = '\|'.join(word)
+    grep_cmd = _get_grep_cmd(ctx, word, options)
+    paths = [_file.abspath for _file in _files]
+    prog_cb = ctx.pg.animate if print_prog else None
+    # search all files with a few grep calls
+    with open(result_file, 'a') as out:
+        if workers is not None and workers > 1:
+            counts = _grep_files_parallel(grep_cmd, paths, out, workers,
+                                          prog_cb)
+        else:
+            counts = grep_files(grep_cmd, paths, out, prog_cb)
+    unset_grep_encoding(ctx, word)
+
+    # fill infos with match count
     linfos = LineInfo()
-    for idx, _file in enumerate(_files):
-        if include_header:
-            _write_header(_file, result_file)
-            include_header = False
-        linfo = _find_in_fileo_grep(ctx, result_file, tmp_file, word, idx,
-                                    _file, fileno, options, print_prog)
-        if linfo is not None:
-            linfos += linfo
+    for _file, cnt in zip(_files, counts):
+        if cnt > 0:
+            linfos += LineInfo(LineInfoImpl_Count(_file.node, _file.kind,
+                                                  _file.date, _file, cnt))
     ctx.pg.done()
-    os.unlink(tmp_file)
     tf = TempFile(ctx, result_file, linfos)
     return tf
 
 
-def _find_in_fileo_grep(ctx, result_file, tmp_file, word, idx, _file, fileno,
-                        options, print_prog):
-    # grep to tmp
-    found = True
+def _get_grep_cmd(ctx, word, options):
+    """Return grep command without target paths."""
+    _word = set_grep_encoding(ctx, word)
+    cmd = [get_grep(_word), '-H', '-Z']
+    if options is not None:
+        options = options.split()
+        _check_grep_options(options)
+        cmd += options
+    return cmd + ['-e', _word]
+
+
+def _check_grep_options(options):
+    """Assert grep options keep output of a line per match, which is parsed
+    into match counts of files."""
+    for opt in options:
+        if opt.startswith('--'):
+            names = [opt.split('=')[0]]
+        elif opt.startswith('-'):
+            # combined short options, till one taking an argument
+            names = []
+            for c in opt[1:]:
+                names.append('-' + c)
+                if c in GREP_ARG_OPTS:
+                    break
+        else:
+            continue
+        for name in names:
+            assert name not in GREP_OUTPUT_OPTS,\
+                "grep option '%s' is not supported by find" % name
+
+
+def _grep_files_tmp(args):
+    """Grep a shard of files into a temp file. Run in a worker process."""
+    grep_cmd, paths = args
+    tmp_file, _ = unique_tmp_path(TMP_PREFIX)
     with open(tmp_file, 'w') as out:
-        try:
-            _find_in_fileo_grep_call(ctx, word, idx, _file, fileno,
-                                     options, out, print_prog)
-        except CalledProcessError:
-            found = False
+        counts = grep_files(grep_cmd, paths, out)
+    return tmp_file, counts
+
+
+def _grep_files_parallel(grep_cmd, paths, out, workers, prog_cb):
+    """Grep shards of files in process pool, and merge them in order."""
+    from multiprocessing import Pool
+    # several shards per worker to balance loads and report progress
+    size = min(GREP_BATCH_SIZE, max(1, len(paths) / (workers * 4)))
+    shards = [(grep_cmd, paths[i:i + size]) for i in
+              xrange(0, len(paths), size)]
+    counts = []
+    pool = Pool(workers)
+    try:
+        for tmp_file, _counts in pool.imap(_grep_files_tmp, shards):
+            with open(tmp_file, 'r') as f:
+                shutil.copyfileobj(f, out)
+            os.unlink(tmp_file)
+            counts += _counts
+            if prog_cb is not None:
+                prog_cb(len(counts))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return counts
+
+
+def grep_files(grep_cmd, paths, out, prog_cb=None):
+    """Grep files by batch, write matched lines and return match counts.
+
+    Parameters
+    ----------
+    grep_cmd : list
+        grep command with '-H -Z' options, but without target paths.
+    paths : list
+        Absolute paths to target files.
+    out : file
+        File to write matched lines into, in the order of paths.
+    prog_cb : function
+        Called with the number of searched files after each batch.
 
-    # fill info with match count
-    cnt = get_line_count(tmp_file)
-    with open(result_file, 'a') as out:
-        cmd = ['cat', tmp_file]
-        check_call(cmd, stdout=out)
-    if found:
-        return LineInfo(LineInfoImpl_Count(_file.node, _file.kind,
-                                           _file.date, _file, cnt))
+    Returns
+    -------
+    list
+        Match count of each path.
+
+    """
+    counts = [0] * len(paths)
+    stream = _stream_grep_ok(grep_cmd)
+    for bi, batch in _grep_batches(paths, stream):
+        pidx = dict([(path, bi + i) for i, path in enumerate(batch)])
+        feeder = starts = None
+        if is_compressed(batch[0]):
+            proc, feeder, starts = _grep_compressed(grep_cmd, batch, stream)
+        else:
+            proc = Popen(grep_cmd + batch, stdout=PIPE)
+        idx = None
+        prev = None
+        for line in proc.stdout:
+            path, sep, body = line.partition('\0')
+            if not sep:
+                # message like 'Binary file matches'
+                continue
+            if starts is not None:
+                # byte offset in the stream tells the file
+                offset, _, body = body.partition(':')
+                idx = bi + bisect_right(starts, int(offset)) - 1
+            elif path != prev:
+                idx = pidx[path]
+                prev = path
+            counts[idx] += 1
+            out.write(body)
+        # grep returns 1 when not found, 2 when some file can't be read
+        if proc.wait() > 1:
+            logging.warning(u"grep_files - error while grepping {}".format(
+                grep_cmd))
+        if feeder is not None:
+            feeder.join()
+        if prog_cb is not None:
+            prog_cb(bi + len(batch))
+    return counts
+
+
+def _stream_grep_ok(grep_cmd):
+    """Return whether compressed files can be grepped as one stream, that is
+    grep options don't depend on file boundaries, like '-m' or '-n'."""
+    # options are between '-H -Z' and '-e word'
+    return all(opt in STREAM_GREP_OPTS for opt in grep_cmd[3:-2])
+
+
+def _grep_batches(paths, stream):
+    """Yield start index and batch of paths. Compressed files are batched
+    apart from plain files, and alone unless `stream`."""
+    bi = 0
+    while bi < len(paths):
+        comp = is_compressed(paths[bi])
+        ei = bi + 1
+        if not comp or stream:
+            while ei < len(paths) and ei - bi < GREP_BATCH_SIZE and\
+                    is_compressed(paths[ei]) == comp:
+                ei += 1
+        yield bi, paths[bi:ei]
+        bi = ei
+
+
+def _grep_compressed(grep_cmd, paths, stream):
+    """Grep decompressed stream of files by one grep process.
+
+    Return grep process, feeding thread, and start offsets of files in the
+    stream if `stream`. Otherwise, single file is labeled by its path.
+
+    """
+    import threading
+    if stream:
+        cmd = grep_cmd + ['-b', '-']
+        starts = []
+    else:
+        assert len(paths) == 1
+        cmd = grep_cmd + ['--label=%s' % paths[0], '-']
+        starts = None
+    proc = Popen(cmd, stdin=PIPE, stdout=PIPE)
+
+    def _feed():
+        fed = 0
+        try:
+            for path in paths:
+                # noted before written, so that found lines can see it
+                if starts is not None:
+                    starts.append(fed)
+                last = ''
+                with open_data(path) as f:
+                    while True:
+                        buf = f.read(READ_BUF_SIZE)
+                        if not buf:
+                            break
+                        proc.stdin.write(buf)
+                        fed += len(buf)
+                        last = buf[-1]
+                # not to join last line with the next file's
+                if last not in ('', '\n'):
+                    proc.stdin.write('\n')
+                    fed += 1
+        except IOError, e:
+            # grep could quit early with options like '-m'
+            logging.debug(u"_grep_compressed - {}".format(e))
+        finally:
+            proc.stdin.close()
+
+    feeder = threading.Thread(target=_feed)
+    feeder.daemon = True
+    feeder.start()
+    return proc, feeder, starts
 
 
 def _normalize_options(options):
@@ -665,10 +1156,21 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
         self._dates_cache = None
         self._kinds_cache = None
         self._nodes_cache = None
+        self._date_index = None
 
-    def find(self, word, options=None, print_prog=True, include_header=False):
+    def find(self, word, options=None, print_prog=True, include_header=False,
+             workers=None):
         """Find word among files.
 
+        Parameters
+        ----------
+        word : string
+            Word to find.
+        options : string
+            grep options
+        workers : int
+            Number of processes to search files in parallel.
+
         Returns
         -------
         TempFile
@@ -676,7 +1178,17 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
 
         """
         return find_in_fileo(self._ctx, self.files, self.hsize, word, options,
-                             print_prog, include_header)
+                             print_prog, include_header, workers)
+
+    def query(self):
+        """Return lazy query of the files.
+
+        Selections, find word, used columns and row predicates are recorded
+        then executed at once by `to_frame` or `execute` of it.
+
+        """
+        from wzdat.query import Query
+        return Query(self)
 
     def __len__(self):
         return len(self.files)
@@ -690,15 +1202,102 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
             return self.files[idx]
         else:
             if isinstance(idx, types.SliceType):
+                if is_date_bound(idx.start) or is_date_bound(idx.stop):
+                    return self._date_slice(idx)
                 idx = self.__getitem__expand_date_slice(idx)
             return self.__getitem__options(idx)
 
     def __getitem__expand_date_slice(self, idx):
-        _idx = check_date_slice(self.dates, idx)
+        _idx = check_date_slice(self.dates, idx, self._date_ordinals)
         if _idx.start != idx.start or idx.stop != idx.stop:
             idx = self.dates[_idx]
         return idx
 
+    def _get_date_index(self):
+        """Return sorted date ordinals of files and file positions of them.
+        """
+        if self._date_index is None:
+            ords = np.array([_file.date.ordinal for _file in self.files],
+                            dtype=np.int32)
+            order = np.argsort(ords, kind='mergesort')
+            self._date_index = ords[order], order
+        return self._date_index
+
+    @property
+    def _date_ordinals(self):
+        """Return ordinals of unique dates."""
+        return np.unique(self._get_date_index()[0])
+
+    def _date_range_files(self, start, stop):
+        """Return files in date ordinal range, keeping the order."""
+        sords, order = self._get_date_index()
+        lo = 0 if start is None else np.searchsorted(sords, start, 'left')
+        hi = len(sords) if stop is None else np.searchsorted(sords, stop,
+                                                             'left')
+        return [self.files[i] for i in np.sort(order[lo:hi])]
+
+    def _date_slice_ordinals(self, slc):
+        """Return ordinals of unique dates selected by date bounded slice.
+
+        Int bound and step are of the unique dates, as `dates` selector.
+
+        """
+        ords = self._date_ordinals
+        return ords[check_date_slice(None, slc, ords)]
+
+    def _date_slice(self, slc):
+        """Select files by date bounded slice. Stop date is exclusive."""
+        if slc.step is None and not isinstance(slc.start, int) and\
+                not isinstance(slc.stop, int):
+            start = date_ordinal(slc.start) if slc.start is not None else\
+                None
+            stop = date_ordinal(slc.stop) if slc.stop is not None else None
+            _files = self._date_range_files(start, stop)
+        else:
+            sords, order = self._get_date_index()
+            mask = np.in1d(sords, self._date_slice_ordinals(slc))
+            _files = [self.files[i] for i in np.sort(order[mask])]
+        return FileSelector(self._ctx, _files, self._qmode)
+
+    def group_dates(self, period='month'):
+        """Group files by period of date.
+
+        Parameters
+        ----------
+        period : string
+            'month' or 'week'(ISO week).
+
+        Returns
+        -------
+        list
+            List of (period, FileSelector) tuple in date order. Period is
+            (year, month) or (ISO year, ISO week).
+
+        """
+        from datetime import date
+        assert period in ('month', 'week'), "Unknown period: %s" % period
+        rv = []
+        ords = self._date_ordinals
+        if len(ords) == 0:
+            return rv
+        # find first date of each period
+        bounds = []
+        prev = None
+        for _ord in ords:
+            _date = date.fromordinal(_ord)
+            if period == 'month':
+                key = _date.year, _date.month
+            else:
+                key = _date.isocalendar()[:2]
+            if key != prev:
+                bounds.append((key, _ord))
+                prev = key
+        for i, (key, start) in enumerate(bounds):
+            stop = bounds[i + 1][1] if i + 1 < len(bounds) else None
+            _files = self._date_range_files(start, stop)
+            rv.append((key, FileSelector(self._ctx, _files, self._qmode)))
+        return rv
+
     def __getitem__options(self, idx):
         options = None
         if isinstance(idx, Value) or isinstance(idx, FileSelector) or\
@@ -713,10 +1312,14 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
             ofield_vals = defaultdict(list)
             _group_options(options, ofield_vals)
 
-            _files = []
-            for fileo in self.files:
-                if _test_a_file(fileo, ofield_vals):
-                    _files.append(fileo)
+            if has_postings(self._ctx, self.files):
+                fids = select_fids(self._ctx, ofield_vals)
+                _files = filter_files(self._ctx, self.files, fids)
+            else:
+                _files = []
+                for fileo in self.files:
+                    if _test_a_file(fileo, ofield_vals):
+                        _files.append(fileo)
             return FileSelector(self._ctx, _files, self._qmode)
 
     def __getslice__(self, idx1, idx2):
@@ -780,9 +1383,9 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
     def dates(self):
         """Return unique date list for all files."""
         if self._dates_cache is None:
-            rv = sorted(unique_list(self._dates),
-                        key=lambda date: date.__repr__())
-            rv = ValueList(rv)
+            sords, order = self._get_date_index()
+            _, first = np.unique(sords, return_index=True)
+            rv = ValueList([self.files[order[i]].date for i in first])
             self._dates_cache = rv
         return self._dates_cache
 
@@ -810,22 +1413,12 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
             return '\n'.join([_file.path for _file in self.files])
 
     def merge(self):
-        """Merge all files into a temp file and return it."""
-        linfos = LineInfo()
-        tmp_file, _ = unique_tmp_path(TMP_PREFIX)
-        filecnt = len(self.files)
-        fileno = 0
-        pg = ProgressBar('merging', filecnt)
+        """Merge all files into a virtual temp file and return it.
 
-        with open(tmp_file, 'w') as out:
-            for _file in self.files:
-                pg.animate(fileno)
-                cmd = ['cat', _file.abspath]
-                check_call(cmd, stdout=out)
-                linfos += _file._linfos
-                fileno += 1
-        pg.done()
-        return TempFile(self._ctx, tmp_file, linfos)
+        Lines are not copied until `materialize` of it is called.
+
+        """
+        return MergedFile(self._ctx, self.files)
 
     @property
     def noempty(self):
@@ -841,10 +1434,7 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
         return self._lcount
 
     def _calc_lcount(self):
-        count = 0
-        for _file in self.files:
-            count += _file.lcount
-        return count
+        return sum(_count_file_lines(self.files))
 
     @property
     def size(self):
@@ -887,20 +1477,29 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
         _, TMP_URL = get_urls()
         return HTML(TMP_URL % (filename, filename))
 
-    def to_frame(self, usecols=None, chunk_cnt=CHUNK_CNT):
-        """Convert to Pandas DataFrame and return it."""
+    def to_frame(self, usecols=None, chunk_cnt=CHUNK_CNT, workers=None):
+        """Convert to Pandas DataFrame and return it.
+
+        Files are converted in `workers` processes, when it is given.
+
+        """
         _c = self._to_frame_prop('to_frame', True)
-        df = pd.concat(self._to_frame_gen(_c, usecols, chunk_cnt))
+        df = pd.concat(self._to_frame_gen(_c, usecols, chunk_cnt, workers))
         _c.pg.done()
         return df
 
     def to_frame_hdf(self, store_path, store_key, df_cb=None, max_msg=None,
-                     usecols=None, chunk_cnt=CHUNK_CNT):
+                     usecols=None, chunk_cnt=CHUNK_CNT, workers=None):
         """Convert to Pandas DataFrame and save to HDF then returns
-        HDFStore."""
+        HDFStore.
+
+        Files are converted in `workers` processes, when it is given, and
+        appended to the store in file order as they arrive.
+
+        """
         store = HDFStore(store_path, 'w')
         _c = self._to_frame_prop('to_frame_hdf', False)
-        for df in self._to_frame_gen(_c, usecols, chunk_cnt):
+        for df in self._to_frame_gen(_c, usecols, chunk_cnt, workers):
             min_itemsize = {'kind': 20, 'msg': 255}
             # pytables not support unicode for now
             df['msg'] = df['msg'].apply(lambda m: m.encode('utf8'))
@@ -914,6 +1513,37 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
         store.close()
         _c.pg.done()
 
+    def iter_lines(self):
+        """Iterate lines of files without temp file.
+
+        Yields (file, line) tuple in file order. Node, kind and date of the
+        line are those of the file. Line ending is stripped.
+
+        """
+        for _file in self.files:
+            with _open_with_codec(self._ctx, _file.abspath) as f:
+                for line in f:
+                    yield _file, line.rstrip('\r\n')
+
+    def iter_records(self, chunk=CHUNK_CNT, usecols=None):
+        """Iterate parsed records of files by chunk of lines.
+
+        Yields (file, DataFrame) tuple in file order. Each data frame is
+        built from at most `chunk` lines of the file, so whole range can be
+        aggregated in constant memory. Files with adapter's own 'to_frame'
+        are yielded as a whole.
+
+        """
+        _to_frame_fn = _get_member(self._ctx, 'to_frame', False)
+        for _file in self.files:
+            if _to_frame_fn is not None:
+                dfs = [_file.to_frame(usecols, chunk, False)]
+            else:
+                dfs = _file._iter_frames(usecols, chunk, False)
+            for df in dfs:
+                if df is not None and len(df) > 0:
+                    yield _file, df
+
     def _to_frame_prop(self, title, show_prog=True):
         c = Property()
         c.fileno = 0
@@ -923,10 +1553,16 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
         c.pg = ProgressBar(title, c.filecnt)
         return c
 
-    def _to_frame_gen(self, c, usecols, chunk_cnt):
+    def _to_frame_gen(self, c, usecols, chunk_cnt, workers=None,
+                      words=None):
+        if workers is not None and workers > 1:
+            for df in _to_frame_gen_pool(c, usecols, chunk_cnt, workers,
+                                         words):
+                yield df
+            return
         for _file in c.files:
             c.pg.animate(c.fileno)
-            df = _file.to_frame(usecols, chunk_cnt, False)
+            df = _file.to_frame(usecols, chunk_cnt, False, words)
             if df is not None and len(df) > 0:
                 yield df
             c.fileno += 1
@@ -939,14 +1575,50 @@ class FileSelector(FileCommon, IFilterable, IMergeable):
 
     def checksum(self):
         """Return rough hash by size & modified date of all files."""
-        stats = []
-        data_dir = get_data_dir()
-        for f in self:
-            fpath = f.abspath.replace(data_dir, '')
-            stats.append(fpath)
-            stats.append(os.stat(f.abspath).st_size)
-            # stats.append(os.stat(f.abspath).st_mtime)
-        return hash(tuple(stats))
+        return files_checksum([(f.abspath, os.stat(f.abspath).st_size) for f
+                               in self])
+
+
+# files to convert in worker processes, inherited by fork
+_pool_files = None
+
+
+def _to_frame_pool_file(args):
+    """Convert a file to data frame. Run in a worker process."""
+    idx, usecols, chunk_cnt, words = args
+    df = _pool_files[idx].to_frame(usecols, chunk_cnt, False, words)
+    if df is not None:
+        # categorical is cheap to send back
+        for col in ('node', 'kind'):
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+    return df
+
+
+def _to_frame_gen_pool(c, usecols, chunk_cnt, workers, words=None):
+    """Convert files in process pool and yield data frames in file order."""
+    global _pool_files
+    from multiprocessing import Pool
+    _pool_files = c.files
+    args = [(idx, usecols, chunk_cnt, words) for idx in xrange(len(c.files))]
+    pool = Pool(workers)
+    try:
+        for df in pool.imap(_to_frame_pool_file, args):
+            c.pg.animate(c.fileno)
+            c.fileno += 1
+            if df is None or len(df) == 0:
+                continue
+            for col in ('node', 'kind'):
+                if col in df.columns:
+                    df[col] = df[col].astype(str)
+            yield df
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _pool_files = None
 
 
 def _add_zip_flat(zf, abspath):
@@ -971,7 +1643,8 @@ class Selector(Representable, Listable):
         if isinstance(idx, int):
             return getattr(self._files, self._fnames)[idx]
         elif self._fnames == 'dates' and isinstance(idx, types.SliceType):
-            idx = check_date_slice(self._files.dates, idx)
+            idx = check_date_slice(self._files.dates, idx,
+                                   self._files._date_ordinals)
             return ValueList(self._files.dates.__getitem__(idx))
         else:
             return getattr(self._files.__getitem__(idx), self._fnames)
@@ -1023,26 +1696,27 @@ def _load_files_root_vals(fieldcnt, fields, fileo, field_getter):
     return vals, field_errs
 
 
-def _load_files_root_check_conv(ctx, abspath, converted):
+def _load_files_convert(ctx, abspaths):
+    """Convert new or changed files in parallel, if encoding needs it."""
+    if not ctx.encoding.startswith('utf-16'):
+        return
+    converted = convert_files(ctx.encoding, abspaths)
+    if len(converted) > 0:
+        nprint("%d files have been converted." % len(converted))
+
+
+def _load_files_root_check_conv(ctx, abspath):
     if ctx.encoding.startswith('utf-16'):
-        convfile = get_convfile_path(abspath)
-        logging.debug('need conversion. check convfile {}'.format(convfile))
-        if not os.path.isfile(convfile):
-            logging.debug('convfile not exist. make one')
-            convert_data_file(abspath, ctx.encoding, convfile)
-            converted.append(abspath)
-        else:
-            logging.debug('convfile exist.')
-        abspath = convfile
+        abspath = get_convfile_path(abspath)
     return abspath
 
 
-def _load_files_root(ctx, _root, filecnt, fileno, pg):
+def _load_files_root(ctx, _root, filecnt, fileno, pg, findex):
     root = _root[0]
     fields = ctx.fields.values()
     fieldcnt = len(fields)
     field_getter = [field._value_fn for field in fields]
-    converted = []
+    field_map = dict([(field._clsname, field) for field in fields])
     errs = []
     for filename in _root[1]:
         if FORWARDER_LOG_PREFIX in filename:
@@ -1051,15 +1725,21 @@ def _load_files_root(ctx, _root, filecnt, fileno, pg):
         if 'progress_cb' in ctx.dict:
             ctx.dict['progress_cb'](pg.prev_pct)
         abspath = os.path.join(root, filename)
-        abspath = _load_files_root_check_conv(ctx, abspath, converted)
+        abspath = _load_files_root_check_conv(ctx, abspath)
         fileo = FileValue(ctx, abspath)
 
-        vals, field_errs = _load_files_root_vals(fieldcnt, fields, fileo,
-                                                 field_getter)
-        # remove incompatible files
-        if len(field_errs) > 0:
-            errs += field_errs
-            continue
+        stamp = vals = None
+        if findex is not None:
+            stamp, vals = findex.lookup(abspath, field_map)
+        if vals is None:
+            vals, field_errs = _load_files_root_vals(fieldcnt, fields, fileo,
+                                                     field_getter)
+            # remove incompatible files
+            if len(field_errs) > 0:
+                errs += field_errs
+                continue
+            if findex is not None:
+                findex.add(abspath, stamp, vals)
 
         try:
             fileo._set_props(vals)
@@ -1068,9 +1748,6 @@ def _load_files_root(ctx, _root, filecnt, fileno, pg):
         else:
             ctx.files.append(fileo)
             fileno += 1
-    if ctx.encoding.startswith('utf-16'):
-        if len(converted) > 0:
-            nprint("%d files have been converted." % len(converted))
     return fileno, errs
 
 
@@ -1080,17 +1757,34 @@ def _load_files_info(ctx, prog_cb):
     rv, msg = load_files_precalc(ctx, root_list)
     root_list, filecnt = rv
 
+    cfg = make_config()
+    use_index = cfg['use_file_index'] if 'use_file_index' in cfg else True
+    findex = None
+    if use_index:
+        # values by old adapter source are not reused
+        ahash = adapter_hash(ctx.mod)
+        if ahash is not None:
+            findex = FileIndex(ctx.file_type, ahash)
+
+    _load_files_convert(ctx, [os.path.join(_root[0], filename) for _root in
+                              root_list for filename in _root[1] if
+                              FORWARDER_LOG_PREFIX not in filename])
+
     fileno = 0
     pg = ProgressBar('collecting file info', filecnt, prog_cb)
     errors = []
     for _root in root_list:
-        fileno, errs = _load_files_root(ctx, _root, filecnt, fileno, pg)
+        fileno, errs = _load_files_root(ctx, _root, filecnt, fileno, pg,
+                                        findex)
         if len(errs) > 0:
             errors += errs
     pg.done()
+    if findex is not None:
+        findex.save()
 
     for _, fobj in ctx.fields.iteritems():
         fobj._file_filter()
+    build_postings(ctx)
 
     if msg is not None:
         nprint(msg)
@@ -1208,10 +1902,6 @@ def _find_in_temp_grep(ctx, result_file, tempo, word, _options,
 
 
 def _find_in_temp_grep_write(result_file, tempo, tmp_file):
-    nodes = []
-    kinds = []
-    dates = []
-    files = []
     linenos = []
 
     # collect line numbers and write line
@@ -1227,48 +1917,37 @@ def _find_in_temp_grep_write(result_file, tempo, tmp_file):
                 linenos.append(lineno)
                 out.write(linebody)
 
-    lineno_gen = (lineno for lineno in linenos)
-    impl_gen = (impl for impl in tempo._linfos.impls)
-    try:
-        lineno = lineno_gen.next()
-        impl = impl_gen.next()
-    except StopIteration:
-        pass
-    else:
-        off = 0
-        # find line infos
-        while True:
-            try:
-                if impl.count > lineno:
-                    node, kind, date, _file = impl[lineno]
-                    nodes.append(node)
-                    kinds.append(kind)
-                    dates.append(date)
-                    files.append(_file)
-                    lineno = lineno_gen.next() - off
-                else:
-                    off += impl.count
-                    lineno -= impl.count
-                    impl = impl_gen.next()
-            except StopIteration:
-                break
-    return LineInfo(LineInfoImpl_Array(nodes, kinds, dates, files))
+    return LineInfo(_take_line_infos(tempo._linfos.impls, linenos))
 
 
-def _find_in_fileo_grep_call(ctx, word, idx, _file, fileno, _options, out,
-                             print_prog):
-    if print_prog:
-        ctx.pg.animate(idx)
+def _take_line_infos(impls, linenos):
+    """Return line info impls for given ascending line numbers.
 
-    word = set_grep_encoding(ctx, word)
-
-    options = ['-h']
-    if _options is not None:
-        options += _options.split()
-    cmd = [get_grep(word)] + options + [word, _file.abspath]
-    check_call(cmd, stdout=out)
+    Consecutive lines from a count impl become one count impl, others are
+    taken from the array impl.
 
-    unset_grep_encoding(ctx, word)
+    """
+    if len(linenos) == 0 or len(impls) == 0:
+        return []
+    linenos = np.asarray(linenos, dtype=np.int64)
+    ends = np.cumsum([impl.count for impl in impls])
+    linenos = linenos[linenos < ends[-1]]
+    at = np.searchsorted(ends, linenos, side='right')
+    rv = []
+    # boundaries of runs in the same impl
+    bounds = np.flatnonzero(np.diff(at)) + 1
+    for run in np.split(np.arange(len(at)), bounds):
+        if len(run) == 0:
+            continue
+        iat = at[run[0]]
+        impl = impls[iat]
+        if isinstance(impl, LineInfoImpl_Count):
+            rv.append(LineInfoImpl_Count(impl.node, impl.kind, impl.date,
+                                         impl._file, len(run)))
+        else:
+            start = ends[iat] - impl.count
+            rv.append(impl.take(linenos[run] - start))
+    return rv
 
 
 def _remove_old():
@@ -1279,6 +1958,56 @@ def _remove_old():
     remove_old_tmps(tmp_dir, NAMED_TMP_PREFIX, cfg["named_tmp_valid_hour"])
 
 
+def _get_file_encoding(file_type):
+    cfg = make_config()
+    encoding = cfg["data_encoding"]
+    if isinstance(encoding, dict):
+        encoding = encoding[file_type] if file_type in encoding else ''
+    return encoding
+
+
+def load_file_values(mod, file_type, abspaths):
+    """Return file values only for given paths.
+
+    Adapter callbacks are called for the given paths only, without collecting
+    all files as `load_info` does.
+
+    Parameters
+    ----------
+    mod : dict
+        Adapter namespace. Pass a copy, because context writes into it.
+    file_type : string
+        File type of the adapter.
+    abspaths : list
+        Absolute paths to data files.
+
+    """
+    encoding = _get_file_encoding(file_type)
+    _dir = get_conv_dir() if encoding.startswith('utf-16') else\
+        get_data_dir()
+    ctx = Context(mod, _dir, encoding, file_type)
+    DateField(ctx)
+    KindField(ctx)
+    NodeField(ctx)
+    fields = ctx.fields.values()
+    field_getter = [field._value_fn for field in fields]
+    _load_files_convert(ctx, abspaths)
+    rv = []
+    for abspath in abspaths:
+        abspath = _load_files_root_check_conv(ctx, abspath)
+        fileo = FileValue(ctx, abspath)
+        vals, field_errs = _load_files_root_vals(len(fields), fields, fileo,
+                                                 field_getter)
+        if len(field_errs) > 0:
+            continue
+        try:
+            fileo._set_props(vals)
+        except InvalidProp:
+            continue
+        rv.append(fileo)
+    return rv
+
+
 def load_info(mod, file_type, prog_fn=None):
     """Load file information.
 
@@ -1289,9 +2018,7 @@ def load_info(mod, file_type, prog_fn=None):
 
     cfg = make_config()
     _dir = cfg['data_dir']
-    encoding = cfg["data_encoding"]
-    if isinstance(encoding, dict):
-        encoding = encoding[file_type] if file_type in encoding else ''
+    encoding = _get_file_encoding(file_type)
 
     if encoding.startswith('utf-16'):
         _dir = get_conv_dir()
@@ -1323,8 +2050,8 @@ class FileField(Field):
         super(FileField, self).__init__(ctx)
 
     def _match(self, oval, fileo):
-        node = str(oval.node) == str(fileo.node)
-        kind = str(oval.kind) == str(fileo.kind)
+        node = _same_value(oval.node, fileo.node)
+        kind = _same_value(oval.kind, fileo.kind)
         date = oval.date._match(fileo)
         val = node and kind and date
         return val
@@ -1337,6 +2064,11 @@ class FileField(Field):
         self.__dict__.update(state)
 
 
+def _same_value(val1, val2):
+    # interned values of a context are the same object
+    return val1 is val2 or str(val1) == str(val2)
+
+
 class FileValue(SingleFile):
 
     """File value."""
@@ -1366,6 +2098,20 @@ class FileValue(SingleFile):
         if get_cols is not None:
             return get_cols(self._abspath)
 
+    def _to_frame(self, usecols, chunk_cnt, show_prog, words=None):
+        if words is not None:
+            return super(FileValue, self)._to_frame(usecols, chunk_cnt,
+                                                    show_prog, words)
+        key = frame_cache_key(self, usecols)
+        if key is not None:
+            df = load_frame(key)
+            if df is not None:
+                return df
+        df = super(FileValue, self)._to_frame(usecols, chunk_cnt, show_prog)
+        if key is not None:
+            save_frame(key, df)
+        return df
+
     def _set_props(self, vals):
         for val in vals:
             if val:
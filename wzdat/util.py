@@ -23,7 +23,9 @@ from crontab import CronTab
 import psutil
 
 from wzdat.make_config import make_config
-from wzdat.const import NAMED_TMP_PREFIX, HDF_FILE_PREFIX, HDF_FILE_EXT
+from wzdat.compress import open_data, is_compressed
+from wzdat.const import TMP_PREFIX, NAMED_TMP_PREFIX, HDF_FILE_PREFIX,\
+    HDF_FILE_EXT, CONV_CHUNK_SIZE
 
 
 LOG_KINDS = ('game', 'auth', 'community')
@@ -66,11 +68,19 @@ def sizeof_fmt(num):
 
 
 def unique_list(l):
-    """Return unique list form list."""
+    """Return unique list form list, keeping the order."""
     r = []
+    seen = set()
     for i in l:
-        if i not in r:
-            r.append(i)
+        try:
+            if i in seen:
+                continue
+            seen.add(i)
+        except (TypeError, NotImplementedError):
+            # unhashable
+            if i in r:
+                continue
+        r.append(i)
     return r
 
 
@@ -154,9 +164,184 @@ def get_kernel_id(cfile):
     return cfile.split('/')[-1][7:-5]
 
 
+LINE_COUNT_BUF_SIZE = 16 * 1024 * 1024
+
+# memo of line counts by real path: (size, mtime, count)
+_line_counts = None
+# counts not saved yet, written at once by save_line_counts
+_line_counts_dirty = {}
+
+
+def _count_newlines(path):
+    cnt = 0
+    with open_data(path) as f:
+        while True:
+            buf = f.read(LINE_COUNT_BUF_SIZE)
+            if not buf:
+                break
+            cnt += buf.count('\n')
+    return cnt
+
+
+def ends_with_newline(path):
+    """Return True if a file is empty or ends with newline."""
+    last = '\n'
+    if is_compressed(path):
+        with open_data(path) as f:
+            while True:
+                buf = f.read(LINE_COUNT_BUF_SIZE)
+                if not buf:
+                    break
+                last = buf[-1]
+        return last == '\n'
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+    return last == '\n'
+
+
+def _get_line_counts_path():
+    return os.path.join(get_index_dir(), 'line_counts.pkl')
+
+
+def _read_line_counts():
+    path = _get_line_counts_path()
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            return cPickle.load(f)
+    except (EOFError, ValueError, cPickle.UnpicklingError), e:
+        logging.warning(u"ignore broken line counts: {}".format(e))
+        return {}
+
+
+def _get_line_counts():
+    global _line_counts
+    if _line_counts is None:
+        _line_counts = _read_line_counts()
+    return _line_counts
+
+
+def save_line_counts():
+    """Merge newly counted lines into line count memo file."""
+    global _line_counts, _line_counts_dirty
+    if len(_line_counts_dirty) == 0:
+        return
+    # other processes could have saved meanwhile
+    counts = _read_line_counts()
+    counts.update(_line_counts_dirty)
+    _write_line_counts(counts)
+    _line_counts = counts
+    _line_counts_dirty = {}
+
+
+def prune_line_counts():
+    """Remove line counts of removed files from memo file, saving newly
+    counted ones together.
+
+    Checks every memoized file, so it's done by full rescan only.
+
+    """
+    global _line_counts, _line_counts_dirty
+    counts = _read_line_counts()
+    for path in counts.keys():
+        if not os.path.isfile(path):
+            del counts[path]
+    counts.update(_line_counts_dirty)
+    _write_line_counts(counts)
+    _line_counts = counts
+    _line_counts_dirty = {}
+
+
+def _write_line_counts(counts):
+    path = _get_line_counts_path()
+    tmp_path = path + '.tmp%d' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        cPickle.dump(counts, f, 2)
+    os.rename(tmp_path, path)
+
+
+def _lookup_line_count(path):
+    """Return stamp and memoized line count of real path, or None."""
+    st = os.stat(path)
+    stamp = st.st_size, st.st_mtime
+    memo = _get_line_counts().get(path)
+    if memo is not None and memo[:2] == stamp:
+        return stamp, memo[2]
+    return stamp, None
+
+
+def _memo_line_count(path, stamp, cnt):
+    # unique temp files are not counted again
+    if os.path.basename(path).startswith(TMP_PREFIX):
+        return
+    _get_line_counts()[path] = stamp + (cnt,)
+    # temp files are not worth to keep
+    if not path.startswith(get_tmp_dir()):
+        _line_counts_dirty[path] = stamp + (cnt,)
+
+
 def get_line_count(path):
+    """Return line count of a file, same as 'wc -l'.
+
+    Counts are memoized by real path, size and modified time. New count is
+    saved later with others, by `get_line_counts` or `cache_files`.
+
+    """
     path = get_realpath(path)
-    return int(os.popen('wc -l "%s"' % path).read().split()[0])
+    stamp, cnt = _lookup_line_count(path)
+    if cnt is not None:
+        return cnt
+    cnt = _count_newlines(path)
+    _memo_line_count(path, stamp, cnt)
+    return cnt
+
+
+def get_line_counts(paths, workers=None):
+    """Return line counts of files, counting not memoized ones in parallel.
+
+    Parameters
+    ----------
+    paths : list
+        Paths to files.
+    workers : int
+        Number of counting threads. Default is cpu count.
+
+    Returns
+    -------
+    list
+        Line count of each path.
+
+    """
+    from multiprocessing.pool import ThreadPool
+    from multiprocessing import cpu_count
+
+    rpaths = [get_realpath(path) for path in paths]
+    counts = {}
+    stamps = {}
+    for rpath in rpaths:
+        stamp, cnt = _lookup_line_count(rpath)
+        if cnt is not None:
+            counts[rpath] = cnt
+        else:
+            stamps[rpath] = stamp
+
+    if len(stamps) > 0:
+        targets = stamps.keys()
+        pool = ThreadPool(workers if workers is not None else cpu_count())
+        try:
+            cnts = pool.map(_count_newlines, targets)
+        finally:
+            pool.close()
+            pool.join()
+        for rpath, cnt in zip(targets, cnts):
+            _memo_line_count(rpath, stamps[rpath], cnt)
+            counts[rpath] = cnt
+    save_line_counts()
+    return [counts[rpath] for rpath in rpaths]
 
 
 def normalize_idx(idx, cnt):
@@ -166,8 +351,8 @@ def normalize_idx(idx, cnt):
 
 
 def get_slice_idx(slc, cnt):
-    idx1 = normalize_idx(slc.start, cnt)
-    idx2 = normalize_idx(slc.stop, cnt)
+    idx1 = normalize_idx(slc.start if slc.start is not None else 0, cnt)
+    idx2 = normalize_idx(slc.stop if slc.stop is not None else cnt, cnt)
     return idx1, idx2
 
 
@@ -199,15 +384,25 @@ class HDF(object):
     def __init__(self, username):
         self.username = username
         self.store = None
+        self._lockf = None
 
     def __enter__(self):
+        import fcntl
         from pandas import HDFStore
-        self.store = HDFStore(hdf_path(self.username))
+        path = hdf_path(self.username)
+        # HDF5 file can't be opened by notebooks running concurrently, wait
+        # for the others
+        self._lockf = open(path + '.lock', 'a')
+        fcntl.flock(self._lockf, fcntl.LOCK_EX)
+        self.store = HDFStore(path)
         return self
 
     def __exit__(self, _type, value, tb):
         if self.store is not None:
             self.store.close()
+        if self._lockf is not None:
+            # closing releases lock
+            self._lockf.close()
 
 
 def get_wzdat_dir():
@@ -507,6 +702,16 @@ def get_hdf_dir(make=True):
     return _get_dir(get_var_dir(), 'hdf', make)
 
 
+def files_checksum(sizes):
+    """Return rough hash of files by list of (absolute path, size)."""
+    stats = []
+    data_dir = get_data_dir()
+    for abspath, size in sizes:
+        stats.append(abspath.replace(data_dir, ''))
+        stats.append(size)
+    return hash(tuple(stats))
+
+
 def get_conv_dir(make=True):
     return _get_dir(get_var_dir(), 'conv', make)
 
@@ -515,6 +720,18 @@ def get_cache_dir(make=True):
     return _get_dir(get_var_dir(), 'cache', make)
 
 
+def get_index_dir(make=True):
+    return _get_dir(get_var_dir(), 'index', make)
+
+
+def get_frame_cache_dir(make=True):
+    return _get_dir(get_cache_dir(make), 'frame', make)
+
+
+def get_line_index_dir(make=True):
+    return _get_dir(get_cache_dir(make), 'lineidx', make)
+
+
 def cap_call(cmd, _test=False):
     out = TemporaryFile()
     err = TemporaryFile()
@@ -548,18 +765,45 @@ def get_convfile_path(path):
     return os.path.join(conv_dir, relpath)
 
 
+def _bom_encoding(encoding, head):
+    """Return encoding to decode data starting with head, as iconv does.
+
+    BOM decides byte order of 'utf-16', big endian without it. Python codec
+    assumes native byte order instead.
+
+    """
+    if encoding == 'utf-16' and not head.startswith(codecs.BOM_UTF16_LE) and\
+            not head.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16-be'
+    return encoding
+
+
 def convert_data_file(srcpath, encoding, dstpath):
+    """Convert data file into UTF-8 by streaming, without iconv."""
     encoding = encoding.replace('-le', '')
     _dir = os.path.dirname(dstpath)
     if not os.path.exists(_dir):
         os.makedirs(_dir)
-    cmd = ['iconv', '-f', encoding, '-t', 'utf-8', '-o', dstpath, srcpath]
-    check_call(cmd)
-    # if iconv failed
-    if not os.path.isfile(dstpath):
+    tmp_path = dstpath + '.tmp%d' % os.getpid()
+    try:
+        with open(srcpath, 'rb') as src:
+            data = src.read(CONV_CHUNK_SIZE)
+            decoder = codecs.getincrementaldecoder(
+                _bom_encoding(encoding, data))('replace')
+            with open(tmp_path, 'wb') as dst:
+                while True:
+                    final = len(data) == 0
+                    dst.write(decoder.decode(data, final).encode('utf-8'))
+                    if final:
+                        break
+                    data = src.read(CONV_CHUNK_SIZE)
+        os.rename(tmp_path, dstpath)
+    except (IOError, OSError), e:
         # log it, then touch
-        logging.error('convert_data_file failed: from {} to {}'
-                      .format(srcpath, dstpath))
+        logging.error('convert_data_file failed: from {} to {} - {}'
+                      .format(srcpath, dstpath, e))
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
         touch(dstpath)
     return dstpath
 
@@ -758,42 +1002,38 @@ def get_cache_path(fmt):
     return os.path.join(cache_dir, '%s_found_files.pkl' % (fmt))
 
 
-def _filter_files(adir, filenames, filecnt, file_type, ffilter):
-    """
-    Filter files by file type(filter function) then returns matching
-    files and cumulated count.
-    """
-    rfiles = ffilter(adir, filenames)
-    filecnt += len(rfiles)
-    return rfiles, filecnt
-
-
 def find_files_and_save(startdir, file_type, use_cache, ffilter=None,
                         root_list=None):
     logging.debug('find_files_and_save')
     logging.debug('startdir: ' + str(startdir))
     if root_list is None:
         root_list = []
+    from wzdat.scan import scan_files
     nprint('finding files and save info...')
-    filecnt = 0
-    assert os.path.isdir(startdir)
-    for root, dirs, filenames in os.walk(startdir):
-        dirs[:] = [d for d in dirs if not d.startswith('_')]
-        _root = [os.path.abspath(root), []]
-        root_list.append(_root)
-        if len(filenames) > 0:
-            rfiles, filecnt = _filter_files(root, filenames, filecnt,
-                                            file_type, ffilter)
-            rfiles = sorted(rfiles)
-            _root[1] = rfiles
+    found, filecnt = scan_files(startdir, {file_type: ffilter})[file_type]
+    root_list += found
     rv = sorted(root_list), filecnt
     if use_cache:
-        cpath = get_cache_path(file_type)
-        with open(cpath, 'w') as f:
-            cPickle.dump(rv, f)
+        save_files_cache(file_type, rv)
     return rv
 
 
+def save_files_cache(file_type, rv):
+    """Save found files info (root list & file count) of file type."""
+    cpath = get_cache_path(file_type)
+    with open(cpath, 'w') as f:
+        cPickle.dump(rv, f)
+
+
+def load_files_cache(file_type):
+    """Return cached found files info of file type, or None if not exist."""
+    cpath = get_cache_path(file_type)
+    if not os.path.isfile(cpath):
+        return None
+    with open(cpath, 'r') as f:
+        return cPickle.load(f)
+
+
 def _get_found_time(cpath):
     s = int(time.time() - os.path.getmtime(cpath))
     m, s = divmod(s, 60)
@@ -811,10 +1051,9 @@ def load_files_precalc(ctx, root_list):
     if use_cache and os.path.isfile(cpath):
         tstr = _get_found_time(cpath)
         msg = '\nusing file infos found %s ago.' % tstr
-        with open(cpath, 'r') as f:
-            root_list, filecnt = cPickle.load(f)
-            if filecnt > 0:
-                return (root_list, filecnt), msg
+        root_list, filecnt = load_files_cache(ctx.file_type)
+        if filecnt > 0:
+            return (root_list, filecnt), msg
     return find_files_and_save(ctx.startdir, ctx.file_type, use_cache,
                                ctx.ffilter, root_list), None
 
@@ -822,6 +1061,7 @@ def load_files_precalc(ctx, root_list):
 def cache_files():
     import imp
     from rundb import update_cache_info
+    from wzdat.scan import scan_files
     logging.debug('cache_files')
     cfg = make_config()
     with ChangeDir(cfg['sol_dir']):
@@ -834,17 +1074,21 @@ def cache_files():
         pkg = cfg['sol_pkg']
         prj = cfg['prj']
         print "Caching files for: %s" % prj
-        ftypes = cfg['file_types']
-        for ftype in ftypes:
+        ffilters = {}
+        for ftype in cfg['file_types']:
             mpath = '%s/%s/%s.py' % (pkg, prj, ftype)
             mod = imp.load_source('%s' % ftype,  mpath)
-            ffilter = mod.file_filter
-            find_files_and_save(data_dir, ftype, True, ffilter, [])
+            ffilters[ftype] = mod.file_filter
+        # one walk for all file types
+        for ftype, (root_list, filecnt) in scan_files(data_dir,
+                                                      ffilters).iteritems():
+            save_files_cache(ftype, (sorted(root_list), filecnt))
+        prune_line_counts()
         update_cache_info()
         cfg['use_cache'] = old_use_cache
 
 
-def cache_finder():
+def cache_finder(ftypes=None):
     import imp
     from wzdat.rundb import update_finder_info
     # Make cache for file finder.
@@ -858,7 +1102,8 @@ def cache_finder():
         if ret is None or len(ret) == 0:
             pkg = cfg['sol_pkg']
             prj = cfg['prj']
-            ftypes = cfg["file_types"]
+            if ftypes is None:
+                ftypes = cfg["file_types"]
             sol_dir = cfg['sol_dir']
             os.chdir(sol_dir)
             ret = []
@@ -999,25 +1244,43 @@ def iter_notebook_manifest(nbdir, check_depends, skip_nbs=None):
         yield npath, manifest
 
 
+# manifest inputs by manifest path, with manifest file stamp
+_minp_cache = {}
+
+
+def _read_manifest_input(mpath):
+    """Return evaluated input of manifest, or None if invalid."""
+    import copy
+    st = os.stat(mpath)
+    stamp = st.st_size, st.st_mtime
+    entry = _minp_cache.get(mpath)
+    if entry is not None and entry[0] == stamp:
+        return copy.deepcopy(entry[1])
+    logging.debug(u"read {}".format(mpath))
+    minp = None
+    with open(mpath, 'r') as f:
+        data = json.loads(f.read())
+        try:
+            minp = ''.join(data['cells'][0]['source'])
+        except (KeyError, IndexError):
+            logging.error(u"Error in Notebooks: {}".format(unicode(mpath)))
+        else:
+            try:
+                minp = eval(minp)
+            except SyntaxError:
+                minp = None
+    _minp_cache[mpath] = stamp, minp
+    return copy.deepcopy(minp)
+
+
 def iter_notebook_manifest_input(nbdir):
-    import json
     logging.debug('iter_notebook_manifest_input')
     for npath in iter_notebooks(nbdir):
         mpath = get_notebook_manifest_path(npath)
         if not os.path.isfile(mpath):
             continue
-        logging.debug(u"read {}".format(mpath))
-        with open(mpath, 'r') as f:
-            data = json.loads(f.read())
-            try:
-                minp = ''.join(data['cells'][0]['source'])
-            except (KeyError, IndexError):
-                logging.error(u"Error in Notebooks: {}".format(unicode(mpath)))
-                continue
-            try:
-                minp = eval(minp)
-            except SyntaxError:
-                continue
+        minp = _read_manifest_input(mpath)
+        if minp is not None:
             yield npath, minp
 
 
@@ -1029,6 +1292,15 @@ def iter_dashboard_notebook(nbdir):
             yield npath, mip
 
 
+def is_dashboard_notebook(nbpath):
+    """Return whether the notebook is shown in dashboard."""
+    mpath = get_notebook_manifest_path(nbpath)
+    if not os.path.isfile(mpath):
+        return False
+    minp = _read_manifest_input(mpath)
+    return minp is not None and 'dashboard' in minp
+
+
 def find_hdf_notebook_path(_owner, _sname):
     '''return path of hdf source notebook by examining manifest.'''
     nbdir = get_notebook_dir()
@@ -1047,14 +1319,21 @@ def iter_scheduled_notebook(nbdir):
             yield nbpath, schedule
 
 
-def register_cron_notebooks():
+def register_cron_notebooks(prev=None):
+    """Register scheduled notebooks to crontab, and return them.
+
+    Crontab is not rewritten if they are same as `prev`, which is returned
+    by previous call.
+
+    """
     nb_dir = get_notebook_dir()
     nbpaths = []
     schedules = []
     for path, scd in iter_scheduled_notebook(nb_dir):
         nbpaths.append(path)
         schedules.append(scd)
-    _register_crons(nbpaths, schedules)
+    if prev != (nbpaths, schedules):
+        _register_crons(nbpaths, schedules)
     return nbpaths, schedules
 
 
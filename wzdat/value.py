@@ -2,7 +2,9 @@
 """Values."""
 
 import types
-from datetime import datetime
+from datetime import datetime, date
+from bisect import bisect_left
+from itertools import count
 
 from wzdat.const import PRINT_LMAX
 from wzdat.base import Representable, Listable, IEquatable, IFilterable,\
@@ -11,9 +13,17 @@ from wzdat.base import Representable, Listable, IEquatable, IFilterable,\
 
 class Value(Representable, IEquatable):
 
-    """Value object."""
+    """Value object.
+
+    Values made by `_instance` are interned, so that equal values are the
+    same object with an int id(`_id`) of this process. Interned values are
+    compared and hashed by the id, others by field and part. Hash is
+    calculated once.
+
+    """
 
     _instances = {}
+    _ids = count()
 
     @classmethod
     def _instance(cls, supobj, field, abbr, part, _repr):
@@ -27,6 +37,7 @@ class Value(Representable, IEquatable):
             obj = cls._instances[key]
         else:
             obj = cls(supobj, field, abbr, part, _repr)
+            obj._intern()
             cls._instances[key] = obj
             if supobj is not None:
                 supobj._values.add(obj)
@@ -43,13 +54,32 @@ class Value(Representable, IEquatable):
         self._repr = _repr
         self._values = set()
         self._neg = False
+        self._hash = self._calc_hash()
 
-    def __hash__(self):
-        if not hasattr(self, '_field'):
-            return hash('na_val')
+    def _intern(self):
+        self._id = next(Value._ids)
+        self._hash = self._calc_hash()
+
+    def _calc_hash(self):
+        if '_id' in self.__dict__:
+            return hash(self._id)
         return hash((self._field, self._abbr))
 
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            # not yet unpickled
+            if not hasattr(self, '_field'):
+                return hash('na_val')
+            return self._calc_hash()
+
     def __eq__(self, o):
+        if self is o:
+            return True
+        _id = getattr(o, '_id', None)
+        if _id is not None and '_id' in self.__dict__:
+            return self._id == _id
         return self._field == o._field and self._part == o._part
 
     def __unicode__(self):
@@ -69,10 +99,14 @@ class Value(Representable, IEquatable):
 
     def __getstate__(self):
         s = self.__dict__.copy()
+        # hash and id are of this process
+        s.pop('_hash', None)
+        s.pop('_id', None)
         return s
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        self._hash = self._calc_hash()
 
 
 class FailValue(Value):
@@ -85,13 +119,6 @@ class FailValue(Value):
     def _match(self, fileo):
         return False
 
-    def __getstate__(self):
-        s = self.__dict__.copy()
-        return s
-
-    def __setstate__(self, state):
-        self.__dict__.update(state)
-
 
 class ValueList(Representable, Listable, IEquatable, IFilterable,
                 IGroupable):
@@ -167,56 +194,97 @@ class DateValue(Value):
             obj = cls._instances[key]
         else:
             obj = cls(field, year, month, day)
+            obj._intern()
             cls._instances[key] = obj
             field._values.add(obj)
         return obj
 
     def __init__(self, field, year, month, day):
+        self.year, self.month, self.day = year, month, day
+        self._ordinal = date(year, month, day).toordinal()
         abbr = self._repr = 'D%04d_%02d_%02d' % (year, month, day)
         super(DateValue, self).__init__(None, field, abbr, None, abbr)
-        self.year, self.month, self.day = year, month, day
         self._sdate = "%04d-%02d-%02d" % (year, month, day)
 
+    @property
+    def ordinal(self):
+        """Return proleptic Gregorian ordinal of the date."""
+        if '_ordinal' not in self.__dict__:
+            self._ordinal = date(self.year, self.month, self.day).toordinal()
+        return self._ordinal
+
     def _match(self, fileo):
         fdate = fileo.date
+        if isinstance(fdate, DateValue):
+            return self is fdate or self.ordinal == fdate.ordinal
         return self.year == fdate.year and self.month == fdate.month and\
             self.day == fdate.day
 
-    def __hash__(self):
-        if not hasattr(self, 'year'):
-            return hash('na_date')
+    def _calc_hash(self):
+        # same as datetime of the date
         return datetime(self.year, self.month, self.day).__hash__()
 
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            if not hasattr(self, 'year'):
+                return hash('na_date')
+            return self._calc_hash()
+
     def __eq__(self, o):
+        if self is o:
+            return True
+        if isinstance(o, DateValue):
+            return self.ordinal == o.ordinal
         return self.day == o.day and self.month == o.month \
             and self.year == o.year
 
-    def __getstate__(self):
-        s = self.__dict__.copy()
-        return s
-
-    def __setstate__(self, state):
-        self.__dict__.update(state)
-
     @property
     def datestr(self):
         return "%d-%d-%d" % (self.year, self.month, self.day)
 
 
-def check_date_slice(dates, dslice):
+def date_ordinal(_date):
+    """Return ordinal of date value, date or datetime."""
+    if isinstance(_date, DateValue):
+        return _date.ordinal
+    return _date.toordinal()
+
+
+def is_date_bound(bound):
+    return isinstance(bound, DateValue) or isinstance(bound, date)
+
+
+def check_date_slice(dates, dslice, ordinals=None):
+    """Return index slice of sorted dates for date bounded slice.
+
+    Bounds are found by binary search, and need not be in the dates. Stop
+    date is exclusive.
+
+    Parameters
+    ----------
+    dates : list
+        Sorted date values.
+    dslice : slice
+        Slice which bounds could be date values or dates.
+    ordinals : list
+        Ordinals of the dates, if already known.
+
+    """
     start = dslice.start
     stop = dslice.stop
     step = dslice.step
 
-    def _find_date_value_idx(_dates, date):
-        for _idx, _date in enumerate(_dates):
-            if _date == date:
-                return _idx
+    if not is_date_bound(start) and not is_date_bound(stop):
+        return dslice
+    if ordinals is None:
+        ordinals = [_date.ordinal for _date in dates]
 
-    if isinstance(start, DateValue):
-        start = _find_date_value_idx(dates, start)
+    if is_date_bound(start):
+        start = bisect_left(ordinals, date_ordinal(start))
 
-    if isinstance(stop, DateValue):
-        stop = _find_date_value_idx(dates, stop)
+    if is_date_bound(stop):
+        stop = bisect_left(ordinals, date_ordinal(stop))
 
     return slice(start, stop, step)